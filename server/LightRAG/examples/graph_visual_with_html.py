@@ -1,9 +1,10 @@
 import networkx as nx
 from pyvis.network import Network
 import random
+from lightrag.storage import NetworkXStorage
 
-# Load the GraphML file
-G = nx.read_graphml("./dickens/graph_chunk_entity_relation.graphml")
+# Load the GraphML file, exported from the binary graph snapshot
+G = nx.read_graphml(NetworkXStorage.export_graphml("./dickens"))
 
 # Create a Pyvis network
 net = Network(height="100vh", notebook=True)
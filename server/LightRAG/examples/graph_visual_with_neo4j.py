@@ -1,5 +1,6 @@
 import os
 import json
+from lightrag.storage import NetworkXStorage
 from lightrag.utils import xml_to_json
 from neo4j import GraphDatabase
 
@@ -40,7 +41,9 @@ def process_in_batches(tx, query, data, batch_size):
 
 def main():
     # Paths
-    xml_file = os.path.join(WORKING_DIR, "graph_chunk_entity_relation.graphml")
+    xml_file = NetworkXStorage.export_graphml(WORKING_DIR) or os.path.join(
+        WORKING_DIR, "graph_chunk_entity_relation.graphml"
+    )
     json_file = os.path.join(WORKING_DIR, "graph_data.json")
 
     # Convert XML to JSON
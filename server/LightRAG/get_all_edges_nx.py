@@ -1,6 +1,7 @@
 import networkx as nx
+from lightrag.storage import NetworkXStorage
 
-G = nx.read_graphml("./dickensTestEmbedcall/graph_chunk_entity_relation.graphml")
+G = nx.read_graphml(NetworkXStorage.export_graphml("./dickensTestEmbedcall"))
 
 
 def get_all_edges_and_nodes(G):
@@ -0,0 +1,180 @@
+import os
+from typing import Union
+
+import numpy as np
+
+from .utils import logger
+
+
+class IVFFlatIndex:
+    """Inverted-file (IVF-flat) approximate nearest-neighbour index in NumPy.
+
+    Rows of a normalized vector matrix are clustered around ``n_lists`` unit
+    centroids with spherical k-means. A query only scores the rows filed under
+    its ``n_probe`` closest centroids, so ``n_probe`` trades recall for latency:
+    ``n_probe == n_lists`` is an exact search.
+
+    The index stores row numbers, never vectors, so it can sit next to any
+    matrix (including a memory map) and is updated incrementally with ``add``
+    and ``remove`` as rows change. ``position`` is saved along with it, for
+    callers to record which state of the matrix the index reflects.
+    """
+
+    def __init__(
+        self,
+        n_probe: int = 8,
+        n_lists: Union[int, None] = None,
+        kmeans_iters: int = 10,
+        retrain_growth: float = 4.0,
+        seed: int = 0,
+    ):
+        self.n_probe = n_probe
+        self.n_lists = n_lists
+        self.kmeans_iters = kmeans_iters
+        self.retrain_growth = retrain_growth
+        self._rng = np.random.default_rng(seed)
+        self.centroids: Union[np.ndarray, None] = None
+        # centroid of every row, -1 for rows not in the index
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_rows = 0
+        self.position: Union[tuple[int, ...], None] = None
+        self._list_offsets = None
+        self._list_rows = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self):
+        return int((self.assignments >= 0).sum())
+
+    def needs_retrain(self) -> bool:
+        return self.is_trained and len(self) > self.trained_rows * self.retrain_growth
+
+    def _assign(self, vectors: np.ndarray, block_size: int = 4096) -> np.ndarray:
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start : start + block_size], dtype=np.float32)
+            assign[start : start + block_size] = np.argmax(
+                block @ self.centroids.T, axis=1
+            )
+        return assign
+
+    def train(self, matrix: np.ndarray, rows: np.ndarray):
+        """Fit centroids on ``matrix[rows]`` and (re)file all of those rows"""
+        rows = np.asarray(rows)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(rows))))
+        n_lists = min(n_lists, len(rows))
+        sample = rows
+        max_sample = 64 * n_lists
+        if len(sample) > max_sample:
+            sample = self._rng.choice(rows, max_sample, replace=False)
+        vectors = np.asarray(matrix[np.sort(sample)], dtype=np.float32)
+
+        centroids = vectors[self._rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(self.kmeans_iters):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=n_lists)
+            # keep the previous centroid for lists that lost all their rows
+            sums[counts == 0] = centroids[counts == 0]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1, norms)
+        self.centroids = centroids.astype(np.float32)
+
+        self.assignments = np.full(
+            max(len(self.assignments), int(rows.max()) + 1), -1, dtype=np.int32
+        )
+        self.assignments[rows] = self._assign(matrix[rows])
+        self.trained_rows = len(rows)
+        self._list_offsets = None
+        logger.info(f"Trained IVF index with {n_lists} lists on {len(rows)} rows")
+
+    def add(self, matrix: np.ndarray, rows: np.ndarray):
+        """File new or updated rows under their closest centroid"""
+        rows = np.asarray(rows)
+        if not len(rows):
+            return
+        if rows.max() >= len(self.assignments):
+            self.assignments = np.concatenate(
+                [
+                    self.assignments,
+                    np.full(
+                        int(rows.max()) + 1 - len(self.assignments), -1, dtype=np.int32
+                    ),
+                ]
+            )
+        self.assignments[rows] = self._assign(matrix[rows])
+        self._list_offsets = None
+
+    def remove(self, rows: np.ndarray):
+        rows = np.asarray(rows)
+        rows = rows[rows < len(self.assignments)]
+        self.assignments[rows] = -1
+        self._list_offsets = None
+
+    def _lists(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._list_offsets is None:
+            indexed = np.flatnonzero(self.assignments >= 0)
+            order = np.argsort(self.assignments[indexed], kind="stable")
+            self._list_rows = indexed[order]
+            counts = np.bincount(
+                self.assignments[indexed], minlength=len(self.centroids)
+            )
+            self._list_offsets = np.concatenate([[0], np.cumsum(counts)])
+        return self._list_offsets, self._list_rows
+
+    def search(
+        self, matrix: np.ndarray, queries: np.ndarray, top_k: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Return ``(rows, scores)`` sorted by descending score for every query"""
+        offsets, list_rows = self._lists()
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), n_probe - 1, axis=1)
+        results = []
+        for query, probe in zip(queries, probes[:, :n_probe]):
+            candidates = np.concatenate(
+                [list_rows[offsets[c] : offsets[c + 1]] for c in probe]
+            )
+            if not len(candidates):
+                results.append((candidates, np.zeros(0, dtype=np.float32)))
+                continue
+            candidates.sort()
+            scores = np.asarray(matrix[candidates], dtype=np.float32) @ query
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            results.append((candidates[best], scores[best]))
+        return results
+
+    def save(self, file_name: str):
+        if not self.is_trained:
+            return
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_rows=np.array(self.trained_rows),
+                **(
+                    {"position": np.array(self.position)}
+                    if self.position is not None
+                    else {}
+                ),
+            )
+        os.replace(tmp_file_name, file_name)
+
+    def load(self, file_name: str) -> bool:
+        if not os.path.exists(file_name):
+            return False
+        with np.load(file_name) as data:
+            self.centroids = data["centroids"]
+            self.assignments = data["assignments"]
+            self.trained_rows = int(data["trained_rows"])
+            self.position = (
+                tuple(data["position"].tolist()) if "position" in data else None
+            )
+        self._list_offsets = None
+        return True
@@ -1,8 +1,10 @@
+import asyncio
 from dataclasses import dataclass, field
-from typing import TypedDict, Union, Literal, Generic, TypeVar
+from typing import ClassVar, TypedDict, Union, Literal, Generic, TypeVar
 
 import numpy as np
 
+from .csr import CSRGraph
 from .utils import EmbeddingFunc
 
 TextChunkSchema = TypedDict(
@@ -26,6 +28,8 @@ class QueryParam:
     max_token_for_global_context: int = 4000
     # Number of tokens for the entity descriptions
     max_token_for_local_context: int = 4000
+    # Return the answer as an async iterator of text chunks as it is generated
+    stream: bool = False
 
 
 @dataclass
@@ -50,16 +54,35 @@ class BaseVectorStorage(StorageNameSpace):
     async def query(self, query: str, top_k: int) -> list[dict]:
         raise NotImplementedError
 
+    async def query_many(self, queries: list[str], top_k: int) -> list[list[dict]]:
+        """Query several strings at once, returning one result list per query.
+        Backends should override this to embed all queries in a single call.
+        """
+        return list(await asyncio.gather(*[self.query(q, top_k) for q in queries]))
+
     async def upsert(self, data: dict[str, dict]):
         """Use 'content' field from value for embedding, use key as id.
         If embedding_func is None, use 'embedding' field from value
         """
         raise NotImplementedError
 
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
+    async def delete_entities(self, entity_names: list[str]):
+        """Delete the given entities and every relation that touches them.
+        Backends should override this to delete everything in one pass.
+        """
+        for entity_name in entity_names:
+            await self.delete_entity(entity_name)
+            await self.delete_relation(entity_name)
+
 
 @dataclass
 class BaseKVStorage(Generic[T], StorageNameSpace):
     embedding_func: EmbeddingFunc
+    # namespaces the backend can hold, None for any
+    supported_namespaces: ClassVar[Union[tuple[str, ...], None]] = None
 
     async def all_keys(self) -> list[str]:
         raise NotImplementedError
@@ -79,6 +102,9 @@ class BaseKVStorage(Generic[T], StorageNameSpace):
     async def upsert(self, data: dict[str, T]):
         raise NotImplementedError
 
+    async def delete(self, ids: list[str]):
+        raise NotImplementedError
+
     async def drop(self):
         raise NotImplementedError
 
@@ -112,6 +138,42 @@ class BaseGraphStorage(StorageNameSpace):
     ) -> Union[list[tuple[str, str]], None]:
         raise NotImplementedError
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        """Batch version of ``get_node``, returning one result per id.
+        Backends should override the batch methods to answer in one round-trip.
+        """
+        return list(await asyncio.gather(*[self.get_node(n) for n in node_ids]))
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return list(await asyncio.gather(*[self.node_degree(n) for n in node_ids]))
+
+    async def get_edges(
+        self, edge_pairs: list[tuple[str, str]]
+    ) -> list[Union[dict, None]]:
+        return list(await asyncio.gather(*[self.get_edge(s, t) for s, t in edge_pairs]))
+
+    async def edge_degrees(self, edge_pairs: list[tuple[str, str]]) -> list[int]:
+        return list(
+            await asyncio.gather(*[self.edge_degree(s, t) for s, t in edge_pairs])
+        )
+
+    async def get_nodes_edges(
+        self, node_ids: list[str]
+    ) -> list[Union[list[tuple[str, str]], None]]:
+        return list(await asyncio.gather(*[self.get_node_edges(n) for n in node_ids]))
+
+    async def get_by_source_ids(
+        self, chunk_ids: list[str]
+    ) -> tuple[list[str], list[tuple[str, str]]]:
+        """Nodes and edges whose ``source_id`` lists any of ``chunk_ids``"""
+        raise NotImplementedError
+
+    async def get_csr_snapshot(self) -> Union[CSRGraph, None]:
+        """Array-backed adjacency snapshot for vectorised traversal, or None
+        when the backend does not keep one
+        """
+        return None
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         raise NotImplementedError
 
@@ -120,8 +182,21 @@ class BaseGraphStorage(StorageNameSpace):
     ):
         raise NotImplementedError
 
+    async def upsert_nodes(self, nodes: dict[str, dict[str, str]]):
+        """Batch version of ``upsert_node``, taking node id -> node data"""
+        await asyncio.gather(*[self.upsert_node(k, v) for k, v in nodes.items()])
+
+    async def upsert_edges(self, edges: dict[tuple[str, str], dict[str, str]]):
+        """Batch version of ``upsert_edge``, taking (source, target) -> edge data"""
+        await asyncio.gather(
+            *[self.upsert_edge(src, tgt, v) for (src, tgt), v in edges.items()]
+        )
+
     async def delete_node(self, node_id: str):
         raise NotImplementedError
 
+    async def delete_edge(self, source_node_id: str, target_node_id: str):
+        raise NotImplementedError
+
     async def embed_nodes(self, algorithm: str) -> tuple[np.ndarray, list[str]]:
         raise NotImplementedError("Node embedding is not used in lightrag.")
@@ -0,0 +1,116 @@
+import asyncio
+import importlib.util
+from typing import Any, Callable, Union
+from weakref import WeakKeyDictionary
+
+import aiohttp
+import httpx
+from openai import AsyncAzureOpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .utils import logger
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HTTPClientPool:
+    """Shared, keep-alive API clients keyed by ``(provider, base_url, api_key)``.
+
+    Creating an ``AsyncOpenAI`` or ``aiohttp.ClientSession`` per call pays a
+    TCP and TLS handshake every time; clients taken from here reuse their
+    connection pool across calls. Clients are bound to the event loop that
+    created them, so each running loop gets its own set. ``aclose`` closes the
+    clients of the current loop and should run on shutdown, e.g. in a FastAPI
+    lifespan.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = HTTP2_AVAILABLE,
+    ):
+        self.configure(
+            max_connections, max_keepalive_connections, keepalive_expiry, http2
+        )
+        self._clients: WeakKeyDictionary[asyncio.AbstractEventLoop, dict] = (
+            WeakKeyDictionary()
+        )
+
+    def configure(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = HTTP2_AVAILABLE,
+    ):
+        """Set the pool limits of clients created from now on"""
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+
+    def _get(self, key: tuple, create: Callable[[], Any]) -> Any:
+        clients = self._clients.setdefault(asyncio.get_running_loop(), {})
+        if key not in clients:
+            clients[key] = create()
+        return clients[key]
+
+    def _httpx_client(self) -> httpx.AsyncClient:
+        return DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            http2=self.http2,
+        )
+
+    def openai_client(
+        self, base_url: Union[str, None] = None, api_key: Union[str, None] = None
+    ) -> AsyncOpenAI:
+        return self._get(
+            ("openai", base_url, api_key),
+            lambda: AsyncOpenAI(
+                base_url=base_url, api_key=api_key, http_client=self._httpx_client()
+            ),
+        )
+
+    def azure_openai_client(
+        self, azure_endpoint: str, api_key: str, api_version: str
+    ) -> AsyncAzureOpenAI:
+        return self._get(
+            ("azure_openai", azure_endpoint, api_key, api_version),
+            lambda: AsyncAzureOpenAI(
+                azure_endpoint=azure_endpoint,
+                api_key=api_key,
+                api_version=api_version,
+                http_client=self._httpx_client(),
+            ),
+        )
+
+    def aiohttp_session(
+        self, provider: str, base_url: str, api_key: Union[str, None] = None
+    ) -> aiohttp.ClientSession:
+        """A session for raw HTTP calls; aiohttp only speaks HTTP/1.1"""
+        return self._get(
+            ("aiohttp", provider, base_url, api_key),
+            lambda: aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    keepalive_timeout=self.keepalive_expiry,
+                )
+            ),
+        )
+
+    async def aclose(self):
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.close()
+        if clients:
+            logger.info(f"Closed {len(clients)} pooled HTTP clients")
+
+
+http_clients = HTTPClientPool()
@@ -0,0 +1,194 @@
+from itertools import chain
+from typing import Iterable, Union
+
+import networkx as nx
+import numpy as np
+
+from .prompt import GRAPH_FIELD_SEP
+from .utils import split_string_by_multi_markers
+
+
+class CSRGraph:
+    """Read-optimised adjacency snapshot of an undirected graph in CSR form.
+
+    Node ids and chunk ids are interned to integers. Row ``i`` of ``indices``
+    (``indptr[i]:indptr[i + 1]``) holds the neighbours of node ``i`` with the
+    matching edge ``weights``, ``degrees`` is precomputed and ``chunks`` is a
+    second CSR from node to the chunk ids of its ``source_id``. Descriptions
+    and other long attributes stay in the graph itself.
+
+    ``update`` rebuilds only the rows of the nodes it is given, so the
+    snapshot can follow inserts and deletes without a full rebuild. Deleted
+    nodes keep their interned id but are marked dead.
+    """
+
+    def __init__(self):
+        self.node_ids: list[str] = []
+        self.node_index: dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.degrees = np.zeros(0, dtype=np.int32)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.weights = np.zeros(0, dtype=np.float32)
+        self.chunk_ids: list[str] = []
+        self.chunk_index: dict[str, int] = {}
+        self.chunk_indptr = np.zeros(1, dtype=np.int64)
+        self.chunks = np.zeros(0, dtype=np.int32)
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph) -> "CSRGraph":
+        csr = cls()
+        csr.update(graph, graph.nodes)
+        return csr
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    def _intern(self, node_id: str) -> int:
+        if node_id not in self.node_index:
+            self.node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return self.node_index[node_id]
+
+    def _intern_chunk(self, chunk_id: str) -> int:
+        if chunk_id not in self.chunk_index:
+            self.chunk_index[chunk_id] = len(self.chunk_ids)
+            self.chunk_ids.append(chunk_id)
+        return self.chunk_index[chunk_id]
+
+    @staticmethod
+    def _replace_rows(
+        indptr: np.ndarray,
+        columns: list[np.ndarray],
+        n_rows: int,
+        rows: np.ndarray,
+        new_columns: list[list[list]],
+    ) -> tuple[np.ndarray, list[np.ndarray]]:
+        """Swap the entries of ``rows`` for ``new_columns`` and keep the others"""
+        old_lengths = np.diff(indptr)
+        keep_row = np.ones(len(old_lengths), dtype=bool)
+        keep_row[rows[rows < len(old_lengths)]] = False
+        keep = np.repeat(keep_row, old_lengths)
+        kept_entry_rows = np.repeat(np.arange(len(old_lengths)), old_lengths)[keep]
+
+        lengths = np.zeros(n_rows, dtype=np.int64)
+        lengths[: len(old_lengths)] = old_lengths
+        new_lengths = np.array([len(v) for v in new_columns[0]], dtype=np.int64)
+        lengths[rows] = new_lengths
+        new_entry_rows = np.repeat(rows, new_lengths)
+        # old entries are already in row order, so a stable sort interleaves
+        # the rebuilt rows back in place
+        order = np.argsort(
+            np.concatenate([kept_entry_rows, new_entry_rows]), kind="stable"
+        )
+
+        new_indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_indptr[1:])
+        results = []
+        for column, values in zip(columns, new_columns):
+            flat = np.fromiter(
+                chain.from_iterable(values),
+                dtype=column.dtype,
+                count=int(new_lengths.sum()),
+            )
+            results.append(np.concatenate([column[keep], flat])[order])
+        return new_indptr, results
+
+    def update(self, graph: nx.Graph, dirty_nodes: Iterable[str]):
+        """Rebuild the rows of ``dirty_nodes`` from ``graph``. A changed edge
+        must mark both of its endpoints, a deleted node all its neighbours.
+        """
+        dirty = [
+            n for n in dict.fromkeys(dirty_nodes) if n in graph or n in self.node_index
+        ]
+        if not dirty:
+            return
+        rows, neighbors, weights, chunks, degrees = [], [], [], [], []
+        for node_id in dirty:
+            rows.append(self._intern(node_id))
+            if node_id not in graph:
+                neighbors.append([])
+                weights.append([])
+                chunks.append([])
+                degrees.append(0)
+                continue
+            adj = graph.adj[node_id]
+            neighbors.append([self._intern(m) for m in adj])
+            weights.append([float(d.get("weight", 1.0)) for d in adj.values()])
+            source_ids = split_string_by_multi_markers(
+                graph.nodes[node_id].get("source_id", ""), [GRAPH_FIELD_SEP]
+            )
+            chunks.append([self._intern_chunk(c) for c in dict.fromkeys(source_ids)])
+            degrees.append(graph.degree(node_id))
+
+        n_rows = len(self.node_ids)
+        rows = np.array(rows, dtype=np.int64)
+        alive = np.zeros(n_rows, dtype=bool)
+        alive[: len(self.alive)] = self.alive
+        alive[rows] = [n in graph for n in dirty]
+        node_degrees = np.zeros(n_rows, dtype=np.int32)
+        node_degrees[: len(self.degrees)] = self.degrees
+        node_degrees[rows] = degrees
+
+        self.indptr, (self.indices, self.weights) = self._replace_rows(
+            self.indptr,
+            [self.indices, self.weights],
+            n_rows,
+            rows,
+            [neighbors, weights],
+        )
+        self.chunk_indptr, (self.chunks,) = self._replace_rows(
+            self.chunk_indptr, [self.chunks], n_rows, rows, [chunks]
+        )
+        self.alive = alive
+        self.degrees = node_degrees
+
+    def rows(self, node_ids: list[str]) -> np.ndarray:
+        """Interned row of every node id, -1 for unknown or deleted nodes"""
+        rows = np.array([self.node_index.get(n, -1) for n in node_ids], dtype=np.int64)
+        known = rows >= 0
+        rows[known] = np.where(self.alive[rows[known]], rows[known], -1)
+        return rows
+
+    def node_degrees(self, node_ids: list[str]) -> np.ndarray:
+        rows = self.rows(node_ids)
+        degrees = np.zeros(len(rows), dtype=np.int64)
+        degrees[rows >= 0] = self.degrees[rows[rows >= 0]]
+        return degrees
+
+    def edge_degrees(self, edge_pairs: list[tuple[str, str]]) -> np.ndarray:
+        if not edge_pairs:
+            return np.zeros(0, dtype=np.int64)
+        src, tgt = zip(*edge_pairs)
+        return self.node_degrees(list(src)) + self.node_degrees(list(tgt))
+
+    def neighbors(self, row: int) -> np.ndarray:
+        return self.indices[self.indptr[row] : self.indptr[row + 1]]
+
+    def node_edges(
+        self, node_ids: list[str]
+    ) -> list[Union[list[tuple[str, str]], None]]:
+        return [
+            [(node_id, self.node_ids[j]) for j in self.neighbors(row).tolist()]
+            if row >= 0
+            else None
+            for node_id, row in zip(node_ids, self.rows(node_ids).tolist())
+        ]
+
+    def neighbor_chunk_counts(self, node_id: str) -> dict[str, int]:
+        """For every chunk, the number of neighbours of ``node_id`` citing it"""
+        row = self.rows([node_id])[0]
+        if row < 0:
+            return {}
+        neighbors = self.neighbors(row)
+        starts = self.chunk_indptr[neighbors]
+        lengths = self.chunk_indptr[neighbors + 1] - starts
+        if not lengths.sum():
+            return {}
+        # gather all neighbour chunk slices in one go
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+        chunk_rows, counts = np.unique(self.chunks[positions], return_counts=True)
+        return {
+            self.chunk_ids[c]: n for c, n in zip(chunk_rows.tolist(), counts.tolist())
+        }
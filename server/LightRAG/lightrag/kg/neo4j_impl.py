@@ -1,7 +1,7 @@
 import asyncio
 import os
 from dataclasses import dataclass
-from typing import Any, Union, Tuple, List, Dict
+from typing import Any, Callable, Union, Tuple, List, Dict
 import inspect
 from lightrag.utils import logger
 from ..base import BaseGraphStorage
@@ -206,6 +206,105 @@ class Neo4JStorage(BaseGraphStorage):
 
             return edges
 
+    @staticmethod
+    def _quote_label(node_id: str) -> str:
+        """Node id as a backtick-quoted label, backticks in it doubled"""
+        return "`" + node_id.strip('"').replace("`", "``") + "`"
+
+    # labels looked up per batch read statement
+    _read_batch_size = 100
+
+    async def _read_per_label(
+        self, keys: list, branch: Callable[[Any], str], columns: str
+    ) -> List[Tuple[Any, Any]]:
+        """Run the MATCH ``branch(key)`` for every key as one UNION ALL
+        statement per batch and return ``(key, record)`` pairs.
+
+        Labels cannot be query parameters, and an OR of labels in a WHERE
+        clause scans every node, so each key gets its own branch that matches
+        on its label. ``columns`` is what every branch returns besides ``i``.
+        """
+        results = []
+        if not keys:
+            return results
+        async with self._driver.session() as session:
+            for start in range(0, len(keys), self._read_batch_size):
+                batch = keys[start : start + self._read_batch_size]
+                query = "\nUNION ALL\n".join(
+                    f"{branch(key)} RETURN {i} AS i, {columns}"
+                    for i, key in enumerate(batch)
+                )
+                records = await session.run(query)
+                async for record in records:
+                    results.append((batch[record["i"]], record))
+        return results
+
+    async def get_nodes(self, node_ids: List[str]) -> List[Union[dict, None]]:
+        labels = list(dict.fromkeys(node_id.strip('"') for node_id in node_ids))
+        nodes = {}
+        for label, record in await self._read_per_label(
+            labels,
+            lambda label: f"MATCH (n:{self._quote_label(label)})",
+            "properties(n) AS properties",
+        ):
+            nodes.setdefault(label, dict(record["properties"]))
+        logger.debug(
+            f"{inspect.currentframe().f_code.co_name}:result:{len(nodes)} nodes"
+        )
+        return [nodes.get(node_id.strip('"')) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: List[str]) -> List[int]:
+        labels = list(dict.fromkeys(node_id.strip('"') for node_id in node_ids))
+        degrees = {}
+        for label, record in await self._read_per_label(
+            labels,
+            lambda label: f"MATCH (n:{self._quote_label(label)})",
+            "COUNT { (n)--() } AS totalEdgeCount",
+        ):
+            degrees.setdefault(label, record["totalEdgeCount"])
+        logger.debug(f"{inspect.currentframe().f_code.co_name}:result:{degrees}")
+        return [degrees.get(node_id.strip('"')) for node_id in node_ids]
+
+    async def edge_degrees(self, edge_pairs: List[Tuple[str, str]]) -> List[int]:
+        node_ids = list(dict.fromkeys(n for pair in edge_pairs for n in pair))
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [
+            int(degrees[src] or 0) + int(degrees[tgt] or 0) for src, tgt in edge_pairs
+        ]
+
+    async def get_edges(
+        self, edge_pairs: List[Tuple[str, str]]
+    ) -> List[Union[dict, None]]:
+        pairs = list(
+            dict.fromkeys((src.strip('"'), tgt.strip('"')) for src, tgt in edge_pairs)
+        )
+        edges = {}
+        for pair, record in await self._read_per_label(
+            pairs,
+            lambda pair: f"MATCH (start:{self._quote_label(pair[0])})-[r]->"
+            f"(end:{self._quote_label(pair[1])})",
+            "properties(r) AS edge_properties",
+        ):
+            edges.setdefault(pair, dict(record["edge_properties"]))
+        logger.debug(
+            f"{inspect.currentframe().f_code.co_name}:result:{len(edges)} edges"
+        )
+        return [edges.get((src.strip('"'), tgt.strip('"'))) for src, tgt in edge_pairs]
+
+    async def get_nodes_edges(self, node_ids: List[str]) -> List[List[Tuple[str, str]]]:
+        labels = list(dict.fromkeys(node_id.strip('"') for node_id in node_ids))
+        edges = {label: [] for label in labels}
+        for label, record in await self._read_per_label(
+            labels,
+            lambda label: f"MATCH (n:{self._quote_label(label)}) "
+            "OPTIONAL MATCH (n)-[r]-(connected)",
+            "labels(connected) AS connected_labels",
+        ):
+            target_labels = record["connected_labels"]
+            if target_labels:
+                edges[label].append((label, target_labels[0]))
+        return [edges[node_id.strip('"')] for node_id in node_ids]
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -292,5 +391,82 @@ class Neo4JStorage(BaseGraphStorage):
             logger.error(f"Error during edge upsert: {str(e)}")
             raise
 
+    # rows merged per write transaction by the bulk upserts
+    _upsert_batch_size = 200
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=4, max=10),
+        retry=retry_if_exception_type(
+            (
+                neo4jExceptions.ServiceUnavailable,
+                neo4jExceptions.TransientError,
+                neo4jExceptions.WriteServiceUnavailable,
+            )
+        ),
+    )
+    async def _run_merge_batch(self, statements: List[Tuple[str, List[dict]]]):
+        async def _do_merge(tx: AsyncManagedTransaction):
+            for query, rows in statements:
+                result = await tx.run(query, rows=rows)
+                await result.consume()
+
+        async with self._driver.session() as session:
+            await session.execute_write(_do_merge)
+
+    async def upsert_nodes(self, nodes: Dict[str, Dict[str, Any]]):
+        """
+        Upsert many nodes, one write transaction per batch.
+
+        Labels are the node identity here and cannot be query parameters, so
+        the rows of a batch are grouped by label and each group is merged by
+        one ``UNWIND $rows`` statement whose text depends only on the label.
+        """
+        items = list(nodes.items())
+        for start in range(0, len(items), self._upsert_batch_size):
+            rows_by_label: Dict[str, List[dict]] = {}
+            for node_id, node_data in items[start : start + self._upsert_batch_size]:
+                rows_by_label.setdefault(self._quote_label(node_id), []).append(
+                    {"props": node_data}
+                )
+            statements = [
+                (f"UNWIND $rows AS row MERGE (n:{label}) SET n += row.props", rows)
+                for label, rows in rows_by_label.items()
+            ]
+            try:
+                await self._run_merge_batch(statements)
+            except Exception as e:
+                logger.error(f"Error during bulk upsert: {str(e)}")
+                raise
+            logger.debug(f"Upserted {len(rows_by_label)} nodes")
+
+    async def upsert_edges(self, edges: Dict[Tuple[str, str], Dict[str, Any]]):
+        """
+        Upsert many edges, one write transaction per batch, grouped by their
+        endpoint labels like ``upsert_nodes``. As in ``upsert_edge``, edges
+        whose endpoints do not exist are skipped.
+        """
+        items = list(edges.items())
+        for start in range(0, len(items), self._upsert_batch_size):
+            rows_by_labels: Dict[Tuple[str, str], List[dict]] = {}
+            for (src, tgt), edge_data in items[start : start + self._upsert_batch_size]:
+                rows_by_labels.setdefault(
+                    (self._quote_label(src), self._quote_label(tgt)), []
+                ).append({"props": edge_data})
+            statements = [
+                (
+                    f"UNWIND $rows AS row MATCH (source:{src}) MATCH (target:{tgt}) "
+                    "MERGE (source)-[r:DIRECTED]->(target) SET r += row.props",
+                    rows,
+                )
+                for (src, tgt), rows in rows_by_labels.items()
+            ]
+            try:
+                await self._run_merge_batch(statements)
+            except Exception as e:
+                logger.error(f"Error during bulk edge upsert: {str(e)}")
+                raise
+            logger.debug(f"Upserted {len(rows_by_labels)} edges")
+
     async def _node2vec_embed(self):
         print("Implemented but never called.")
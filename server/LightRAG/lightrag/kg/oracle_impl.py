@@ -16,6 +16,19 @@ from ..base import (
 
 import oracledb
 
+# Oracle accepts at most 1000 expressions in an IN list (ORA-01795)
+MAX_IN_LIST_SIZE = 1000
+
+
+def _batches(values: list, size: int = MAX_IN_LIST_SIZE) -> list[list]:
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
+
+def _bind_in_list(prefix: str, values: list[str]) -> tuple[str, dict]:
+    """IN list of bind variables ``:{prefix}0,:{prefix}1,...`` and their values"""
+    params = {f"{prefix}{i}": v for i, v in enumerate(values)}
+    return ",".join(f":{k}" for k in params), params
+
 
 class OracleDB:
     def __init__(self, config, **kwargs):
@@ -114,13 +127,15 @@ class OracleDB:
 
         logger.info("Finished check all tables in Oracle database")
 
-    async def query(self, sql: str, multirows: bool = False) -> Union[dict, None]:
+    async def query(
+        self, sql: str, multirows: bool = False, params: dict = None
+    ) -> Union[dict, None]:
         async with self.pool.acquire() as connection:
             connection.inputtypehandler = self.input_type_handler
             connection.outputtypehandler = self.output_type_handler
             with connection.cursor() as cursor:
                 try:
-                    await cursor.execute(sql)
+                    await cursor.execute(sql, params)
                 except Exception as e:
                     logger.error(f"Oracle database error: {e}")
                     print(sql)
@@ -160,9 +175,27 @@ class OracleDB:
             print(data)
             raise
 
+    async def executemany(self, sql: str, data: list, batch_size: int = None):
+        """用 array DML 执行多行绑定变量, 所有批次共用一个连接, 最后统一提交"""
+        batch_size = batch_size or len(data) or 1
+        try:
+            async with self.pool.acquire() as connection:
+                connection.inputtypehandler = self.input_type_handler
+                connection.outputtypehandler = self.output_type_handler
+                with connection.cursor() as cursor:
+                    for i in range(0, len(data), batch_size):
+                        await cursor.executemany(sql, data[i : i + batch_size])
+                    await connection.commit()
+        except Exception as e:
+            logger.error(f"Oracle database error: {e}")
+            logger.error(f"Failed SQL ({len(data)} rows): {sql}")
+            raise
+
 
 @dataclass
 class OracleKVStorage(BaseKVStorage):
+    supported_namespaces = ("full_docs", "text_chunks")
+
     # should pass db object to self.db
     def __post_init__(self):
         self._data = {}
@@ -220,17 +253,10 @@ class OracleKVStorage(BaseKVStorage):
     async def upsert(self, data: dict[str, dict]):
         left_data = {k: v for k, v in data.items() if k not in self._data}
         self._data.update(left_data)
-        # print(self._data)
-        # values = []
+        if not left_data:
+            return left_data
         if self.namespace == "text_chunks":
-            list_data = [
-                {
-                    "__id__": k,
-                    **{k1: v1 for k1, v1 in v.items()},
-                }
-                for k, v in data.items()
-            ]
-            contents = [v["content"] for v in data.values()]
+            contents = [v["content"] for v in left_data.values()]
             batches = [
                 contents[i : i + self._max_batch_size]
                 for i in range(0, len(contents), self._max_batch_size)
@@ -239,33 +265,30 @@ class OracleKVStorage(BaseKVStorage):
                 *[self.embedding_func(batch) for batch in batches]
             )
             embeddings = np.concatenate(embeddings_list)
-            for i, d in enumerate(list_data):
-                d["__vector__"] = embeddings[i]
-            # print(list_data)
-            for item in list_data:
-                merge_sql = SQL_TEMPLATES["merge_chunk"].format(check_id=item["__id__"])
-
-                values = [
-                    item["__id__"],
-                    item["content"],
-                    self.db.workspace,
-                    item["tokens"],
-                    item["chunk_order_index"],
-                    item["full_doc_id"],
-                    item["__vector__"],
-                ]
-                # print(merge_sql)
-                await self.db.execute(merge_sql, values)
+            rows = [
+                {
+                    "id": k,
+                    "content": v["content"],
+                    "workspace": self.db.workspace,
+                    "tokens": v["tokens"],
+                    "chunk_order_index": v["chunk_order_index"],
+                    "full_doc_id": v["full_doc_id"],
+                    "content_vector": embeddings[i],
+                }
+                for i, (k, v) in enumerate(left_data.items())
+            ]
+            await self.db.executemany(
+                SQL_TEMPLATES["merge_chunks"], rows, self._max_batch_size
+            )
 
         if self.namespace == "full_docs":
-            for k, v in self._data.items():
-                # values.clear()
-                merge_sql = SQL_TEMPLATES["merge_doc_full"].format(
-                    check_id=k,
-                )
-                values = [k, self._data[k]["content"], self.db.workspace]
-                # print(merge_sql)
-                await self.db.execute(merge_sql, values)
+            rows = [
+                {"id": k, "content": v["content"], "workspace": self.db.workspace}
+                for k, v in left_data.items()
+            ]
+            await self.db.executemany(
+                SQL_TEMPLATES["merge_docs_full"], rows, self._max_batch_size
+            )
         return left_data
 
     async def index_done_callback(self):
@@ -278,10 +301,12 @@ class OracleVectorDBStorage(BaseVectorStorage):
     cosine_better_than_threshold: float = 0.2
 
     def __post_init__(self):
-        pass
+        self._max_batch_size = self.global_config["embedding_batch_num"]
 
     async def upsert(self, data: dict[str, dict]):
         """向向量数据库中插入数据"""
+        # 向量与文本块、实体、关系存在同一行, 由 OracleKVStorage 和
+        # OracleGraphStorage 写入, 这里不重复写
         pass
 
     async def index_done_callback(self):
@@ -291,22 +316,37 @@ class OracleVectorDBStorage(BaseVectorStorage):
     async def query(self, query: str, top_k=5) -> Union[dict, list[dict]]:
         """从向量数据库中查询数据"""
         embeddings = await self.embedding_func([query])
-        embedding = embeddings[0]
-        # 转换精度
-        dtype = str(embedding.dtype).upper()
-        dimension = embedding.shape[0]
-        embedding_string = ", ".join(map(str, embedding.tolist()))
-
-        SQL = SQL_TEMPLATES[self.namespace].format(
-            embedding_string=embedding_string,
-            dimension=dimension,
-            dtype=dtype,
-            workspace=self.db.workspace,
-            top_k=top_k,
-            better_than_threshold=self.cosine_better_than_threshold,
+        return await self._query_by_embedding(embeddings[0], top_k)
+
+    async def query_many(self, queries: list[str], top_k=5) -> list[list[dict]]:
+        """一次向量化多个查询, 并发执行向量检索"""
+        if not len(queries):
+            return []
+        batches = [
+            queries[i : i + self._max_batch_size]
+            for i in range(0, len(queries), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = np.concatenate(embeddings_list)
+        return list(
+            await asyncio.gather(
+                *[self._query_by_embedding(e, top_k) for e in embeddings]
+            )
+        )
+
+    async def _query_by_embedding(self, embedding: np.ndarray, top_k: int):
+        # 向量以 VECTOR 类型的绑定变量传入, SQL 文本固定, 可以命中语句缓存
+        params = {
+            "embedding": embedding,
+            "workspace": self.db.workspace,
+            "top_k": top_k,
+            "better_than_threshold": self.cosine_better_than_threshold,
+        }
+        results = await self.db.query(
+            SQL_TEMPLATES[self.namespace], multirows=True, params=params
         )
-        # print(SQL)
-        results = await self.db.query(SQL, multirows=True)
         # print("vector search result:",results)
         return results
 
@@ -323,53 +363,15 @@ class OracleGraphStorage(BaseGraphStorage):
 
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         """插入或更新节点"""
-        # print("go into upsert node method")
-        entity_name = node_id
-        entity_type = node_data["entity_type"]
-        description = node_data["description"]
-        source_id = node_data["source_id"]
-        content = entity_name + description
-        contents = [content]
-        batches = [
-            contents[i : i + self._max_batch_size]
-            for i in range(0, len(contents), self._max_batch_size)
-        ]
-        embeddings_list = await asyncio.gather(
-            *[self.embedding_func(batch) for batch in batches]
-        )
-        embeddings = np.concatenate(embeddings_list)
-        content_vector = embeddings[0]
-        merge_sql = SQL_TEMPLATES["merge_node"].format(
-            workspace=self.db.workspace, name=entity_name, source_chunk_id=source_id
-        )
-        # print(merge_sql)
-        await self.db.execute(
-            merge_sql,
-            [
-                self.db.workspace,
-                entity_name,
-                entity_type,
-                description,
-                source_id,
-                content,
-                content_vector,
-            ],
-        )
-        # self._graph.add_node(node_id, **node_data)
+        await self.upsert_nodes({node_id: node_data})
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
         """插入或更新边"""
-        # print("go into upsert edge method")
-        source_name = source_node_id
-        target_name = target_node_id
-        weight = edge_data["weight"]
-        keywords = edge_data["keywords"]
-        description = edge_data["description"]
-        source_chunk_id = edge_data["source_id"]
-        content = keywords + source_name + target_name + description
-        contents = [content]
+        await self.upsert_edges({(source_node_id, target_node_id): edge_data})
+
+    async def _embed(self, contents: list[str]) -> np.ndarray:
         batches = [
             contents[i : i + self._max_batch_size]
             for i in range(0, len(contents), self._max_batch_size)
@@ -377,30 +379,56 @@ class OracleGraphStorage(BaseGraphStorage):
         embeddings_list = await asyncio.gather(
             *[self.embedding_func(batch) for batch in batches]
         )
-        embeddings = np.concatenate(embeddings_list)
-        content_vector = embeddings[0]
-        merge_sql = SQL_TEMPLATES["merge_edge"].format(
-            workspace=self.db.workspace,
-            source_name=source_name,
-            target_name=target_name,
-            source_chunk_id=source_chunk_id,
+        return np.concatenate(embeddings_list)
+
+    async def upsert_nodes(self, nodes: dict[str, dict[str, str]]):
+        """批量插入或更新节点, 每批一次 executemany"""
+        if not nodes:
+            return
+        contents = [k + v["description"] for k, v in nodes.items()]
+        embeddings = await self._embed(contents)
+        rows = [
+            {
+                "workspace": self.db.workspace,
+                "name": k,
+                "entity_type": v["entity_type"],
+                "description": v["description"],
+                "source_chunk_id": v["source_id"],
+                "content": contents[i],
+                "content_vector": embeddings[i],
+            }
+            for i, (k, v) in enumerate(nodes.items())
+        ]
+        await self.db.executemany(
+            SQL_TEMPLATES["merge_nodes"], rows, self._max_batch_size
         )
-        # print(merge_sql)
-        await self.db.execute(
-            merge_sql,
-            [
-                self.db.workspace,
-                source_name,
-                target_name,
-                weight,
-                keywords,
-                description,
-                source_chunk_id,
-                content,
-                content_vector,
-            ],
+
+    async def upsert_edges(self, edges: dict[tuple[str, str], dict[str, str]]):
+        """批量插入或更新边, 每批一次 executemany"""
+        if not edges:
+            return
+        contents = [
+            v["keywords"] + src + tgt + v["description"]
+            for (src, tgt), v in edges.items()
+        ]
+        embeddings = await self._embed(contents)
+        rows = [
+            {
+                "workspace": self.db.workspace,
+                "source_name": src,
+                "target_name": tgt,
+                "weight": v["weight"],
+                "keywords": v["keywords"],
+                "description": v["description"],
+                "source_chunk_id": v["source_id"],
+                "content": contents[i],
+                "content_vector": embeddings[i],
+            }
+            for i, ((src, tgt), v) in enumerate(edges.items())
+        ]
+        await self.db.executemany(
+            SQL_TEMPLATES["merge_edges"], rows, self._max_batch_size
         )
-        # self._graph.add_edge(source_node_id, target_node_id, **edge_data)
 
     async def embed_nodes(self, algorithm: str) -> tuple[np.ndarray, list[str]]:
         """为节点生成向量"""
@@ -525,6 +553,75 @@ class OracleGraphStorage(BaseGraphStorage):
                 # print("Node Edge not exist!",self.db.workspace, source_node_id)
                 return []
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        """根据节点id列表一次性获取节点数据"""
+        nodes = {}
+        for batch in _batches(list(dict.fromkeys(node_ids))):
+            in_list, params = _bind_in_list("n", batch)
+            SQL = SQL_TEMPLATES["get_nodes"].format(
+                workspace=self.db.workspace, node_ids=in_list
+            )
+            for row in await self.db.query(SQL, multirows=True, params=params):
+                nodes.setdefault(row["name"], row)
+        return [nodes.get(n) for n in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        """根据节点id列表一次性获取节点的度"""
+        degrees = {}
+        for batch in _batches(list(dict.fromkeys(node_ids))):
+            in_list, params = _bind_in_list("n", batch)
+            SQL = SQL_TEMPLATES["node_degrees"].format(
+                workspace=self.db.workspace, node_ids=in_list
+            )
+            for row in await self.db.query(SQL, multirows=True, params=params):
+                degrees[row["name"]] = row["degree"]
+        return [degrees.get(n, 0) for n in node_ids]
+
+    async def edge_degrees(self, edge_pairs: list[tuple[str, str]]) -> list[int]:
+        """根据源和目标节点id列表一次性获取边的度"""
+        node_ids = list({n for pair in edge_pairs for n in pair})
+        degrees = dict(zip(node_ids, await self.node_degrees(node_ids)))
+        return [degrees[src] + degrees[tgt] for src, tgt in edge_pairs]
+
+    async def get_edges(
+        self, edge_pairs: list[tuple[str, str]]
+    ) -> list[Union[dict, None]]:
+        """根据源和目标节点id列表一次性获取边"""
+        edges = {}
+        # at most 1000 pairs per statement keeps both IN lists within the limit
+        for batch in _batches(list(dict.fromkeys(map(tuple, edge_pairs)))):
+            source_in_list, source_params = _bind_in_list(
+                "s", list({s for s, _ in batch})
+            )
+            target_in_list, target_params = _bind_in_list(
+                "t", list({t for _, t in batch})
+            )
+            SQL = SQL_TEMPLATES["get_edges"].format(
+                workspace=self.db.workspace,
+                source_node_ids=source_in_list,
+                target_node_ids=target_in_list,
+            )
+            for row in await self.db.query(
+                SQL, multirows=True, params={**source_params, **target_params}
+            ):
+                pair = (row.pop("src_name"), row.pop("tgt_name"))
+                edges.setdefault(pair, row)
+        return [edges.get(tuple(pair)) for pair in edge_pairs]
+
+    async def get_nodes_edges(self, node_ids: list[str]) -> list[list[tuple[str, str]]]:
+        """根据节点id列表一次性获取节点的所有边"""
+        edges = {n: [] for n in node_ids}
+        for batch in _batches(list(edges)):
+            in_list, params = _bind_in_list("n", batch)
+            SQL = SQL_TEMPLATES["get_nodes_edges"].format(
+                workspace=self.db.workspace, source_node_ids=in_list
+            )
+            for row in await self.db.query(sql=SQL, multirows=True, params=params):
+                edges[row["source_name"]].append(
+                    (row["source_name"], row["target_name"])
+                )
+        return [edges[n] for n in node_ids]
+
 
 N_T = {
     "full_docs": "LIGHTRAG_DOC_FULL",
@@ -624,31 +721,31 @@ SQL_TEMPLATES = {
     "get_by_ids_full_docs": "select ID,NVL(content,'') as content from LIGHTRAG_DOC_FULL where workspace='{workspace}' and ID in ({ids})",
     "get_by_ids_text_chunks": "select ID,TOKENS,NVL(content,'') as content,CHUNK_ORDER_INDEX,FULL_DOC_ID  from LIGHTRAG_DOC_CHUNKS where workspace='{workspace}' and ID in ({ids})",
     "filter_keys": "select id from {table_name} where workspace='{workspace}' and id in ({ids})",
-    "merge_doc_full": """ MERGE INTO LIGHTRAG_DOC_FULL a
+    "merge_docs_full": """MERGE INTO LIGHTRAG_DOC_FULL a
                     USING DUAL
-                    ON (a.id = '{check_id}')
+                    ON (a.id = :id)
                     WHEN NOT MATCHED THEN
-                    INSERT(id,content,workspace) values(:1,:2,:3)
+                    INSERT(id,content,workspace) values(:id,:content,:workspace)
                     """,
-    "merge_chunk": """MERGE INTO LIGHTRAG_DOC_CHUNKS a
+    "merge_chunks": """MERGE INTO LIGHTRAG_DOC_CHUNKS a
                     USING DUAL
-                    ON (a.id = '{check_id}')
+                    ON (a.id = :id)
                     WHEN NOT MATCHED THEN
                     INSERT(id,content,workspace,tokens,chunk_order_index,full_doc_id,content_vector)
-                    values (:1,:2,:3,:4,:5,:6,:7) """,
+                    values (:id,:content,:workspace,:tokens,:chunk_order_index,:full_doc_id,:content_vector) """,
     # SQL for VectorStorage
     "entities": """SELECT name as entity_name FROM
-        (SELECT id,name,VECTOR_DISTANCE(content_vector,vector('[{embedding_string}]',{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_GRAPH_NODES WHERE workspace='{workspace}')
-        WHERE distance>{better_than_threshold} ORDER BY distance ASC FETCH FIRST {top_k} ROWS ONLY""",
+        (SELECT id,name,VECTOR_DISTANCE(content_vector,:embedding,COSINE) as distance
+        FROM LIGHTRAG_GRAPH_NODES WHERE workspace=:workspace)
+        WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     "relationships": """SELECT source_name as src_id, target_name as tgt_id FROM
-        (SELECT id,source_name,target_name,VECTOR_DISTANCE(content_vector,vector('[{embedding_string}]',{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_GRAPH_EDGES WHERE workspace='{workspace}')
-        WHERE distance>{better_than_threshold} ORDER BY distance ASC FETCH FIRST {top_k} ROWS ONLY""",
+        (SELECT id,source_name,target_name,VECTOR_DISTANCE(content_vector,:embedding,COSINE) as distance
+        FROM LIGHTRAG_GRAPH_EDGES WHERE workspace=:workspace)
+        WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     "chunks": """SELECT id FROM
-        (SELECT id,VECTOR_DISTANCE(content_vector,vector('[{embedding_string}]',{dimension},{dtype}),COSINE) as distance
-        FROM LIGHTRAG_DOC_CHUNKS WHERE workspace='{workspace}')
-        WHERE distance>{better_than_threshold} ORDER BY distance ASC FETCH FIRST {top_k} ROWS ONLY""",
+        (SELECT id,VECTOR_DISTANCE(content_vector,:embedding,COSINE) as distance
+        FROM LIGHTRAG_DOC_CHUNKS WHERE workspace=:workspace)
+        WHERE distance>:better_than_threshold ORDER BY distance ASC FETCH FIRST :top_k ROWS ONLY""",
     # SQL for GraphStorage
     "has_node": """SELECT * FROM GRAPH_TABLE (lightrag_graph
         MATCH (a)
@@ -685,16 +782,50 @@ SQL_TEMPLATES = {
             WHERE e.workspace='{workspace}' and a.workspace='{workspace}' and b.workspace='{workspace}'
             AND a.name='{source_node_id}'
             COLUMNS (a.name as source_name,b.name as target_name))""",
-    "merge_node": """MERGE INTO LIGHTRAG_GRAPH_NODES a
+    "get_nodes": """SELECT t1.name,t2.entity_type,t2.source_chunk_id as source_id,NVL(t2.description,'') AS description
+        FROM GRAPH_TABLE (lightrag_graph
+        MATCH (a)
+        WHERE a.workspace='{workspace}' AND a.name in ({node_ids})
+        COLUMNS (a.name)
+        ) t1 JOIN LIGHTRAG_GRAPH_NODES t2 on t1.name=t2.name
+        WHERE t2.workspace='{workspace}'""",
+    "node_degrees": """SELECT name,count(1) as degree FROM (
+        SELECT source_name as name FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE a.workspace='{workspace}' and b.workspace='{workspace}'
+            AND a.name in ({node_ids})
+            COLUMNS (a.name as source_name))
+        UNION ALL
+        SELECT target_name as name FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE a.workspace='{workspace}' and b.workspace='{workspace}'
+            AND b.name in ({node_ids})
+            COLUMNS (b.name as target_name)))
+        GROUP BY name""",
+    "get_edges": """SELECT t1.src_name,t1.tgt_name,t2.weight,t2.source_chunk_id as source_id,
+        NVL(t2.description,'') AS description,NVL(t2.KEYWORDS,'') AS keywords
+        FROM GRAPH_TABLE (lightrag_graph
+        MATCH (a)-[e]->(b)
+        WHERE e.workspace='{workspace}' and a.workspace='{workspace}' and b.workspace='{workspace}'
+        AND a.name in ({source_node_ids}) and b.name in ({target_node_ids})
+        COLUMNS (e.id,a.name as src_name,b.name as tgt_name)
+        ) t1 JOIN LIGHTRAG_GRAPH_EDGES t2 on t1.id=t2.id""",
+    "get_nodes_edges": """SELECT source_name,target_name
+            FROM GRAPH_TABLE (lightrag_graph
+            MATCH (a)-[e]->(b)
+            WHERE e.workspace='{workspace}' and a.workspace='{workspace}' and b.workspace='{workspace}'
+            AND a.name in ({source_node_ids})
+            COLUMNS (a.name as source_name,b.name as target_name))""",
+    "merge_nodes": """MERGE INTO LIGHTRAG_GRAPH_NODES a
                     USING DUAL
-                    ON (a.workspace = '{workspace}' and a.name='{name}' and a.source_chunk_id='{source_chunk_id}')
+                    ON (a.workspace = :workspace and a.name = :name and a.source_chunk_id = :source_chunk_id)
                 WHEN NOT MATCHED THEN
                     INSERT(workspace,name,entity_type,description,source_chunk_id,content,content_vector)
-                    values (:1,:2,:3,:4,:5,:6,:7) """,
-    "merge_edge": """MERGE INTO LIGHTRAG_GRAPH_EDGES a
+                    values (:workspace,:name,:entity_type,:description,:source_chunk_id,:content,:content_vector) """,
+    "merge_edges": """MERGE INTO LIGHTRAG_GRAPH_EDGES a
                     USING DUAL
-                    ON (a.workspace = '{workspace}' and a.source_name='{source_name}' and a.target_name='{target_name}' and a.source_chunk_id='{source_chunk_id}')
+                    ON (a.workspace = :workspace and a.source_name = :source_name and a.target_name = :target_name and a.source_chunk_id = :source_chunk_id)
                 WHEN NOT MATCHED THEN
                     INSERT(workspace,source_name,target_name,weight,keywords,description,source_chunk_id,content,content_vector)
-                    values (:1,:2,:3,:4,:5,:6,:7,:8,:9) """,
+                    values (:workspace,:source_name,:target_name,:weight,:keywords,:description,:source_chunk_id,:content,:content_vector) """,
 }
@@ -1,9 +1,10 @@
 import asyncio
 import os
-from dataclasses import asdict, dataclass, field
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field, replace
 from datetime import datetime
 from functools import partial
-from typing import Type, cast
+from typing import AsyncIterator, Awaitable, Callable, Type, Union, cast
 
 from .llm import (
     gpt_4o_mini_complete,
@@ -16,13 +17,20 @@ from .operate import (
     global_query,
     hybrid_query,
     naive_query,
+    remove_chunks_from_graph,
 )
 
+from .prompt import PROMPTS
 from .utils import (
     EmbeddingFunc,
+    RateLimiter,
+    batch_async_func_calls,
     compute_mdhash_id,
+    encode_string_by_tiktoken,
     limit_async_func_call,
+    rate_limit_async_func_call,
     convert_response_to_json,
+    priority_scope,
     logger,
     set_logger,
 )
@@ -35,9 +43,15 @@ from .base import (
 )
 
 from .storage import (
+    BoundedKVStorage,
+    EmbeddingCache,
     JsonKVStorage,
+    JsonLogKVStorage,
+    MmapVectorDBStorage,
     NanoVectorDBStorage,
     NetworkXStorage,
+    SemanticQueryCache,
+    SQLiteKVStorage,
 )
 
 from .kg.neo4j_impl import Neo4JStorage
@@ -50,6 +64,10 @@ from .kg.oracle_impl import OracleKVStorage, OracleGraphStorage, OracleVectorDBS
 #     GraphStorage as ArangoDBStorage
 # )
 
+# doc_chunks key recording that the documents stored before the document
+# index existed have been indexed
+DOC_INDEX_MARKER = "__doc_index__"
+
 
 def always_get_an_event_loop() -> asyncio.AbstractEventLoop:
     try:
@@ -102,18 +120,57 @@ class LightRAG:
     embedding_func: EmbeddingFunc = field(default_factory=lambda: openai_embedding)
     embedding_batch_num: int = 32
     embedding_func_max_async: int = 16
+    # concurrent embedding calls within this many seconds are sent as one batch
+    embedding_batch_max_wait: float = 0.005
+    # reuse embeddings of document texts seen before; the model name keys the
+    # cache, least recently used vectors are dropped past the limits
+    enable_embedding_cache: bool = False
+    embedding_model_name: str = None
+    embedding_cache_max_entries: int = None
+    embedding_cache_max_bytes: int = 1 << 30
 
     # LLM
     llm_model_func: callable = gpt_4o_mini_complete  # hf_model_complete#
     llm_model_name: str = "meta-llama/Llama-3.2-1B-Instruct"  #'meta-llama/Llama-3.2-1B'#'google/gemma-2-2b-it'
     llm_model_max_token_size: int = 32768
     llm_model_max_async: int = 16
+    # per priority class caps ("query", "summary", "extraction") under the
+    # max_async totals, e.g. {"extraction": 12} keeps slots free for queries
+    llm_priority_max_async: dict = field(default_factory=dict)
+    embedding_priority_max_async: dict = field(default_factory=dict)
     llm_model_kwargs: dict = field(default_factory=dict)
+    # provider quotas, None means unlimited; calls are paced to stay under
+    # them and pause on a retry-after instead of failing
+    llm_requests_per_minute: int = None
+    llm_tokens_per_minute: int = None
+    embedding_requests_per_minute: int = None
+    embedding_tokens_per_minute: int = None
 
     # storage
     vector_db_storage_cls_kwargs: dict = field(default_factory=dict)
+    key_string_value_json_storage_cls_kwargs: dict = field(default_factory=dict)
 
     enable_llm_cache: bool = True
+    # bounds for llm_response_cache, None means unbounded
+    llm_cache_max_entries: int = None
+    llm_cache_max_bytes: int = None
+    llm_cache_ttl: float = None  # seconds
+
+    # extracted query keywords keyed by the normalized query, bounded apart
+    # from the answer cache. Off by default like the embedding cache, as it
+    # adds a file the queries write to
+    enable_keywords_cache: bool = False
+    keywords_cache_max_entries: int = 10000
+    keywords_cache_ttl: float = None  # seconds
+
+    # answer reuse for semantically similar queries
+    enable_semantic_cache: bool = False
+    semantic_cache_similarity_threshold: float = 0.95
+    semantic_cache_max_entries: int = 1000
+    # any answer may be stale once documents or entities are inserted, updated
+    # or deleted, so every change clears the whole cache. Turn this off to keep
+    # answering from it until entries are evicted
+    semantic_cache_clear_on_change: bool = True
 
     # extension
     addon_params: dict = field(default_factory=dict)
@@ -151,14 +208,77 @@ class LightRAG:
                 global_config=asdict(self),
                 embedding_func=None,
             )
-            if self.enable_llm_cache
+            if self.enable_llm_cache and self._kv_supports("llm_response_cache")
             else None
         )
+        if self.llm_response_cache is not None and (
+            self.llm_cache_max_entries is not None
+            or self.llm_cache_max_bytes is not None
+            or self.llm_cache_ttl is not None
+        ):
+            self.llm_response_cache = BoundedKVStorage(
+                namespace="llm_response_cache",
+                global_config=asdict(self),
+                embedding_func=None,
+                inner=self.llm_response_cache,
+                max_entries=self.llm_cache_max_entries,
+                max_bytes=self.llm_cache_max_bytes,
+                ttl=self.llm_cache_ttl,
+            )
 
-        self.embedding_func = limit_async_func_call(self.embedding_func_max_async)(
-            self.embedding_func
+        self.keywords_cache = (
+            BoundedKVStorage(
+                namespace="keywords_cache",
+                global_config=asdict(self),
+                embedding_func=None,
+                inner=self.key_string_value_json_storage_cls(
+                    namespace="keywords_cache",
+                    global_config=asdict(self),
+                    embedding_func=None,
+                ),
+                max_entries=self.keywords_cache_max_entries,
+                ttl=self.keywords_cache_ttl,
+            )
+            if self.enable_keywords_cache and self._kv_supports("keywords_cache")
+            else None
         )
 
+        embedding_func = self.embedding_func
+        self.embedding_func = limit_async_func_call(
+            self.embedding_func_max_async, self.embedding_priority_max_async
+        )(self.embedding_func)
+        self._embedding_limiter = self.embedding_func.limiter
+        self.embedding_rate_limiter = None
+        if self.embedding_requests_per_minute or self.embedding_tokens_per_minute:
+            self.embedding_rate_limiter = RateLimiter(
+                self.embedding_requests_per_minute, self.embedding_tokens_per_minute
+            )
+            # outside the concurrency limit, so calls wait for quota before
+            # taking a slot
+            self.embedding_func = rate_limit_async_func_call(
+                self.embedding_rate_limiter,
+                lambda texts, **kwargs: sum(
+                    len(encode_string_by_tiktoken(t)) for t in texts
+                ),
+            )(self.embedding_func)
+        self.embedding_func = batch_async_func_calls(
+            self.embedding_batch_num, self.embedding_batch_max_wait
+        )(self.embedding_func)
+        self.embedding_cache = None
+        if self.enable_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                namespace="embedding_cache",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+                model_name=self.embedding_model_name
+                or getattr(embedding_func.func, "__qualname__", ""),
+                max_entries=self.embedding_cache_max_entries,
+                max_bytes=self.embedding_cache_max_bytes,
+            )
+            self.embedding_func = replace(
+                embedding_func, func=self.embedding_cache.embed
+            )
+
         ####
         # add embedding func by walter
         ####
@@ -172,6 +292,38 @@ class LightRAG:
             global_config=asdict(self),
             embedding_func=self.embedding_func,
         )
+        # reverse index full doc -> chunks -> extraction records, used to
+        # delete or update a document without re-indexing everything. A chunk
+        # shared by several documents lists all of them in chunk_docs and is
+        # only removed along with the last one
+        self.doc_chunks = (
+            self.key_string_value_json_storage_cls(
+                namespace="doc_chunks",
+                global_config=asdict(self),
+                embedding_func=None,
+            )
+            if self._kv_supports("doc_chunks")
+            else None
+        )
+        self.chunk_extractions = (
+            self.key_string_value_json_storage_cls(
+                namespace="chunk_extractions",
+                global_config=asdict(self),
+                embedding_func=None,
+            )
+            if self._kv_supports("chunk_extractions")
+            else None
+        )
+        self.chunk_docs = (
+            self.key_string_value_json_storage_cls(
+                namespace="chunk_docs",
+                global_config=asdict(self),
+                embedding_func=None,
+            )
+            if self.doc_chunks is not None and self._kv_supports("chunk_docs")
+            else None
+        )
+        self._doc_index_checked = False
         self.chunk_entity_relation_graph = self.graph_storage_cls(
             namespace="chunk_entity_relation",
             global_config=asdict(self),
@@ -199,21 +351,58 @@ class LightRAG:
             embedding_func=self.embedding_func,
         )
 
-        self.llm_model_func = limit_async_func_call(self.llm_model_max_async)(
+        self.semantic_cache = (
+            SemanticQueryCache(
+                namespace="query_answers",
+                global_config=asdict(self),
+                embedding_func=self.embedding_func,
+                similarity_threshold=self.semantic_cache_similarity_threshold,
+                max_entries=self.semantic_cache_max_entries,
+                clear_on_change=self.semantic_cache_clear_on_change,
+            )
+            if self.enable_semantic_cache
+            else None
+        )
+
+        # the limiter is handed to the model func like hashing_kv, so cache
+        # hits never spend quota; a call waiting on it gives its
+        # llm_model_max_async slot back meanwhile
+        self.llm_rate_limiter = None
+        llm_model_kwargs = dict(self.llm_model_kwargs)
+        if self.llm_requests_per_minute or self.llm_tokens_per_minute:
+            self.llm_rate_limiter = RateLimiter(
+                self.llm_requests_per_minute, self.llm_tokens_per_minute
+            )
+            llm_model_kwargs["rate_limiter"] = self.llm_rate_limiter
+        self._llm_streams = getattr(self.llm_model_func, "supports_stream", False)
+        self.llm_model_func = limit_async_func_call(
+            self.llm_model_max_async, self.llm_priority_max_async
+        )(
             partial(
                 self.llm_model_func,
                 hashing_kv=self.llm_response_cache,
-                **self.llm_model_kwargs,
+                **llm_model_kwargs,
             )
         )
+        self._llm_limiter = self.llm_model_func.limiter
+
+    def _kv_supports(self, namespace: str) -> bool:
+        supported = self.key_string_value_json_storage_cls.supported_namespaces
+        if supported is None or namespace in supported:
+            return True
+        logger.warning(f"{self.kv_storage} can't hold {namespace}, leaving it disabled")
+        return False
 
     def _get_storage_class(self) -> Type[BaseGraphStorage]:
         return {
             # kv storage
             "JsonKVStorage": JsonKVStorage,
+            "JsonLogKVStorage": JsonLogKVStorage,
+            "SQLiteKVStorage": SQLiteKVStorage,
             "OracleKVStorage": OracleKVStorage,
             # vector storage
             "NanoVectorDBStorage": NanoVectorDBStorage,
+            "MmapVectorDBStorage": MmapVectorDBStorage,
             "OracleVectorDBStorage": OracleVectorDBStorage,
             # graph storage
             "NetworkXStorage": NetworkXStorage,
@@ -226,6 +415,7 @@ class LightRAG:
         loop = always_get_an_event_loop()
         return loop.run_until_complete(self.ainsert(string_or_strings))
 
+    @priority_scope("extraction")
     async def ainsert(self, string_or_strings):
         update_storage = False
         try:
@@ -244,20 +434,12 @@ class LightRAG:
             update_storage = True
             logger.info(f"[New Docs] inserting {len(new_docs)} docs")
 
+            await self._ensure_doc_index()
             inserting_chunks = {}
+            doc_chunk_ids = {}
             for doc_key, doc in new_docs.items():
-                chunks = {
-                    compute_mdhash_id(dp["content"], prefix="chunk-"): {
-                        **dp,
-                        "full_doc_id": doc_key,
-                    }
-                    for dp in chunking_by_token_size(
-                        doc["content"],
-                        overlap_token_size=self.chunk_overlap_token_size,
-                        max_token_size=self.chunk_token_size,
-                        tiktoken_model=self.tiktoken_model_name,
-                    )
-                }
+                chunks = self._chunk_doc(doc_key, doc["content"])
+                doc_chunk_ids[doc_key] = list(chunks)
                 inserting_chunks.update(chunks)
             _add_chunk_keys = await self.text_chunks.filter_keys(
                 list(inserting_chunks.keys())
@@ -266,37 +448,304 @@ class LightRAG:
                 k: v for k, v in inserting_chunks.items() if k in _add_chunk_keys
             }
             if not len(inserting_chunks):
+                # the documents still take a share in the chunks they repeat
                 logger.warning("All chunks are already in the storage")
-                return
-            logger.info(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
-
-            await self.chunks_vdb.upsert(inserting_chunks)
-
-            logger.info("[Entity Extraction]...")
-            maybe_new_kg = await extract_entities(
-                inserting_chunks,
-                knowledge_graph_inst=self.chunk_entity_relation_graph,
-                entity_vdb=self.entities_vdb,
-                relationships_vdb=self.relationships_vdb,
-                global_config=asdict(self),
-            )
-            if maybe_new_kg is None:
-                logger.warning("No new entities and relationships found")
-                return
-            self.chunk_entity_relation_graph = maybe_new_kg
+            else:
+                logger.info(f"[New Chunks] inserting {len(inserting_chunks)} chunks")
+                if not await self._insert_chunks(inserting_chunks):
+                    return
 
             await self.full_docs.upsert(new_docs)
             await self.text_chunks.upsert(inserting_chunks)
+            await self._add_chunk_owners(doc_chunk_ids)
         finally:
             if update_storage:
                 await self._insert_done()
 
+    def _chunk_doc(self, doc_key: str, content: str) -> dict[str, dict]:
+        return {
+            compute_mdhash_id(dp["content"], prefix="chunk-"): {
+                **dp,
+                "full_doc_id": doc_key,
+            }
+            for dp in chunking_by_token_size(
+                content,
+                overlap_token_size=self.chunk_overlap_token_size,
+                max_token_size=self.chunk_token_size,
+                tiktoken_model=self.tiktoken_model_name,
+            )
+        }
+
+    async def _insert_chunks(self, inserting_chunks: dict[str, dict]) -> bool:
+        await self.chunks_vdb.upsert(inserting_chunks)
+
+        logger.info("[Entity Extraction]...")
+        maybe_new_kg = await extract_entities(
+            inserting_chunks,
+            knowledge_graph_inst=self.chunk_entity_relation_graph,
+            entity_vdb=self.entities_vdb,
+            relationships_vdb=self.relationships_vdb,
+            global_config=asdict(self),
+            chunk_extractions=self.chunk_extractions,
+        )
+        if maybe_new_kg is None:
+            logger.warning("No new entities and relationships found")
+            return False
+        self.chunk_entity_relation_graph = maybe_new_kg
+        return True
+
+    async def _delete_chunks(self, chunk_ids: list[str]):
+        if not chunk_ids:
+            return
+        await remove_chunks_from_graph(
+            chunk_ids,
+            knowledge_graph_inst=self.chunk_entity_relation_graph,
+            entity_vdb=self.entities_vdb,
+            relationships_vdb=self.relationships_vdb,
+            chunk_extractions=self.chunk_extractions,
+            global_config=asdict(self),
+        )
+        await self.chunks_vdb.delete(chunk_ids)
+        await self.text_chunks.delete(chunk_ids)
+        await self.chunk_extractions.delete(chunk_ids)
+
+    def _check_deletable(self):
+        """Raise NotImplementedError unless every storage can take a document
+        back out"""
+        if self.doc_chunks is None or self.chunk_extractions is None:
+            raise NotImplementedError(
+                f"{self.kv_storage} can't hold the document index, so documents "
+                "can't be deleted or updated"
+            )
+        missing = [
+            f"{type(storage).__name__}.{method}"
+            for storage, base_cls, methods in [
+                (self.full_docs, BaseKVStorage, ["delete"]),
+                (self.text_chunks, BaseKVStorage, ["delete"]),
+                (self.chunks_vdb, BaseVectorStorage, ["delete"]),
+                (self.entities_vdb, BaseVectorStorage, ["delete_entities"]),
+                (
+                    self.relationships_vdb,
+                    BaseVectorStorage,
+                    ["delete", "delete_entities"],
+                ),
+                (
+                    self.chunk_entity_relation_graph,
+                    BaseGraphStorage,
+                    ["delete_node", "delete_edge"],
+                ),
+            ]
+            for method in methods
+            if getattr(type(storage), method) is getattr(base_cls, method)
+            # the default delete_entities falls back to these
+            and not (
+                method == "delete_entities"
+                and hasattr(storage, "delete_entity")
+                and hasattr(storage, "delete_relation")
+            )
+        ]
+        if missing:
+            raise NotImplementedError(
+                f"Documents can't be deleted or updated: {', '.join(missing)} "
+                "is not implemented"
+            )
+
+    async def _replace(self, storage: BaseKVStorage, data: dict[str, dict]):
+        # KV upserts never overwrite an existing key
+        await storage.delete(list(data))
+        await storage.upsert(data)
+
+    async def _add_chunk_owners(self, doc_chunk_ids: dict[str, list[str]]):
+        """Record the chunks of new documents and add the documents to the
+        owners of each chunk"""
+        if self.doc_chunks is None:
+            return
+        await self._replace(
+            self.doc_chunks, {k: {"chunk_ids": v} for k, v in doc_chunk_ids.items()}
+        )
+        if self.chunk_docs is None:
+            return
+        owners = defaultdict(set)
+        for doc_id, chunk_ids in doc_chunk_ids.items():
+            for chunk_id in chunk_ids:
+                owners[chunk_id].add(doc_id)
+        chunk_ids = list(owners)
+        for chunk_id, entry in zip(
+            chunk_ids, await self.chunk_docs.get_by_ids(chunk_ids) or []
+        ):
+            if entry is not None:
+                owners[chunk_id].update(entry["doc_ids"])
+        await self._replace(
+            self.chunk_docs, {k: {"doc_ids": sorted(v)} for k, v in owners.items()}
+        )
+
+    async def _release_chunks(self, doc_id: str, chunk_ids: list[str]) -> list[str]:
+        """Remove ``doc_id`` from the owners of ``chunk_ids`` and return the
+        chunks no other document holds"""
+        if self.chunk_docs is None:
+            return chunk_ids
+        released = []
+        shared = {}
+        for chunk_id, entry in zip(
+            chunk_ids, await self.chunk_docs.get_by_ids(chunk_ids) or []
+        ):
+            doc_ids = [d for d in (entry or {}).get("doc_ids", []) if d != doc_id]
+            if doc_ids:
+                shared[chunk_id] = {"doc_ids": doc_ids}
+            else:
+                released.append(chunk_id)
+        await self.chunk_docs.delete(chunk_ids)
+        await self.chunk_docs.upsert(shared)
+        # shared chunks stay, credited to a document that still holds them
+        shared_ids = list(shared)
+        await self._replace(
+            self.text_chunks,
+            {
+                k: {**v, "full_doc_id": shared[k]["doc_ids"][0]}
+                for k, v in zip(
+                    shared_ids, await self.text_chunks.get_by_ids(shared_ids) or []
+                )
+                if v is not None and v["full_doc_id"] == doc_id
+            },
+        )
+        return released
+
+    async def _ensure_doc_index(self):
+        """Index the chunks of documents stored before every chunk of a
+        document was recorded, so that deleting them can't strand or remove
+        a chunk another document shares. The marker it leaves in doc_chunks
+        spares later processes the scan.
+        """
+        if self._doc_index_checked or self.chunk_docs is None:
+            return
+        self._doc_index_checked = True
+        if await self.doc_chunks.get_by_id(DOC_INDEX_MARKER) is not None:
+            return
+        doc_ids = await self.full_docs.all_keys()
+        if await self.chunk_docs.all_keys():
+            indexed = set(await self.doc_chunks.all_keys())
+            doc_ids = [k for k in doc_ids if k not in indexed]
+        if doc_ids:
+            await self._index_legacy_docs(doc_ids)
+        await self.doc_chunks.upsert({DOC_INDEX_MARKER: {"chunk_ids": []}})
+        await asyncio.gather(
+            self.doc_chunks.index_done_callback(),
+            self.chunk_docs.index_done_callback(),
+        )
+
+    async def _index_legacy_docs(self, doc_ids: list[str]):
+        logger.info(f"Indexing the chunks of {len(doc_ids)} documents")
+        doc_chunk_ids = {k: set() for k in doc_ids}
+        for doc_id, entry in zip(doc_ids, await self.doc_chunks.get_by_ids(doc_ids)):
+            if entry is not None:
+                doc_chunk_ids[doc_id].update(entry["chunk_ids"])
+        chunk_keys = await self.text_chunks.all_keys()
+        for chunk_id, chunk in zip(
+            chunk_keys,
+            await self.text_chunks.get_by_ids(chunk_keys, fields={"full_doc_id"}),
+        ):
+            if chunk is not None and chunk["full_doc_id"] in doc_chunk_ids:
+                doc_chunk_ids[chunk["full_doc_id"]].add(chunk_id)
+        # chunks shared with an earlier document are credited to that one
+        # only, chunking the content again finds them
+        chunk_key_set = set(chunk_keys)
+        for doc_id, doc in zip(doc_ids, await self.full_docs.get_by_ids(doc_ids)):
+            if doc is not None:
+                doc_chunk_ids[doc_id].update(
+                    k
+                    for k in self._chunk_doc(doc_id, doc["content"])
+                    if k in chunk_key_set
+                )
+        await self._add_chunk_owners({k: sorted(v) for k, v in doc_chunk_ids.items()})
+
+    def delete_by_doc(self, doc_id: str):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.adelete_by_doc(doc_id))
+
+    @priority_scope("extraction")
+    async def adelete_by_doc(self, doc_id: str):
+        """Delete a document, its chunks and whatever was extracted only from
+        them, re-summarising the entities and relations it shared with others
+        """
+        self._check_deletable()
+        await self._ensure_doc_index()
+        doc_index = await self.doc_chunks.get_by_id(doc_id)
+        if doc_index is None:
+            logger.warning(f"Document {doc_id} is not in the document index")
+            return
+        try:
+            await self._delete_chunks(
+                await self._release_chunks(doc_id, doc_index["chunk_ids"])
+            )
+            await self.full_docs.delete([doc_id])
+            await self.doc_chunks.delete([doc_id])
+            logger.info(f"Document {doc_id} has been deleted.")
+        finally:
+            await self._insert_done()
+
+    def update_doc(self, doc_id: str, content: str):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.aupdate_doc(doc_id, content))
+
+    @priority_scope("extraction")
+    async def aupdate_doc(self, doc_id: str, content: str) -> Union[str, None]:
+        """Replace a document with new content and return its new id. Only the
+        chunks that changed are removed or extracted again.
+        """
+        self._check_deletable()
+        await self._ensure_doc_index()
+        doc_index = await self.doc_chunks.get_by_id(doc_id)
+        if doc_index is None:
+            logger.warning(f"Document {doc_id} is not in the document index")
+            return None
+        content = content.strip()
+        new_doc_id = compute_mdhash_id(content, prefix="doc-")
+        if new_doc_id == doc_id:
+            logger.info(f"Document {doc_id} is unchanged")
+            return doc_id
+
+        chunks = self._chunk_doc(new_doc_id, content)
+        old_chunk_ids = set(doc_index["chunk_ids"])
+        kept_chunk_ids = [k for k in chunks if k in old_chunk_ids]
+        removed_chunk_ids = [k for k in old_chunk_ids if k not in chunks]
+        _add_chunk_keys = await self.text_chunks.filter_keys(
+            [k for k in chunks if k not in old_chunk_ids]
+        )
+        inserting_chunks = {k: v for k, v in chunks.items() if k in _add_chunk_keys}
+        logger.info(
+            f"[Update Doc] keeping {len(kept_chunk_ids)} chunks, removing "
+            f"{len(removed_chunk_ids)}, inserting {len(inserting_chunks)}"
+        )
+        try:
+            released_chunk_ids = await self._release_chunks(doc_id, list(old_chunk_ids))
+            await self._delete_chunks(
+                [k for k in released_chunk_ids if k not in chunks]
+            )
+            if inserting_chunks:
+                await self._insert_chunks(inserting_chunks)
+            # kept chunks move to the new document
+            await self.text_chunks.delete(kept_chunk_ids)
+            await self.text_chunks.upsert(
+                {**{k: chunks[k] for k in kept_chunk_ids}, **inserting_chunks}
+            )
+            await self.full_docs.delete([doc_id])
+            await self.full_docs.upsert({new_doc_id: {"content": content}})
+            await self.doc_chunks.delete([doc_id])
+            await self._add_chunk_owners({new_doc_id: list(chunks)})
+        finally:
+            await self._insert_done()
+        return new_doc_id
+
     async def _insert_done(self):
         tasks = []
         for storage_inst in [
             self.full_docs,
             self.text_chunks,
+            self.doc_chunks,
+            self.chunk_docs,
+            self.chunk_extractions,
             self.llm_response_cache,
+            self.embedding_cache,
             self.entities_vdb,
             self.relationships_vdb,
             self.chunks_vdb,
@@ -305,13 +754,33 @@ class LightRAG:
             if storage_inst is None:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
+        if self.semantic_cache is not None:
+            tasks.append(self.semantic_cache.invalidate())
         await asyncio.gather(*tasks)
 
     def query(self, query: str, param: QueryParam = QueryParam()):
         loop = always_get_an_event_loop()
         return loop.run_until_complete(self.aquery(query, param))
 
+    @priority_scope("query")
     async def aquery(self, query: str, param: QueryParam = QueryParam()):
+        use_semantic_cache = (
+            self.semantic_cache is not None and not param.only_need_context
+        )
+        if use_semantic_cache:
+            cached_response, query_embedding = await self.semantic_cache.lookup(
+                query, param
+            )
+            if cached_response is not None:
+                if param.stream:
+                    return self._stream_answer(cached_response)
+                return cached_response
+
+        stream = param.stream and not param.only_need_context
+        if stream and not self._llm_streams:
+            # the answer is generated whole and handed out as a single chunk
+            param = replace(param, stream=False)
+
         if param.mode == "local":
             response = await local_query(
                 query,
@@ -321,6 +790,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "global":
             response = await global_query(
@@ -331,6 +801,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "hybrid":
             response = await hybrid_query(
@@ -341,6 +812,7 @@ class LightRAG:
                 self.text_chunks,
                 param,
                 asdict(self),
+                keywords_cache=self.keywords_cache,
             )
         elif param.mode == "naive":
             response = await naive_query(
@@ -352,14 +824,77 @@ class LightRAG:
             )
         else:
             raise ValueError(f"Unknown mode {param.mode}")
-        await self._query_done()
+
+        async def on_complete(response: str):
+            if use_semantic_cache and response != PROMPTS["fail_response"]:
+                await self.semantic_cache.upsert(
+                    query, query_embedding, param, response
+                )
+            await self._query_done()
+
+        if stream:
+            return self._stream_answer(response, on_complete)
+        await on_complete(response)
         return response
 
+    async def _stream_answer(
+        self,
+        response: Union[str, AsyncIterator[str]],
+        on_complete: Callable[[str], Awaitable[None]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield an answer chunk by chunk; answers that are already complete,
+        e.g. cache hits or the fail response, come as a single chunk"""
+        if isinstance(response, str):
+            chunks = [response]
+            yield response
+        else:
+            chunks = []
+            try:
+                async for chunk in response:
+                    chunks.append(chunk)
+                    yield chunk
+            finally:
+                # hands the model call's slot back when the reader stops early
+                aclose = getattr(response, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+        if on_complete is not None:
+            await on_complete("".join(chunks))
+
+    def scheduler_stats(self) -> dict[str, dict]:
+        """Queue depth and wait times per priority class of the LLM and
+        embedding limiters"""
+        return {
+            "llm": self._llm_limiter.stats(),
+            "embedding": self._embedding_limiter.stats(),
+        }
+
+    def cache_stats(self) -> dict[str, dict]:
+        """Size and hit rate of the keywords cache and, when bounded, the LLM
+        response cache"""
+        return {
+            name: cache.stats()
+            for name, cache in [
+                ("keywords", self.keywords_cache),
+                ("llm_response", self.llm_response_cache),
+            ]
+            if isinstance(cache, BoundedKVStorage)
+        }
+
     async def _query_done(self):
         tasks = []
-        for storage_inst in [self.llm_response_cache]:
+        for storage_inst in [
+            self.llm_response_cache,
+            self.keywords_cache,
+            self.semantic_cache,
+            self.embedding_cache,
+        ]:
             if storage_inst is None:
                 continue
+            if isinstance(storage_inst, BoundedKVStorage):
+                # saves its access metadata on a timer
+                tasks.append(storage_inst.query_done_callback())
+                continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
         await asyncio.gather(*tasks)
 
@@ -368,19 +903,27 @@ class LightRAG:
         return loop.run_until_complete(self.adelete_by_entity(entity_name))
 
     async def adelete_by_entity(self, entity_name: str):
-        entity_name = f'"{entity_name.upper()}"'
+        await self.adelete_by_entities([entity_name])
+
+    def delete_by_entities(self, entity_names: list[str]):
+        loop = always_get_an_event_loop()
+        return loop.run_until_complete(self.adelete_by_entities(entity_names))
+
+    async def adelete_by_entities(self, entity_names: list[str]):
+        entity_names = [f'"{entity_name.upper()}"' for entity_name in entity_names]
 
         try:
-            await self.entities_vdb.delete_entity(entity_name)
-            await self.relationships_vdb.delete_relation(entity_name)
-            await self.chunk_entity_relation_graph.delete_node(entity_name)
+            await self.entities_vdb.delete_entities(entity_names)
+            await self.relationships_vdb.delete_entities(entity_names)
+            for entity_name in entity_names:
+                await self.chunk_entity_relation_graph.delete_node(entity_name)
 
             logger.info(
-                f"Entity '{entity_name}' and its relationships have been deleted."
+                f"Entities {entity_names} and their relationships have been deleted."
             )
             await self._delete_by_entity_done()
         except Exception as e:
-            logger.error(f"Error while deleting entity '{entity_name}': {e}")
+            logger.error(f"Error while deleting entities {entity_names}: {e}")
 
     async def _delete_by_entity_done(self):
         tasks = []
@@ -392,4 +935,6 @@ class LightRAG:
             if storage_inst is None:
                 continue
             tasks.append(cast(StorageNameSpace, storage_inst).index_done_callback())
+        if self.semantic_cache is not None:
+            tasks.append(self.semantic_cache.invalidate())
         await asyncio.gather(*tasks)
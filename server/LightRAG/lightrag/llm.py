@@ -4,17 +4,14 @@ import json
 import os
 import struct
 from functools import lru_cache
-from typing import Any, Callable, Dict, List
+from typing import Any, AsyncIterator, Callable, Dict, List
 
 import aioboto3
-import aiohttp
 import numpy as np
 import ollama
 import torch
 from openai import (
     APIConnectionError,
-    AsyncAzureOpenAI,
-    AsyncOpenAI,
     RateLimitError,
     Timeout,
 )
@@ -28,11 +25,40 @@ from tenacity import (
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
 from .base import BaseKVStorage
-from .utils import compute_args_hash, wrap_embedding_func_with_attrs
+from .clients import http_clients
+from .utils import (
+    RateLimiter,
+    compute_args_hash,
+    count_message_tokens,
+    streaming_model_func,
+    wrap_embedding_func_with_attrs,
+)
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
+async def _stream_openai_response(
+    response, hashing_kv: BaseKVStorage, model: str, messages: list[dict]
+) -> AsyncIterator[str]:
+    """Yield the text deltas of a streamed chat completion and cache the full
+    answer once the stream is complete"""
+    chunks = []
+    async for chunk in response:
+        if chunk.choices and chunk.choices[0].delta.content:
+            chunks.append(chunk.choices[0].delta.content)
+            yield chunks[-1]
+    if hashing_kv is not None:
+        await hashing_kv.upsert(
+            {
+                compute_args_hash(model, messages): {
+                    "return": "".join(chunks),
+                    "model": model,
+                }
+            }
+        )
+
+
+@streaming_model_func
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -50,10 +76,11 @@ async def openai_complete_if_cache(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
+    openai_async_client = http_clients.openai_client(
+        base_url=base_url, api_key=os.getenv("OPENAI_API_KEY")
     )
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -65,10 +92,20 @@ async def openai_complete_if_cache(
         if if_cache_return is not None:
             return if_cache_return["return"]
 
-    response = await openai_async_client.chat.completions.create(
-        model=model, messages=messages, **kwargs
-    )
+    create = openai_async_client.chat.completions.create
+    if rate_limiter is not None:
+        response = await rate_limiter.call(
+            count_message_tokens(messages, kwargs.get("max_tokens")),
+            create,
+            model=model,
+            messages=messages,
+            **kwargs,
+        )
+    else:
+        response = await create(model=model, messages=messages, **kwargs)
 
+    if kwargs.get("stream"):
+        return _stream_openai_response(response, hashing_kv, model, messages)
     if hashing_kv is not None:
         await hashing_kv.upsert(
             {args_hash: {"return": response.choices[0].message.content, "model": model}}
@@ -76,6 +113,7 @@ async def openai_complete_if_cache(
     return response.choices[0].message.content
 
 
+@streaming_model_func
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -95,13 +133,14 @@ async def azure_openai_complete_if_cache(
     if base_url:
         os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
 
-    openai_async_client = AsyncAzureOpenAI(
+    openai_async_client = http_clients.azure_openai_client(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
     )
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -114,10 +153,20 @@ async def azure_openai_complete_if_cache(
         if if_cache_return is not None:
             return if_cache_return["return"]
 
-    response = await openai_async_client.chat.completions.create(
-        model=model, messages=messages, **kwargs
-    )
+    create = openai_async_client.chat.completions.create
+    if rate_limiter is not None:
+        response = await rate_limiter.call(
+            count_message_tokens(messages, kwargs.get("max_tokens")),
+            create,
+            model=model,
+            messages=messages,
+            **kwargs,
+        )
+    else:
+        response = await create(model=model, messages=messages, **kwargs)
 
+    if kwargs.get("stream"):
+        return _stream_openai_response(response, hashing_kv, model, messages)
     if hashing_kv is not None:
         await hashing_kv.upsert(
             {args_hash: {"return": response.choices[0].message.content, "model": model}}
@@ -187,6 +236,7 @@ async def bedrock_complete_if_cache(
             )
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     if hashing_kv is not None:
         args_hash = compute_args_hash(model, messages)
         if_cache_return = await hashing_kv.get_by_id(args_hash)
@@ -197,7 +247,22 @@ async def bedrock_complete_if_cache(
     session = aioboto3.Session()
     async with session.client("bedrock-runtime") as bedrock_async_client:
         try:
-            response = await bedrock_async_client.converse(**args, **kwargs)
+            if rate_limiter is not None:
+                response = await rate_limiter.call(
+                    count_message_tokens(
+                        [
+                            {"content": system_prompt or ""},
+                            *history_messages,
+                            {"content": prompt},
+                        ],
+                        args.get("inferenceConfig", {}).get("maxTokens"),
+                    ),
+                    bedrock_async_client.converse,
+                    **args,
+                    **kwargs,
+                )
+            else:
+                response = await bedrock_async_client.converse(**args, **kwargs)
         except Exception as e:
             raise BedrockError(e)
 
@@ -234,6 +299,7 @@ async def hf_model_if_cache(
     model_name = model
     hf_model, hf_tokenizer = initialize_hf_model(model_name)
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
@@ -278,6 +344,8 @@ async def hf_model_if_cache(
                     + ">\n"
                 )
 
+    if rate_limiter is not None:
+        await rate_limiter.acquire(count_message_tokens(messages, 512))
     input_ids = hf_tokenizer(
         input_prompt, return_tensors="pt", padding=True, truncation=True
     ).to("cuda")
@@ -296,7 +364,7 @@ async def hf_model_if_cache(
 async def ollama_model_if_cache(
     model, prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
-    kwargs.pop("max_tokens", None)
+    max_tokens = kwargs.pop("max_tokens", None)
     kwargs.pop("response_format", None)
     host = kwargs.pop("host", None)
     timeout = kwargs.pop("timeout", None)
@@ -307,6 +375,7 @@ async def ollama_model_if_cache(
         messages.append({"role": "system", "content": system_prompt})
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
     if hashing_kv is not None:
@@ -315,7 +384,16 @@ async def ollama_model_if_cache(
         if if_cache_return is not None:
             return if_cache_return["return"]
 
-    response = await ollama_client.chat(model=model, messages=messages, **kwargs)
+    if rate_limiter is not None:
+        response = await rate_limiter.call(
+            count_message_tokens(messages, max_tokens),
+            ollama_client.chat,
+            model=model,
+            messages=messages,
+            **kwargs,
+        )
+    else:
+        response = await ollama_client.chat(model=model, messages=messages, **kwargs)
 
     result = response["message"]["content"]
 
@@ -425,6 +503,7 @@ async def lmdeploy_model_if_cache(
         messages.append({"role": "system", "content": system_prompt})
 
     hashing_kv: BaseKVStorage = kwargs.pop("hashing_kv", None)
+    rate_limiter: RateLimiter = kwargs.pop("rate_limiter", None)
     messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
     if hashing_kv is not None:
@@ -433,6 +512,8 @@ async def lmdeploy_model_if_cache(
         if if_cache_return is not None:
             return if_cache_return["return"]
 
+    if rate_limiter is not None:
+        await rate_limiter.acquire(count_message_tokens(messages, max_new_tokens))
     gen_config = GenerationConfig(
         skip_special_tokens=skip_special_tokens,
         max_new_tokens=max_new_tokens,
@@ -454,6 +535,7 @@ async def lmdeploy_model_if_cache(
     return response
 
 
+@streaming_model_func
 async def gpt_4o_complete(
     prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
@@ -466,6 +548,7 @@ async def gpt_4o_complete(
     )
 
 
+@streaming_model_func
 async def gpt_4o_mini_complete(
     prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
@@ -478,6 +561,7 @@ async def gpt_4o_mini_complete(
     )
 
 
+@streaming_model_func
 async def azure_openai_complete(
     prompt, system_prompt=None, history_messages=[], **kwargs
 ) -> str:
@@ -543,8 +627,8 @@ async def openai_embedding(
     if api_key:
         os.environ["OPENAI_API_KEY"] = api_key
 
-    openai_async_client = (
-        AsyncOpenAI() if base_url is None else AsyncOpenAI(base_url=base_url)
+    openai_async_client = http_clients.openai_client(
+        base_url=base_url, api_key=os.getenv("OPENAI_API_KEY")
     )
     response = await openai_async_client.embeddings.create(
         model=model, input=texts, encoding_format="float"
@@ -569,7 +653,7 @@ async def azure_openai_embedding(
     if base_url:
         os.environ["AZURE_OPENAI_ENDPOINT"] = base_url
 
-    openai_async_client = AsyncAzureOpenAI(
+    openai_async_client = http_clients.azure_openai_client(
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
         api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
@@ -603,12 +687,12 @@ async def siliconcloud_embedding(
     payload = {"model": model, "input": truncate_texts, "encoding_format": "base64"}
 
     base64_strings = []
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url, headers=headers, json=payload) as response:
-            content = await response.json()
-            if "code" in content:
-                raise ValueError(content)
-            base64_strings = [item["embedding"] for item in content["data"]]
+    session = http_clients.aiohttp_session("siliconcloud", base_url, api_key)
+    async with session.post(base_url, headers=headers, json=payload) as response:
+        content = await response.json()
+        if "code" in content:
+            raise ValueError(content)
+        base64_strings = [item["embedding"] for item in content["data"]]
 
     embeddings = []
     for string in base64_strings:
@@ -1,9 +1,11 @@
 import asyncio
 import json
 import re
+import time
 import warnings
 from collections import Counter, defaultdict
-from typing import Union
+from typing import AsyncIterator, Union
+from weakref import WeakKeyDictionary
 
 from .base import (
     BaseGraphStorage,
@@ -22,7 +24,9 @@ from .utils import (
     list_of_list_to_csv,
     locate_json_string_body_from_string,
     logger,
+    normalize_query,
     pack_user_ass_to_openai_messages,
+    priority_scope,
     process_combine_contexts,
     split_string_by_multi_markers,
     truncate_list_by_token_size,
@@ -50,6 +54,7 @@ def chunking_by_token_size(
     return results
 
 
+@priority_scope("summary")
 async def _handle_entity_relation_summary(
     entity_or_relation_name: str,
     description: str,
@@ -124,17 +129,16 @@ async def _handle_single_relationship_extraction(
     )
 
 
-async def _merge_nodes_then_upsert(
+async def _merge_nodes(
     entity_name: str,
     nodes_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
+    already_node: Union[dict, None],
     global_config: dict,
 ):
     already_entitiy_types = []
     already_source_ids = []
     already_description = []
 
-    already_node = await knowledge_graph_inst.get_node(entity_name)
     if already_node is not None:
         already_entitiy_types.append(already_node["entity_type"])
         already_source_ids.extend(
@@ -158,24 +162,19 @@ async def _merge_nodes_then_upsert(
     description = await _handle_entity_relation_summary(
         entity_name, description, global_config
     )
-    node_data = dict(
+    return dict(
+        entity_name=entity_name,
         entity_type=entity_type,
         description=description,
         source_id=source_id,
     )
-    await knowledge_graph_inst.upsert_node(
-        entity_name,
-        node_data=node_data,
-    )
-    node_data["entity_name"] = entity_name
-    return node_data
 
 
-async def _merge_edges_then_upsert(
+async def _merge_edges(
     src_id: str,
     tgt_id: str,
     edges_data: list[dict],
-    knowledge_graph_inst: BaseGraphStorage,
+    already_edge: Union[dict, None],
     global_config: dict,
 ):
     already_weights = []
@@ -183,8 +182,7 @@ async def _merge_edges_then_upsert(
     already_description = []
     already_keywords = []
 
-    if await knowledge_graph_inst.has_edge(src_id, tgt_id):
-        already_edge = await knowledge_graph_inst.get_edge(src_id, tgt_id)
+    if already_edge is not None:
         already_weights.append(already_edge["weight"])
         already_source_ids.extend(
             split_string_by_multi_markers(already_edge["source_id"], [GRAPH_FIELD_SEP])
@@ -204,39 +202,25 @@ async def _merge_edges_then_upsert(
     source_id = GRAPH_FIELD_SEP.join(
         set([dp["source_id"] for dp in edges_data] + already_source_ids)
     )
-    for need_insert_id in [src_id, tgt_id]:
-        if not (await knowledge_graph_inst.has_node(need_insert_id)):
-            await knowledge_graph_inst.upsert_node(
-                need_insert_id,
-                node_data={
-                    "source_id": source_id,
-                    "description": description,
-                    "entity_type": '"UNKNOWN"',
-                },
-            )
+    # placeholder for an endpoint that was never extracted as an entity
+    endpoint_node_data = {
+        "source_id": source_id,
+        "description": description,
+        "entity_type": '"UNKNOWN"',
+    }
     description = await _handle_entity_relation_summary(
         (src_id, tgt_id), description, global_config
     )
-    await knowledge_graph_inst.upsert_edge(
-        src_id,
-        tgt_id,
-        edge_data=dict(
-            weight=weight,
-            description=description,
-            keywords=keywords,
-            source_id=source_id,
-        ),
-    )
-
-    edge_data = dict(
+    return dict(
         src_id=src_id,
         tgt_id=tgt_id,
+        weight=weight,
         description=description,
         keywords=keywords,
+        source_id=source_id,
+        endpoint_node_data=endpoint_node_data,
     )
 
-    return edge_data
-
 
 async def extract_entities(
     chunks: dict[str, TextChunkSchema],
@@ -244,6 +228,7 @@ async def extract_entities(
     entity_vdb: BaseVectorStorage,
     relationships_vdb: BaseVectorStorage,
     global_config: dict,
+    chunk_extractions: BaseKVStorage = None,
 ) -> Union[BaseGraphStorage, None]:
     use_llm_func: callable = global_config["llm_model_func"]
     entity_extract_max_gleaning = global_config["entity_extract_max_gleaning"]
@@ -342,18 +327,61 @@ async def extract_entities(
             maybe_nodes[k].extend(v)
         for k, v in m_edges.items():
             maybe_edges[tuple(sorted(k))].extend(v)
+
+    # read everything the merge depends on up front, then write the whole
+    # batch back with the bulk upserts
+    already_nodes, already_edges = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(list(maybe_nodes)),
+        knowledge_graph_inst.get_edges(list(maybe_edges)),
+    )
     all_entities_data = await asyncio.gather(
         *[
-            _merge_nodes_then_upsert(k, v, knowledge_graph_inst, global_config)
-            for k, v in maybe_nodes.items()
+            _merge_nodes(k, v, already_node, global_config)
+            for (k, v), already_node in zip(maybe_nodes.items(), already_nodes)
         ]
     )
+    await knowledge_graph_inst.upsert_nodes(
+        {
+            dp["entity_name"]: {k: v for k, v in dp.items() if k != "entity_name"}
+            for dp in all_entities_data
+        }
+    )
+
     all_relationships_data = await asyncio.gather(
         *[
-            _merge_edges_then_upsert(k[0], k[1], v, knowledge_graph_inst, global_config)
-            for k, v in maybe_edges.items()
+            _merge_edges(k[0], k[1], v, already_edge, global_config)
+            for (k, v), already_edge in zip(maybe_edges.items(), already_edges)
         ]
     )
+    missing_endpoints = {}
+    for dp in all_relationships_data:
+        for need_insert_id in [dp["src_id"], dp["tgt_id"]]:
+            if need_insert_id not in maybe_nodes:
+                missing_endpoints.setdefault(need_insert_id, dp["endpoint_node_data"])
+    if missing_endpoints:
+        existing_endpoints = await knowledge_graph_inst.get_nodes(
+            list(missing_endpoints)
+        )
+        await knowledge_graph_inst.upsert_nodes(
+            {
+                k: v
+                for (k, v), existing in zip(
+                    missing_endpoints.items(), existing_endpoints
+                )
+                if existing is None
+            }
+        )
+    await knowledge_graph_inst.upsert_edges(
+        {
+            (dp["src_id"], dp["tgt_id"]): dict(
+                weight=dp["weight"],
+                description=dp["description"],
+                keywords=dp["keywords"],
+                source_id=dp["source_id"],
+            )
+            for dp in all_relationships_data
+        }
+    )
     if not len(all_entities_data):
         logger.warning("Didn't extract any entities, maybe your LLM is not working")
         return None
@@ -387,30 +415,309 @@ async def extract_entities(
         }
         await relationships_vdb.upsert(data_for_vdb)
 
+    if chunk_extractions is not None:
+        # raw records per chunk, so that removing a chunk later can rebuild
+        # the entities and relations it touched from the remaining ones
+        await chunk_extractions.upsert(
+            {
+                chunk_key: {
+                    "entities": [dp for v in m_nodes.values() for dp in v],
+                    "relationships": [dp for v in m_edges.values() for dp in v],
+                }
+                for (chunk_key, _), (m_nodes, m_edges) in zip(ordered_chunks, results)
+            }
+        )
+
     return knowledge_graph_inst
 
 
-async def local_query(
-    query,
+def _trim_fragments(value: str, removed: set[str]) -> str:
+    return GRAPH_FIELD_SEP.join(
+        dp
+        for dp in split_string_by_multi_markers(value, [GRAPH_FIELD_SEP])
+        if dp not in removed
+    )
+
+
+async def remove_chunks_from_graph(
+    chunk_ids: list[str],
     knowledge_graph_inst: BaseGraphStorage,
-    entities_vdb: BaseVectorStorage,
+    entity_vdb: BaseVectorStorage,
     relationships_vdb: BaseVectorStorage,
-    text_chunks_db: BaseKVStorage[TextChunkSchema],
-    query_param: QueryParam,
+    chunk_extractions: BaseKVStorage,
     global_config: dict,
-) -> str:
-    context = None
-    use_model_func = global_config["llm_model_func"]
+):
+    """Take ``chunk_ids`` out of the ``source_id`` of every entity and relation
+    extracted from them. Those left without a source are deleted, the others
+    are rebuilt from the extraction records of their remaining chunks, or
+    have the removed description fragments trimmed when some of those chunks
+    predate the records. Chunks without a record of their own are looked up
+    in the graph by ``source_id``.
+    """
+    removed_chunk_ids = set(chunk_ids)
+    removed_nodes_data = defaultdict(list)
+    removed_edges_data = defaultdict(list)
+    unrecorded_chunk_ids = []
+    for chunk_id, extraction in zip(
+        chunk_ids, await chunk_extractions.get_by_ids(chunk_ids)
+    ):
+        if extraction is None:
+            unrecorded_chunk_ids.append(chunk_id)
+            continue
+        for dp in extraction["entities"]:
+            removed_nodes_data[dp["entity_name"]].append(dp)
+        for dp in extraction["relationships"]:
+            edge_key = tuple(sorted((dp["src_id"], dp["tgt_id"])))
+            removed_edges_data[edge_key].append(dp)
+            # endpoints that were never extracted got their data from the edge
+            for endpoint in edge_key:
+                removed_nodes_data.setdefault(endpoint, [])
+    if unrecorded_chunk_ids:
+        try:
+            node_names, edge_pairs = await knowledge_graph_inst.get_by_source_ids(
+                unrecorded_chunk_ids
+            )
+        except NotImplementedError:
+            logger.warning(
+                f"No extraction records found for {len(unrecorded_chunk_ids)} "
+                "chunks, their entities and relations are kept"
+            )
+        else:
+            for entity_name in node_names:
+                removed_nodes_data.setdefault(entity_name, [])
+            for edge_pair in edge_pairs:
+                removed_edges_data.setdefault(tuple(sorted(edge_pair)), [])
+    if not removed_nodes_data:
+        return
+
+    node_names = list(removed_nodes_data)
+    edge_pairs = list(removed_edges_data)
+    already_nodes, already_edges = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(node_names),
+        knowledge_graph_inst.get_edges(edge_pairs),
+    )
+
+    def _remaining_source_ids(data: dict) -> list[str]:
+        return [
+            c
+            for c in split_string_by_multi_markers(data["source_id"], [GRAPH_FIELD_SEP])
+            if c not in removed_chunk_ids
+        ]
+
+    remaining_chunk_ids = {
+        c
+        for data in already_nodes + already_edges
+        if data is not None
+        for c in _remaining_source_ids(data)
+    }
+    remaining_nodes_data = defaultdict(list)
+    remaining_edges_data = defaultdict(list)
+    covered_chunk_ids = set()
+    for chunk_id, extraction in zip(
+        remaining_chunk_ids,
+        await chunk_extractions.get_by_ids(list(remaining_chunk_ids)),
+    ):
+        if extraction is None:
+            continue
+        covered_chunk_ids.add(chunk_id)
+        for dp in extraction["entities"]:
+            if dp["entity_name"] in removed_nodes_data:
+                remaining_nodes_data[dp["entity_name"]].append(dp)
+        for dp in extraction["relationships"]:
+            edge_key = tuple(sorted((dp["src_id"], dp["tgt_id"])))
+            if edge_key in removed_edges_data:
+                remaining_edges_data[edge_key].append(dp)
+
+    deleted_nodes = []
+    rebuilt_nodes = []
+    updated_nodes = {}
+    for entity_name, already_node in zip(node_names, already_nodes):
+        if already_node is None:
+            continue
+        source_ids = _remaining_source_ids(already_node)
+        if not source_ids:
+            deleted_nodes.append(entity_name)
+        elif remaining_nodes_data[entity_name] and covered_chunk_ids.issuperset(
+            source_ids
+        ):
+            rebuilt_nodes.append(entity_name)
+        else:
+            removed_descriptions = {
+                dp["description"] for dp in removed_nodes_data[entity_name]
+            } | {
+                dp["description"]
+                for edge_key, v in removed_edges_data.items()
+                if entity_name in edge_key
+                for dp in v
+            }
+            updated_nodes[entity_name] = {
+                **already_node,
+                "description": _trim_fragments(
+                    already_node["description"], removed_descriptions
+                ),
+                "source_id": GRAPH_FIELD_SEP.join(source_ids),
+            }
+    for dp in await asyncio.gather(
+        *[
+            _merge_nodes(k, remaining_nodes_data[k], None, global_config)
+            for k in rebuilt_nodes
+        ]
+    ):
+        updated_nodes[dp["entity_name"]] = {
+            k: v for k, v in dp.items() if k != "entity_name"
+        }
+
+    deleted_edges = []
+    rebuilt_edges = []
+    updated_edges = {}
+    for edge_key, already_edge in zip(edge_pairs, already_edges):
+        if already_edge is None or set(edge_key) & set(deleted_nodes):
+            continue
+        source_ids = _remaining_source_ids(already_edge)
+        if not source_ids:
+            deleted_edges.append(edge_key)
+        elif remaining_edges_data[edge_key] and covered_chunk_ids.issuperset(
+            source_ids
+        ):
+            rebuilt_edges.append(edge_key)
+        else:
+            removed_edges = removed_edges_data[edge_key]
+            updated_edges[edge_key] = {
+                **already_edge,
+                "weight": already_edge["weight"]
+                - sum(dp["weight"] for dp in removed_edges),
+                "description": _trim_fragments(
+                    already_edge["description"],
+                    {dp["description"] for dp in removed_edges},
+                ),
+                "source_id": GRAPH_FIELD_SEP.join(source_ids),
+            }
+    for dp in await asyncio.gather(
+        *[
+            _merge_edges(k[0], k[1], remaining_edges_data[k], None, global_config)
+            for k in rebuilt_edges
+        ]
+    ):
+        updated_edges[(dp["src_id"], dp["tgt_id"])] = dict(
+            weight=dp["weight"],
+            description=dp["description"],
+            keywords=dp["keywords"],
+            source_id=dp["source_id"],
+        )
+
+    for src_id, tgt_id in deleted_edges:
+        await knowledge_graph_inst.delete_edge(src_id, tgt_id)
+    for entity_name in deleted_nodes:
+        await knowledge_graph_inst.delete_node(entity_name)
+    await knowledge_graph_inst.upsert_nodes(updated_nodes)
+    await knowledge_graph_inst.upsert_edges(updated_edges)
+
+    if entity_vdb is not None:
+        if deleted_nodes:
+            await entity_vdb.delete_entities(deleted_nodes)
+        if updated_nodes:
+            await entity_vdb.upsert(
+                {
+                    compute_mdhash_id(k, prefix="ent-"): {
+                        "content": k + v["description"],
+                        "entity_name": k,
+                    }
+                    for k, v in updated_nodes.items()
+                }
+            )
+    if relationships_vdb is not None:
+        if deleted_nodes:
+            await relationships_vdb.delete_entities(deleted_nodes)
+        if deleted_edges:
+            await relationships_vdb.delete(
+                [
+                    compute_mdhash_id(src + tgt, prefix="rel-")
+                    for src, tgt in deleted_edges
+                ]
+            )
+        if updated_edges:
+            await relationships_vdb.upsert(
+                {
+                    compute_mdhash_id(src + tgt, prefix="rel-"): {
+                        "src_id": src,
+                        "tgt_id": tgt,
+                        "content": v["keywords"] + src + tgt + v["description"],
+                    }
+                    for (src, tgt), v in updated_edges.items()
+                }
+            )
+    logger.info(
+        f"Removed {len(chunk_ids)} chunks: deleted {len(deleted_nodes)} entities "
+        f"and {len(deleted_edges)} relations, updated {len(updated_nodes)} entities "
+        f"({len(rebuilt_nodes)} rebuilt) and {len(updated_edges)} relations "
+        f"({len(rebuilt_edges)} rebuilt)"
+    )
+
+
+# lookups waiting to share a query_many call, per event loop and (vdb, top_k)
+_pending_lookups: WeakKeyDictionary[asyncio.AbstractEventLoop, dict] = (
+    WeakKeyDictionary()
+)
+
+
+async def _query_vdb(vdb: BaseVectorStorage, query: str, top_k: int) -> list[dict]:
+    """``vdb.query`` that shares one ``vdb.query_many`` call, so one embedding
+    request and one scan, with the other lookups on the same ``vdb`` and
+    ``top_k`` issued in the same loop iteration, e.g. by the concurrent
+    queries of a batch evaluation
+    """
+    loop = asyncio.get_running_loop()
+    pending = _pending_lookups.setdefault(loop, {})
+    key = (id(vdb), top_k)
+    future = loop.create_future()
+    if key in pending:
+        pending[key].append((query, future))
+        results = await future
+        # None when the shared call failed; try again on our own
+        return results if results is not None else await vdb.query(query, top_k)
+
+    # the first lookup runs the call once the others had a chance to join
+    batch = pending[key] = [(query, future)]
+    try:
+        try:
+            await asyncio.sleep(0)
+        finally:
+            del pending[key]
+        if len(batch) == 1:
+            return await vdb.query(query, top_k)
+        all_results = await vdb.query_many([q for q, _ in batch], top_k=top_k)
+    except BaseException as e:
+        for _, other_future in batch[1:]:
+            if not other_future.done():
+                other_future.set_result(None)
+        if len(batch) == 1 or not isinstance(e, Exception):
+            raise
+        logger.warning(f"Merged lookups on {vdb.namespace} failed, retrying alone: {e}")
+        return await vdb.query(query, top_k)
+    for (_, other_future), results in zip(batch[1:], all_results[1:]):
+        if not other_future.done():
+            other_future.set_result(results)
+    logger.debug(f"Merged {len(batch)} lookups on {vdb.namespace}")
+    return all_results[0]
+
+
+async def _get_keywords(
+    query: str, use_model_func: callable, keywords_cache: BaseKVStorage = None
+) -> Union[dict, None]:
+    """High and low level keywords of ``query``, or None when the model output
+    cannot be parsed. Results are cached under the normalized query."""
+    if keywords_cache is not None:
+        cache_key = compute_mdhash_id(normalize_query(query), prefix="kw-")
+        cached = await keywords_cache.get_by_id(cache_key)
+        if cached is not None:
+            return cached
 
     kw_prompt_temp = PROMPTS["keywords_extraction"]
     kw_prompt = kw_prompt_temp.format(query=query)
     result = await use_model_func(kw_prompt)
     json_text = locate_json_string_body_from_string(result)
-
     try:
         keywords_data = json.loads(json_text)
-        keywords = keywords_data.get("low_level_keywords", [])
-        keywords = ", ".join(keywords)
     except json.JSONDecodeError:
         try:
             result = (
@@ -420,14 +727,38 @@ async def local_query(
                 .strip()
             )
             result = "{" + result.split("{")[1].split("}")[0] + "}"
-
             keywords_data = json.loads(result)
-            keywords = keywords_data.get("low_level_keywords", [])
-            keywords = ", ".join(keywords)
         # Handle parsing error
         except json.JSONDecodeError as e:
             print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
+            return None
+
+    keywords_data = {
+        "high_level_keywords": keywords_data.get("high_level_keywords", []),
+        "low_level_keywords": keywords_data.get("low_level_keywords", []),
+    }
+    if keywords_cache is not None:
+        await keywords_cache.upsert({cache_key: keywords_data})
+    return keywords_data
+
+
+async def local_query(
+    query,
+    knowledge_graph_inst: BaseGraphStorage,
+    entities_vdb: BaseVectorStorage,
+    relationships_vdb: BaseVectorStorage,
+    text_chunks_db: BaseKVStorage[TextChunkSchema],
+    query_param: QueryParam,
+    global_config: dict,
+    keywords_cache: BaseKVStorage = None,
+) -> Union[str, AsyncIterator[str]]:
+    context = None
+    use_model_func = global_config["llm_model_func"]
+
+    keywords_data = await _get_keywords(query, use_model_func, keywords_cache)
+    if keywords_data is None:
+        return PROMPTS["fail_response"]
+    keywords = ", ".join(keywords_data["low_level_keywords"])
     if keywords:
         context = await _build_local_query_context(
             keywords,
@@ -444,6 +775,8 @@ async def local_query(
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
+    if query_param.stream:
+        return await use_model_func(query, system_prompt=sys_prompt, stream=True)
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
@@ -469,18 +802,17 @@ async def _build_local_query_context(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
 ):
-    results = await entities_vdb.query(query, top_k=query_param.top_k)
+    results = await _query_vdb(entities_vdb, query, query_param.top_k)
 
     if not len(results):
         return None
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(r["entity_name"]) for r in results]
+    entity_names = [r["entity_name"] for r in results]
+    node_datas, node_degrees = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(entity_names),
+        knowledge_graph_inst.node_degrees(entity_names),
     )
     if not all([n is not None for n in node_datas]):
         logger.warning("Some nodes are missing, maybe the storage is damaged")
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(r["entity_name"]) for r in results]
-    )
     node_datas = [
         {**n, "entity_name": k["entity_name"], "rank": d}
         for k, n, d in zip(results, node_datas, node_degrees)
@@ -555,40 +887,46 @@ async def _find_most_related_text_unit_from_entities(
         split_string_by_multi_markers(dp["source_id"], [GRAPH_FIELD_SEP])
         for dp in node_datas
     ]
-    edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
-    )
-    all_one_hop_nodes = set()
-    for this_edges in edges:
-        if not this_edges:
-            continue
-        all_one_hop_nodes.update([e[1] for e in this_edges])
+    # for every entity: chunk id -> number of its neighbours citing that chunk
+    csr = await knowledge_graph_inst.get_csr_snapshot()
+    if csr is not None:
+        neighbor_chunk_counts = [
+            csr.neighbor_chunk_counts(dp["entity_name"]) for dp in node_datas
+        ]
+    else:
+        edges = await knowledge_graph_inst.get_nodes_edges(
+            [dp["entity_name"] for dp in node_datas]
+        )
+        all_one_hop_nodes = set()
+        for this_edges in edges:
+            if not this_edges:
+                continue
+            all_one_hop_nodes.update([e[1] for e in this_edges])
 
-    all_one_hop_nodes = list(all_one_hop_nodes)
-    all_one_hop_nodes_data = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(e) for e in all_one_hop_nodes]
-    )
+        all_one_hop_nodes = list(all_one_hop_nodes)
+        all_one_hop_nodes_data = await knowledge_graph_inst.get_nodes(all_one_hop_nodes)
 
-    # Add null check for node data
-    all_one_hop_text_units_lookup = {
-        k: set(split_string_by_multi_markers(v["source_id"], [GRAPH_FIELD_SEP]))
-        for k, v in zip(all_one_hop_nodes, all_one_hop_nodes_data)
-        if v is not None and "source_id" in v  # Add source_id check
-    }
+        # Add null check for node data
+        all_one_hop_text_units_lookup = {
+            k: set(split_string_by_multi_markers(v["source_id"], [GRAPH_FIELD_SEP]))
+            for k, v in zip(all_one_hop_nodes, all_one_hop_nodes_data)
+            if v is not None and "source_id" in v  # Add source_id check
+        }
+        neighbor_chunk_counts = []
+        for this_edges in edges:
+            counts = Counter()
+            for e in this_edges or []:  # Add check for None edges
+                counts.update(all_one_hop_text_units_lookup.get(e[1], ()))
+            neighbor_chunk_counts.append(counts)
 
     all_text_units_lookup = {}
-    for index, (this_text_units, this_edges) in enumerate(zip(text_units, edges)):
+    for index, (this_text_units, this_counts) in enumerate(
+        zip(text_units, neighbor_chunk_counts)
+    ):
         for c_id in this_text_units:
             if c_id in all_text_units_lookup:
                 continue
-            relation_counts = 0
-            if this_edges:  # Add check for None edges
-                for e in this_edges:
-                    if (
-                        e[1] in all_one_hop_text_units_lookup
-                        and c_id in all_one_hop_text_units_lookup[e[1]]
-                    ):
-                        relation_counts += 1
+            relation_counts = this_counts.get(c_id, 0)
 
             chunk_data = await text_chunks_db.get_by_id(c_id)
             if chunk_data is not None and "content" in chunk_data:  # Add content check
@@ -628,24 +966,22 @@ async def _find_most_related_edges_from_entities(
     query_param: QueryParam,
     knowledge_graph_inst: BaseGraphStorage,
 ):
-    all_related_edges = await asyncio.gather(
-        *[knowledge_graph_inst.get_node_edges(dp["entity_name"]) for dp in node_datas]
+    all_related_edges = await knowledge_graph_inst.get_nodes_edges(
+        [dp["entity_name"] for dp in node_datas]
     )
     all_edges = []
     seen = set()
 
     for this_edges in all_related_edges:
-        for e in this_edges:
+        for e in this_edges or []:
             sorted_edge = tuple(sorted(e))
             if sorted_edge not in seen:
                 seen.add(sorted_edge)
                 all_edges.append(sorted_edge)
 
-    all_edges_pack = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(e[0], e[1]) for e in all_edges]
-    )
-    all_edges_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(e[0], e[1]) for e in all_edges]
+    all_edges_pack, all_edges_degree = await asyncio.gather(
+        knowledge_graph_inst.get_edges(all_edges),
+        knowledge_graph_inst.edge_degrees(all_edges),
     )
     all_edges_data = [
         {"src_tgt": k, "rank": d, **v}
@@ -671,37 +1007,15 @@ async def global_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
-) -> str:
+    keywords_cache: BaseKVStorage = None,
+) -> Union[str, AsyncIterator[str]]:
     context = None
     use_model_func = global_config["llm_model_func"]
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-
-    try:
-        keywords_data = json.loads(json_text)
-        keywords = keywords_data.get("high_level_keywords", [])
-        keywords = ", ".join(keywords)
-    except json.JSONDecodeError:
-        try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
-            )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-
-            keywords_data = json.loads(result)
-            keywords = keywords_data.get("high_level_keywords", [])
-            keywords = ", ".join(keywords)
-
-        except json.JSONDecodeError as e:
-            # Handle parsing error
-            print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
+    keywords_data = await _get_keywords(query, use_model_func, keywords_cache)
+    if keywords_data is None:
+        return PROMPTS["fail_response"]
+    keywords = ", ".join(keywords_data["high_level_keywords"])
     if keywords:
         context = await _build_global_query_context(
             keywords,
@@ -721,6 +1035,8 @@ async def global_query(
     sys_prompt = sys_prompt_temp.format(
         context_data=context, response_type=query_param.response_type
     )
+    if query_param.stream:
+        return await use_model_func(query, system_prompt=sys_prompt, stream=True)
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
@@ -747,20 +1063,19 @@ async def _build_global_query_context(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
 ):
-    results = await relationships_vdb.query(keywords, top_k=query_param.top_k)
+    results = await _query_vdb(relationships_vdb, keywords, query_param.top_k)
 
     if not len(results):
         return None
 
-    edge_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_edge(r["src_id"], r["tgt_id"]) for r in results]
+    edge_pairs = [(r["src_id"], r["tgt_id"]) for r in results]
+    edge_datas, edge_degree = await asyncio.gather(
+        knowledge_graph_inst.get_edges(edge_pairs),
+        knowledge_graph_inst.edge_degrees(edge_pairs),
     )
 
     if not all([n is not None for n in edge_datas]):
         logger.warning("Some edges are missing, maybe the storage is damaged")
-    edge_degree = await asyncio.gather(
-        *[knowledge_graph_inst.edge_degree(r["src_id"], r["tgt_id"]) for r in results]
-    )
     edge_datas = [
         {"src_id": k["src_id"], "tgt_id": k["tgt_id"], "rank": d, **v}
         for k, v, d in zip(results, edge_datas, edge_degree)
@@ -851,12 +1166,9 @@ async def _find_most_related_entities_from_relationships(
             entity_names.append(e["tgt_id"])
             seen.add(e["tgt_id"])
 
-    node_datas = await asyncio.gather(
-        *[knowledge_graph_inst.get_node(entity_name) for entity_name in entity_names]
-    )
-
-    node_degrees = await asyncio.gather(
-        *[knowledge_graph_inst.node_degree(entity_name) for entity_name in entity_names]
+    node_datas, node_degrees = await asyncio.gather(
+        knowledge_graph_inst.get_nodes(entity_names),
+        knowledge_graph_inst.node_degrees(entity_names),
     )
     node_datas = [
         {**n, "entity_name": k, "rank": d}
@@ -917,75 +1229,91 @@ async def hybrid_query(
     text_chunks_db: BaseKVStorage[TextChunkSchema],
     query_param: QueryParam,
     global_config: dict,
-) -> str:
-    low_level_context = None
-    high_level_context = None
+    keywords_cache: BaseKVStorage = None,
+) -> Union[str, AsyncIterator[str]]:
     use_model_func = global_config["llm_model_func"]
+    timings = {}
 
-    kw_prompt_temp = PROMPTS["keywords_extraction"]
-    kw_prompt = kw_prompt_temp.format(query=query)
-
-    result = await use_model_func(kw_prompt)
-    json_text = locate_json_string_body_from_string(result)
-    try:
-        keywords_data = json.loads(json_text)
-        hl_keywords = keywords_data.get("high_level_keywords", [])
-        ll_keywords = keywords_data.get("low_level_keywords", [])
-        hl_keywords = ", ".join(hl_keywords)
-        ll_keywords = ", ".join(ll_keywords)
-    except json.JSONDecodeError:
+    async def timed(stage: str, coro):
+        start = time.perf_counter()
         try:
-            result = (
-                result.replace(kw_prompt[:-1], "")
-                .replace("user", "")
-                .replace("model", "")
-                .strip()
+            return await coro
+        finally:
+            timings[stage] = time.perf_counter() - start
+
+    async def build_low_level_context():
+        if ll_keywords:
+            return await timed(
+                "local_context",
+                _build_local_query_context(
+                    ll_keywords,
+                    knowledge_graph_inst,
+                    entities_vdb,
+                    text_chunks_db,
+                    query_param,
+                ),
             )
-            result = "{" + result.split("{")[1].split("}")[0] + "}"
-            keywords_data = json.loads(result)
-            hl_keywords = keywords_data.get("high_level_keywords", [])
-            ll_keywords = keywords_data.get("low_level_keywords", [])
-            hl_keywords = ", ".join(hl_keywords)
-            ll_keywords = ", ".join(ll_keywords)
-        # Handle parsing error
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            return PROMPTS["fail_response"]
 
-    if ll_keywords:
-        low_level_context = await _build_local_query_context(
-            ll_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            text_chunks_db,
-            query_param,
+    async def build_high_level_context():
+        if hl_keywords:
+            return await timed(
+                "global_context",
+                _build_global_query_context(
+                    hl_keywords,
+                    knowledge_graph_inst,
+                    entities_vdb,
+                    relationships_vdb,
+                    text_chunks_db,
+                    query_param,
+                ),
+            )
+
+    def log_timings():
+        logger.info(
+            "Hybrid query stages: "
+            + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items())
         )
 
-    if hl_keywords:
-        high_level_context = await _build_global_query_context(
-            hl_keywords,
-            knowledge_graph_inst,
-            entities_vdb,
-            relationships_vdb,
-            text_chunks_db,
-            query_param,
+    try:
+        keywords_data = await timed(
+            "keywords", _get_keywords(query, use_model_func, keywords_cache)
+        )
+        if keywords_data is None:
+            return PROMPTS["fail_response"]
+        hl_keywords = ", ".join(keywords_data["high_level_keywords"])
+        ll_keywords = ", ".join(keywords_data["low_level_keywords"])
+
+        # both builders reach their vector search in the same loop iteration.
+        # When the embedding function goes through batch_async_func_calls, as
+        # LightRAG sets it up, the two keyword embeddings are merged into one
+        # request; an unbatched embedding function makes two
+        low_level_context, high_level_context = await timed(
+            "retrieval",
+            asyncio.gather(build_low_level_context(), build_high_level_context()),
         )
 
-    context = combine_contexts(high_level_context, low_level_context)
+        context = combine_contexts(high_level_context, low_level_context)
 
-    if query_param.only_need_context:
-        return context
-    if context is None:
-        return PROMPTS["fail_response"]
+        if query_param.only_need_context:
+            return context
+        if context is None:
+            return PROMPTS["fail_response"]
 
-    sys_prompt_temp = PROMPTS["rag_response"]
-    sys_prompt = sys_prompt_temp.format(
-        context_data=context, response_type=query_param.response_type
-    )
-    response = await use_model_func(
-        query,
-        system_prompt=sys_prompt,
-    )
+        sys_prompt_temp = PROMPTS["rag_response"]
+        sys_prompt = sys_prompt_temp.format(
+            context_data=context, response_type=query_param.response_type
+        )
+        if query_param.stream:
+            return await use_model_func(query, system_prompt=sys_prompt, stream=True)
+        response = await timed(
+            "generation",
+            use_model_func(
+                query,
+                system_prompt=sys_prompt,
+            ),
+        )
+    finally:
+        log_timings()
     if len(response) > len(sys_prompt):
         response = (
             response.replace(sys_prompt, "")
@@ -1073,7 +1401,7 @@ async def naive_query(
     global_config: dict,
 ):
     use_model_func = global_config["llm_model_func"]
-    results = await chunks_vdb.query(query, top_k=query_param.top_k)
+    results = await _query_vdb(chunks_vdb, query, query_param.top_k)
     if not len(results):
         return PROMPTS["fail_response"]
     chunks_ids = [r["id"] for r in results]
@@ -1092,6 +1420,8 @@ async def naive_query(
     sys_prompt = sys_prompt_temp.format(
         content_data=section, response_type=query_param.response_type
     )
+    if query_param.stream:
+        return await use_model_func(query, system_prompt=sys_prompt, stream=True)
     response = await use_model_func(
         query,
         system_prompt=sys_prompt,
@@ -0,0 +1,68 @@
+from typing import Union
+
+import numpy as np
+
+QUANTIZED_DTYPES = {"int8": np.int8, "float16": np.float16}
+
+
+class QuantizedMatrix:
+    """Row-wise quantised copy of a matrix of normalized vectors.
+
+    Row ``i`` is kept as ``codes[i] * scales[i]`` where ``scales[i]`` is the
+    largest absolute component of the row, so int8 codes use the whole
+    ``[-127, 127]`` range and float16 codes stay within ``[-1, 1]``. Scores
+    computed from it are approximations for a first pass; callers re-rank the
+    best candidates against the float32 vectors.
+
+    ``codes`` and ``scales`` can be plain arrays or memory maps. Indexing with
+    row numbers returns dequantised float32 rows, so an ``IVFFlatIndex`` can
+    search this in place of the float32 matrix.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def shape(self) -> tuple:
+        return self.codes.shape
+
+    def flush(self):
+        self.codes.flush()
+        self.scales.flush()
+
+    @staticmethod
+    def encode(vectors: np.ndarray, dtype: type) -> tuple[np.ndarray, np.ndarray]:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=-1)
+        scales[scales == 0] = 1
+        if dtype == np.int8:
+            scales = scales / 127
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        else:
+            codes = (vectors / scales[:, None]).astype(dtype)
+        return codes, scales.astype(np.float32)
+
+    def __setitem__(self, rows: Union[np.ndarray, slice], vectors: np.ndarray):
+        codes, scales = self.encode(vectors, self.codes.dtype.type)
+        self.codes[rows] = codes
+        self.scales[rows] = scales
+
+    def __getitem__(self, rows: Union[np.ndarray, slice]) -> np.ndarray:
+        return (
+            np.asarray(self.codes[rows], dtype=np.float32)
+            * np.asarray(self.scales[rows], dtype=np.float32)[:, None]
+        )
+
+    def scores(
+        self, queries: np.ndarray, n_rows: int, block_size: int = 8192
+    ) -> np.ndarray:
+        """Approximate ``queries @ matrix[:n_rows].T``, dequantising a block of
+        rows at a time so the float32 copy never exists in full
+        """
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, block_size):
+            stop = min(start + block_size, n_rows)
+            block = np.asarray(self.codes[start:stop], dtype=np.float32)
+            scores[:, start:stop] = (queries @ block.T) * self.scales[start:stop]
+        return scores
@@ -1,23 +1,43 @@
 import asyncio
 import html
+import json
 import os
-from dataclasses import dataclass
-from typing import Any, Union, cast
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from hashlib import md5
+from typing import Any, Iterable, Union, cast
 import networkx as nx
 import numpy as np
 from nano_vectordb import NanoVectorDB
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 from .utils import (
+    EmbeddingFunc,
+    current_priority,
     logger,
     load_json,
     write_json,
     compute_mdhash_id,
 )
 
+from .ann import IVFFlatIndex
+from .prompt import GRAPH_FIELD_SEP
+from .quant import QUANTIZED_DTYPES, QuantizedMatrix
+from .csr import CSRGraph
 from .base import (
     BaseGraphStorage,
     BaseKVStorage,
     BaseVectorStorage,
+    QueryParam,
+    StorageNameSpace,
 )
 
 
@@ -58,10 +78,525 @@ class JsonKVStorage(BaseKVStorage):
         self._data.update(left_data)
         return left_data
 
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            self._data.pop(id, None)
+
     async def drop(self):
         self._data = {}
 
 
+@dataclass
+class JsonLogKVStorage(JsonKVStorage):
+    """JsonKVStorage persisted as an append-only JSON-lines log.
+
+    ``index_done_callback`` only appends the records changed since the last
+    flush to ``kv_store_{namespace}.jsonl``; the log is replayed on load. Once
+    the share of superseded records passes ``compaction_threshold`` the log is
+    rewritten from the live data in a background thread. An existing
+    ``kv_store_{namespace}.json`` is imported on first load.
+    """
+
+    compaction_threshold: float = 0.5
+    # don't bother compacting logs shorter than this
+    compaction_min_records: int = 1000
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.jsonl")
+        storage_kwargs = (
+            self.global_config.get("key_string_value_json_storage_cls_kwargs") or {}
+        )
+        self.compaction_threshold = storage_kwargs.get(
+            "compaction_threshold", self.compaction_threshold
+        )
+        self.compaction_min_records = storage_kwargs.get(
+            "compaction_min_records", self.compaction_min_records
+        )
+        self._data = {}
+        # key -> new value, or None for a deletion, waiting to be appended
+        self._dirty = {}
+        self._log_records = 0
+        self._lock = asyncio.Lock()
+        self._compaction_task = None
+
+        if os.path.exists(self._file_name):
+            self._replay()
+        else:
+            legacy_file_name = os.path.join(
+                working_dir, f"kv_store_{self.namespace}.json"
+            )
+            self._data = load_json(legacy_file_name) or {}
+            self._dirty = dict(self._data)
+        logger.info(f"Load KV {self.namespace} with {len(self._data)} data")
+
+    def _replay(self):
+        with open(self._file_name, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn final line from an interrupted append
+                    logger.warning(f"Skip corrupted record in {self._file_name}")
+                    continue
+                self._log_records += 1
+                if record.get("d"):
+                    self._data.pop(record["k"], None)
+                else:
+                    self._data[record["k"]] = record["v"]
+
+    @staticmethod
+    def _dump_record(key: str, value: Union[dict, None]) -> str:
+        record = {"k": key, "d": 1} if value is None else {"k": key, "v": value}
+        return json.dumps(record, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def _write_snapshot(data: dict, file_name: str):
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            for k, v in data.items():
+                f.write(JsonLogKVStorage._dump_record(k, v))
+        os.replace(tmp_file_name, file_name)
+
+    async def upsert(self, data: dict[str, dict]):
+        left_data = await super().upsert(data)
+        self._dirty.update(left_data)
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        for id in ids:
+            if self._data.pop(id, None) is not None:
+                self._dirty[id] = None
+
+    async def drop(self):
+        self._data = {}
+        self._dirty = {}
+        async with self._lock:
+            self._write_snapshot({}, self._file_name)
+            self._log_records = 0
+
+    async def index_done_callback(self):
+        if self._dirty:
+            async with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                with open(self._file_name, "a", encoding="utf-8") as f:
+                    for k, v in dirty.items():
+                        f.write(self._dump_record(k, v))
+                self._log_records += len(dirty)
+        dead_ratio = 1 - len(self._data) / max(self._log_records, 1)
+        if (
+            self._log_records >= self.compaction_min_records
+            and dead_ratio > self.compaction_threshold
+            and (self._compaction_task is None or self._compaction_task.done())
+        ):
+            self._compaction_task = asyncio.create_task(self._compact())
+
+    async def _compact(self):
+        async with self._lock:
+            # pending changes are part of the snapshot, so they need no append
+            snapshot, self._dirty = dict(self._data), {}
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write_snapshot, snapshot, self._file_name
+            )
+            self._log_records = len(snapshot)
+        logger.info(
+            f"Compacted KV log {self._file_name} down to {len(snapshot)} records"
+        )
+
+
+@dataclass
+class SQLiteKVStorage(BaseKVStorage):
+    """KV storage on an indexed local SQLite file (``kv_store_{namespace}.sqlite``).
+
+    Values are stored as JSON text under a primary-key index and read on
+    demand, so nothing but the page cache is kept in memory. The database
+    runs in WAL mode so readers never block the writer. Every statement runs
+    in a worker thread, one at a time, so disk I/O never stalls the event
+    loop.
+    """
+
+    # max number of bound parameters per IN-list statement
+    max_batch_size: int = 500
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(working_dir, f"kv_store_{self.namespace}.sqlite")
+        storage_kwargs = (
+            self.global_config.get("key_string_value_json_storage_cls_kwargs") or {}
+        )
+        self.max_batch_size = storage_kwargs.get("max_batch_size", self.max_batch_size)
+        # used from worker threads, never two at once
+        self._conn = sqlite3.connect(self._file_name, check_same_thread=False)
+        self._conn_lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (id TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        logger.info(f"Load KV {self.namespace} from {self._file_name}")
+
+    async def _run(self, func, *args):
+        def locked():
+            with self._conn_lock:
+                return func(*args)
+
+        return await asyncio.to_thread(locked)
+
+    def _batches(self, ids: list[str]):
+        for i in range(0, len(ids), self.max_batch_size):
+            yield ids[i : i + self.max_batch_size]
+
+    def _fetch(self, ids: list[str]) -> dict[str, dict]:
+        found = {}
+        for batch in self._batches(list(set(ids))):
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT id, value FROM kv WHERE id IN ({placeholders})", batch
+            )
+            found.update({k: json.loads(v) for k, v in rows})
+        return found
+
+    def _existing(self, ids: list[str]) -> set[str]:
+        exist_keys = set()
+        for batch in self._batches(list(set(ids))):
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT id FROM kv WHERE id IN ({placeholders})", batch
+            )
+            exist_keys.update(row[0] for row in rows)
+        return exist_keys
+
+    def _all_keys(self) -> list[str]:
+        return [row[0] for row in self._conn.execute("SELECT id FROM kv")]
+
+    def _get(self, id: str):
+        row = self._conn.execute("SELECT value FROM kv WHERE id = ?", (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _insert_new(self, data: dict[str, dict]) -> dict[str, dict]:
+        exist_keys = self._existing(list(data.keys()))
+        left_data = {k: v for k, v in data.items() if k not in exist_keys}
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO kv (id, value) VALUES (?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False)) for k, v in left_data.items()],
+            )
+        return left_data
+
+    def _delete(self, ids: list[str]):
+        with self._conn:
+            for batch in self._batches(list(set(ids))):
+                placeholders = ",".join("?" * len(batch))
+                self._conn.execute(
+                    f"DELETE FROM kv WHERE id IN ({placeholders})", batch
+                )
+
+    def _drop(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM kv")
+
+    def _checkpoint(self):
+        self._conn.commit()
+        self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    async def all_keys(self) -> list[str]:
+        return await self._run(self._all_keys)
+
+    async def get_by_id(self, id):
+        return await self._run(self._get, id)
+
+    async def get_by_ids(self, ids, fields=None):
+        found = await self._run(self._fetch, ids)
+        if fields is None:
+            return [found.get(id, None) for id in ids]
+        return [
+            (
+                {k: v for k, v in found[id].items() if k in fields}
+                if found.get(id, None)
+                else None
+            )
+            for id in ids
+        ]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        exist_keys = await self._run(self._existing, data)
+        return set([s for s in data if s not in exist_keys])
+
+    async def upsert(self, data: dict[str, dict]):
+        return await self._run(self._insert_new, data)
+
+    async def delete(self, ids: list[str]):
+        await self._run(self._delete, ids)
+
+    async def drop(self):
+        await self._run(self._drop)
+
+    async def index_done_callback(self):
+        await self._run(self._checkpoint)
+
+
+@dataclass
+class BoundedKVStorage(BaseKVStorage):
+    """LRU/TTL bounded view over another KV storage, used for the LLM cache.
+
+    Per-entry size, hit count, last-access and insert time are tracked in
+    ``kv_store_{namespace}_access.json``. Reads past ``ttl`` seconds miss, and
+    once ``max_entries`` or ``max_bytes`` is exceeded the least recently used
+    entries are deleted from the wrapped storage, so both its memory and its
+    flush cost stay bounded. When the wrapped storage can't list its keys,
+    entries it already held are tracked the first time they are asked for.
+    The access file is written by ``index_done_callback``, and by
+    ``query_done_callback`` at most once every ``access_flush_interval``
+    seconds.
+    """
+
+    inner: BaseKVStorage = None
+    max_entries: Union[int, None] = None
+    max_bytes: Union[int, None] = None
+    ttl: Union[float, None] = None
+    access_flush_interval: float = 60.0
+
+    def __post_init__(self):
+        self._access_file_name = os.path.join(
+            self.global_config["working_dir"], f"kv_store_{self.namespace}_access.json"
+        )
+        # key -> [size, hits, last_access, create_time], least recently used first
+        self._entries: OrderedDict[str, list] = None
+        # whether the entries cover every key of the wrapped storage
+        self._listed = True
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._access_saved_at = time.monotonic()
+
+    @staticmethod
+    def _sizeof(value) -> int:
+        return len(json.dumps(value, ensure_ascii=False))
+
+    async def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        saved = load_json(self._access_file_name) or {}
+        try:
+            keys = await self.inner.all_keys()
+        except NotImplementedError:
+            keys = None
+        self._listed = keys is not None
+        if self._listed:
+            missing = [k for k in keys if k not in saved]
+            now = time.time()
+            for k, v in zip(missing, await self.inner.get_by_ids(missing)):
+                saved[k] = [self._sizeof(v), 0, now, now]
+            key_set = set(keys)
+            saved = {k: e for k, e in saved.items() if k in key_set}
+        self._entries = OrderedDict(sorted(saved.items(), key=lambda x: x[1][2]))
+        self._bytes = sum(e[0] for e in self._entries.values())
+        await self._evict()
+
+    async def _track_unlisted(self, ids: list[str]):
+        """Start tracking the entries of ``ids`` a storage that can't list its
+        keys already held"""
+        if self._listed:
+            return
+        ids = [id for id in ids if id not in self._entries]
+        if not ids:
+            return
+        now = time.time()
+        for id, value in zip(ids, await self.inner.get_by_ids(ids) or []):
+            if value is not None:
+                size = self._sizeof(value)
+                self._entries[id] = [size, 0, now, now]
+                self._bytes += size
+
+    def _expired(self, entry: list, now: float) -> bool:
+        return self.ttl is not None and now - entry[3] > self.ttl
+
+    async def _evict(self):
+        now = time.time()
+        evicted = [k for k, e in self._entries.items() if self._expired(e, now)]
+        for k in evicted:
+            self._bytes -= self._entries.pop(k)[0]
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            k, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[0]
+            evicted.append(k)
+        if evicted:
+            await self.inner.delete(evicted)
+            logger.debug(f"Evicted {len(evicted)} entries from {self.namespace}")
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries or {}),
+            "bytes": self._bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+
+    async def all_keys(self) -> list[str]:
+        await self._ensure_loaded()
+        return list(self._entries.keys())
+
+    async def get_by_id(self, id):
+        await self._ensure_loaded()
+        await self._track_unlisted([id])
+        entry = self._entries.get(id)
+        now = time.time()
+        if entry is None or self._expired(entry, now):
+            self._misses += 1
+            return None
+        value = await self.inner.get_by_id(id)
+        if value is None:
+            self._misses += 1
+            return None
+        self._hit(id, now)
+        return value
+
+    def _hit(self, id: str, now: float):
+        self._hits += 1
+        entry = self._entries[id]
+        entry[1] += 1
+        entry[2] = now
+        self._entries.move_to_end(id)
+
+    async def get_by_ids(self, ids, fields=None):
+        await self._ensure_loaded()
+        await self._track_unlisted(ids)
+        now = time.time()
+        live = [
+            id
+            for id in ids
+            if id in self._entries and not self._expired(self._entries[id], now)
+        ]
+        found = {
+            id: value
+            for id, value in zip(live, await self.inner.get_by_ids(live, fields))
+            if value is not None
+        }
+        for id in ids:
+            if id in found:
+                self._hit(id, now)
+            else:
+                self._misses += 1
+        return [found.get(id, None) for id in ids]
+
+    async def filter_keys(self, data: list[str]) -> set[str]:
+        await self._ensure_loaded()
+        await self._track_unlisted(data)
+        return set([s for s in data if s not in self._entries])
+
+    async def upsert(self, data: dict[str, dict]):
+        await self._ensure_loaded()
+        now = time.time()
+        expired = [
+            k
+            for k in data
+            if k in self._entries and self._expired(self._entries[k], now)
+        ]
+        if expired:
+            await self.delete(expired)
+        left_data = await self.inner.upsert(data)
+        for k, v in left_data.items():
+            size = self._sizeof(v)
+            self._entries[k] = [size, 0, now, now]
+            self._bytes += size
+        await self._evict()
+        return left_data
+
+    async def delete(self, ids: list[str]):
+        await self._ensure_loaded()
+        for id in ids:
+            entry = self._entries.pop(id, None)
+            if entry is not None:
+                self._bytes -= entry[0]
+        await self.inner.delete(ids)
+
+    async def drop(self):
+        self._entries = OrderedDict()
+        self._bytes = 0
+        await self.inner.drop()
+
+    async def _save_access(self):
+        if self._entries is None:
+            return
+        await self._evict()
+        tmp_file_name = self._access_file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_file_name, self._access_file_name)
+        self._access_saved_at = time.monotonic()
+
+    async def index_done_callback(self):
+        await self._save_access()
+        await self.inner.index_done_callback()
+
+    async def query_done_callback(self):
+        # recency only orders eviction, so losing the last few seconds of it
+        # costs little, while rewriting the file on every query adds up
+        if time.monotonic() - self._access_saved_at >= self.access_flush_interval:
+            await self._save_access()
+        await self.inner.index_done_callback()
+
+
+class _RelationIndex:
+    """Inverted index from entity name to the ids of the relationship rows
+    that have it as ``src_id`` or ``tgt_id``
+    """
+
+    def __init__(self, relations: Union[dict[str, list[str]], None] = None):
+        self._relations: dict[str, set[str]] = {}
+        self._endpoints: dict[str, set[str]] = {}
+        for entity_name, ids in (relations or {}).items():
+            for id in ids:
+                self._add_endpoint(id, entity_name)
+
+    @classmethod
+    def from_rows(cls, rows: list[Union[dict, None]]) -> "_RelationIndex":
+        index = cls()
+        for dp in rows:
+            if dp is not None and "src_id" in dp and "tgt_id" in dp:
+                index.add(dp["__id__"], dp["src_id"], dp["tgt_id"])
+        return index
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    def _add_endpoint(self, id: str, entity_name: str):
+        self._relations.setdefault(entity_name, set()).add(id)
+        self._endpoints.setdefault(id, set()).add(entity_name)
+
+    def add(self, id: str, src_id: str, tgt_id: str):
+        self._add_endpoint(id, src_id)
+        self._add_endpoint(id, tgt_id)
+
+    def discard(self, ids: Iterable[str]):
+        for id in ids:
+            for entity_name in self._endpoints.pop(id, ()):
+                related = self._relations.get(entity_name)
+                if related is not None:
+                    related.discard(id)
+                    if not related:
+                        del self._relations[entity_name]
+
+    def pop(self, entity_names: list[str]) -> set[str]:
+        """Remove and return the ids of all relations touching ``entity_names``"""
+        ids = set()
+        for entity_name in entity_names:
+            ids.update(self._relations.pop(entity_name, ()))
+        self.discard(ids)
+        return ids
+
+    def to_dict(self) -> dict[str, list[str]]:
+        return {k: sorted(v) for k, v in self._relations.items()}
+
+
 @dataclass
 class NanoVectorDBStorage(BaseVectorStorage):
     cosine_better_than_threshold: float = 0.2
@@ -77,6 +612,14 @@ class NanoVectorDBStorage(BaseVectorStorage):
         self.cosine_better_than_threshold = self.global_config.get(
             "cosine_better_than_threshold", self.cosine_better_than_threshold
         )
+        # saved inside the client file; files written before it existed are
+        # indexed once here
+        relation_index = self._client.get_additional_data().get("relation_index")
+        self._relation_index = (
+            _RelationIndex(relation_index)
+            if relation_index is not None
+            else _RelationIndex.from_rows(self.client_storage["data"])
+        )
 
     async def upsert(self, data: dict[str, dict]):
         logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
@@ -102,6 +645,9 @@ class NanoVectorDBStorage(BaseVectorStorage):
         for i, d in enumerate(list_data):
             d["__vector__"] = embeddings[i]
         results = self._client.upsert(datas=list_data)
+        for d in list_data:
+            if "src_id" in d and "tgt_id" in d:
+                self._relation_index.add(d["__id__"], d["src_id"], d["tgt_id"])
         return results
 
     async def query(self, query: str, top_k=5):
@@ -117,16 +663,72 @@ class NanoVectorDBStorage(BaseVectorStorage):
         ]
         return results
 
+    async def query_many(self, queries: list[str], top_k=5):
+        if not len(queries):
+            return []
+        batches = [
+            queries[i : i + self._max_batch_size]
+            for i in range(0, len(queries), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = np.concatenate(embeddings_list).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=-1, keepdims=True)
+        storage = getattr(self._client, "_NanoVectorDB__storage", None)
+        if not isinstance(storage, dict) or "matrix" not in storage:
+            # a nano-vectordb version laid out differently, query one by one
+            return [
+                [
+                    {**dp, "id": dp["__id__"], "distance": dp["__metrics__"]}
+                    for dp in self._client.query(
+                        query=embedding,
+                        top_k=top_k,
+                        better_than_threshold=self.cosine_better_than_threshold,
+                    )
+                ]
+                for embedding in embeddings
+            ]
+        # the client keeps its matrix normalized, so one product scores all queries
+        scores = embeddings @ storage["matrix"].T
+        top_k = min(top_k, scores.shape[1])
+        all_results = []
+        for query_scores in scores:
+            results = []
+            if top_k > 0:
+                best = np.argpartition(-query_scores, top_k - 1)[:top_k]
+                for i in best[np.argsort(-query_scores[best])]:
+                    score = float(query_scores[i])
+                    if score < self.cosine_better_than_threshold:
+                        break
+                    dp = storage["data"][i]
+                    results.append(
+                        {
+                            **dp,
+                            "__metrics__": score,
+                            "id": dp["__id__"],
+                            "distance": score,
+                        }
+                    )
+            all_results.append(results)
+        return all_results
+
     @property
     def client_storage(self):
         return getattr(self._client, "_NanoVectorDB__storage")
 
+    def _delete_ids(self, ids: list[str]) -> int:
+        if not ids:
+            return 0
+        n_before = len(self._client)
+        self._client.delete(ids)
+        return n_before - len(self._client)
+
     async def delete_entity(self, entity_name: str):
         try:
             entity_id = [compute_mdhash_id(entity_name, prefix="ent-")]
 
-            if self._client.get(entity_id):
-                self._client.delete(entity_id)
+            if self._delete_ids(entity_id):
                 logger.info(f"Entity {entity_name} have been deleted.")
             else:
                 logger.info(f"No entity found with name {entity_name}.")
@@ -135,15 +737,10 @@ class NanoVectorDBStorage(BaseVectorStorage):
 
     async def delete_relation(self, entity_name: str):
         try:
-            relations = [
-                dp
-                for dp in self.client_storage["data"]
-                if dp["src_id"] == entity_name or dp["tgt_id"] == entity_name
-            ]
-            ids_to_delete = [relation["__id__"] for relation in relations]
+            ids_to_delete = list(self._relation_index.pop([entity_name]))
 
             if ids_to_delete:
-                self._client.delete(ids_to_delete)
+                self._delete_ids(ids_to_delete)
                 logger.info(
                     f"All relations related to entity {entity_name} have been deleted."
                 )
@@ -154,15 +751,1172 @@ class NanoVectorDBStorage(BaseVectorStorage):
                 f"Error while deleting relations for entity {entity_name}: {e}"
             )
 
+    async def delete_entities(self, entity_names: list[str]):
+        # the client compacts its matrix on every delete, so all the rows go
+        # in a single call
+        ids_to_delete = [
+            compute_mdhash_id(entity_name, prefix="ent-")
+            for entity_name in entity_names
+        ] + list(self._relation_index.pop(entity_names))
+        deleted = self._delete_ids(ids_to_delete)
+        logger.info(
+            f"Deleted {deleted} rows of {len(entity_names)} entities from {self.namespace}"
+        )
+
+    async def delete(self, ids: list[str]):
+        self._relation_index.discard(ids)
+        self._delete_ids(ids)
+
     async def index_done_callback(self):
+        self._client.store_additional_data(
+            relation_index=self._relation_index.to_dict()
+        )
         self._client.save()
 
 
+class _FileLock:
+    """Re-entrant exclusive lock shared by every thread, event loop and
+    process that uses ``file_name``.
+
+    It is a per-file thread lock plus an advisory ``flock``, so sections it
+    guards must not await. Without ``fcntl`` (Windows) it only covers the
+    current process. Use ``get`` so instances on the same file share a lock.
+    """
+
+    _locks: dict[str, "_FileLock"] = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        self._thread_lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+
+    @classmethod
+    def get(cls, file_name: str) -> "_FileLock":
+        file_name = os.path.abspath(file_name)
+        with cls._locks_guard:
+            if file_name not in cls._locks:
+                cls._locks[file_name] = cls(file_name)
+            return cls._locks[file_name]
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            self._fd = os.open(self._file_name, os.O_RDWR | os.O_CREAT)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+@dataclass
+class MmapVectorDBStorage(BaseVectorStorage):
+    """Vector storage on a memory-mapped float32 matrix.
+
+    Vectors live in ``vdb_{namespace}.f32`` as a raw row-major matrix that is
+    mapped, not parsed, at startup, so every process serving the same working
+    dir shares the same pages. Ids and meta fields are appended as JSON lines
+    to the meta log ``vdb_{namespace}.meta.{generation}.jsonl`` and
+    ``vdb_{namespace}.rows.{generation}.i64`` maps every row to its current
+    record, so opening the storage only parses the small
+    ``vdb_{namespace}.head.json``; the id index is built from the log the
+    first time something is written or deleted. Deletes tombstone their row,
+    which the next insert reuses. Once superseded records make up
+    ``compaction_threshold`` of the log it is rewritten with the live records
+    only, under the next generation.
+
+    Writers hold ``vdb_{namespace}.lock`` and first replay what other
+    instances or processes on the same working dir appended to the log, so
+    several ``LightRAG`` instances can share one working dir; searches pick
+    those writes up when the header changes.
+
+    Setting ``ann_index="ivf_flat"`` in ``vector_db_storage_cls_kwargs`` adds an
+    approximate index persisted as ``vdb_{namespace}.ivf.npz``; ``ann_n_probe``
+    is its recall/latency knob and namespaces smaller than ``ann_min_rows``
+    keep using the exact scan.
+
+    ``quantization="int8"`` (or ``"float16"``) and the embedding function's
+    ``truncate_dim`` each make searches go through a compact first-pass copy
+    of the vectors: quantised with a per-vector scale, cut to the first
+    ``truncate_dim`` (Matryoshka) dimensions and renormalized, or both. It
+    lives in ``vdb_{namespace}[.d{truncate_dim}].{int8|float16|f32}`` (plus
+    ``.scale.f32``) and is what the ANN index is built on. Its ``.json`` state
+    file and the ANN file record the settings and log position they are in
+    sync with; rows written while they were not maintained are encoded or
+    filed when the storage opens, and they are rebuilt on a mismatch. The best
+    ``rerank_factor * top_k`` first-pass rows are re-ranked exactly against
+    the float32 matrix, so only the pages of those rows are read from it;
+    ``measure_recall`` reports what this costs against the exact scan.
+    """
+
+    cosine_better_than_threshold: float = 0.2
+    # rows to pre-allocate whenever the matrix file has to grow
+    grow_rows: int = 1024
+    ann_index: Union[str, None] = None
+    ann_n_probe: int = 8
+    ann_n_lists: Union[int, None] = None
+    ann_min_rows: int = 2048
+    quantization: Union[str, None] = None
+    rerank_factor: int = 4
+    # share of superseded records that makes the meta log worth rewriting
+    compaction_threshold: float = 0.5
+    compaction_min_bytes: int = 1 << 20
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_prefix = os.path.join(working_dir, f"vdb_{self.namespace}")
+        self._matrix_file_name = self._file_prefix + ".f32"
+        self._head_file_name = self._file_prefix + ".head.json"
+        self._lock = _FileLock.get(self._file_prefix + ".lock")
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._embedding_dim = self.embedding_func.embedding_dim
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+        storage_kwargs = self.global_config.get("vector_db_storage_cls_kwargs") or {}
+        self.grow_rows = storage_kwargs.get("grow_rows", self.grow_rows)
+        self.ann_index = storage_kwargs.get("ann_index", self.ann_index)
+        self.ann_n_probe = storage_kwargs.get("ann_n_probe", self.ann_n_probe)
+        self.ann_n_lists = storage_kwargs.get("ann_n_lists", self.ann_n_lists)
+        self.ann_min_rows = storage_kwargs.get("ann_min_rows", self.ann_min_rows)
+        self.quantization = storage_kwargs.get("quantization", self.quantization)
+        self.rerank_factor = storage_kwargs.get("rerank_factor", self.rerank_factor)
+        self.compaction_threshold = storage_kwargs.get(
+            "compaction_threshold", self.compaction_threshold
+        )
+        self.compaction_min_bytes = storage_kwargs.get(
+            "compaction_min_bytes", self.compaction_min_bytes
+        )
+        if self.quantization is not None and self.quantization not in QUANTIZED_DTYPES:
+            raise ValueError(f"Quantization {self.quantization} not supported")
+        if self.ann_index not in (None, "ivf_flat"):
+            raise ValueError(f"ANN index {self.ann_index} not supported")
+        self._truncate_dim = getattr(self.embedding_func, "truncate_dim", None)
+        if self._truncate_dim is not None and not (
+            0 < self._truncate_dim < self._embedding_dim
+        ):
+            raise ValueError(
+                f"truncate_dim must be below the embedding dim {self._embedding_dim}, got {self._truncate_dim}"
+            )
+
+        self._log_file = None
+        # stat of the header as of the last time _refresh_if_changed read it
+        self._head_stat = None
+        with self._lock:
+            self._open_log()
+            self._matrix = self._open_matrix(
+                self._matrix_file_name,
+                np.float32,
+                (self._embedding_dim,),
+                self._n_rows,
+            )
+            self._first_pass = None
+            self._first_pass_dim = self._truncate_dim or self._embedding_dim
+            if self.quantization is not None or self._truncate_dim is not None:
+                first_pass_name = f"vdb_{self.namespace}" + (
+                    f".d{self._truncate_dim}" if self._truncate_dim is not None else ""
+                )
+                self._first_pass_file_name = os.path.join(
+                    working_dir, f"{first_pass_name}.{self.quantization or 'f32'}"
+                )
+                self._scales_file_name = os.path.join(
+                    working_dir, f"{first_pass_name}.scale.f32"
+                )
+                self._first_pass_state_file_name = self._first_pass_file_name + ".json"
+                self._first_pass = self._open_first_pass(self._n_rows)
+                self._sync_first_pass()
+
+            self._ann_file_name = self._file_prefix + ".ivf.npz"
+            self._ann = None
+            if self.ann_index == "ivf_flat":
+                self._ann = IVFFlatIndex(
+                    n_probe=self.ann_n_probe, n_lists=self.ann_n_lists
+                )
+                stale_rows = None
+                # an index built for another truncate_dim is of no use
+                if (
+                    self._ann.load(self._ann_file_name)
+                    and self._ann.centroids.shape[1] == self._first_pass_dim
+                ):
+                    stale_rows = self._rows_changed_since(self._ann.position)
+                if stale_rows is None:
+                    self._retrain_ann()
+                else:
+                    self._ann.remove(stale_rows)
+                    self._update_ann(stale_rows[self._live[stale_rows]])
+        logger.info(
+            f"Load vector {self.namespace} with {len(self)} data from {self._matrix_file_name}"
+        )
+
+    def _log_file_name(self, generation: int) -> str:
+        return f"{self._file_prefix}.meta.{generation}.jsonl"
+
+    def _offsets_file_name(self, generation: int) -> str:
+        return f"{self._file_prefix}.rows.{generation}.i64"
+
+    def _save_head(self):
+        tmp_file_name = self._head_file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "embedding_dim": self._embedding_dim,
+                    "generation": self._generation,
+                    "n_rows": self._n_rows,
+                    "log_bytes": self._log_bytes,
+                },
+                f,
+            )
+        os.replace(tmp_file_name, self._head_file_name)
+
+    @staticmethod
+    def _encode_record(record: dict) -> bytes:
+        return (
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        ).encode("utf-8")
+
+    def _write_generation(
+        self, generation: int, lines: Iterable[tuple[int, bytes]], n_rows: int
+    ):
+        """Write a meta log and row offsets from scratch, then point the
+        header at them
+        """
+        offsets_file_name = self._offsets_file_name(generation)
+        if os.path.exists(offsets_file_name):
+            # left over by an interrupted compaction
+            os.remove(offsets_file_name)
+        offsets = self._open_matrix(offsets_file_name, np.int64, (2,), n_rows)
+        log_bytes = 0
+        with open(self._log_file_name(generation), "wb") as f:
+            for row, line in lines:
+                f.write(line)
+                offsets[row] = (log_bytes, len(line))
+                log_bytes += len(line)
+        offsets.flush()
+        del offsets
+        self._generation, self._n_rows, self._log_bytes = generation, n_rows, log_bytes
+        self._save_head()
+
+    def _open_log(self):
+        """Map the generation the header points at, creating the first one
+        (from the JSON sidecar of older versions if there is one) when missing
+        """
+        head = load_json(self._head_file_name)
+        if head is None:
+            json_meta_file_name = self._file_prefix + ".meta.json"
+            json_meta = load_json(json_meta_file_name) or {
+                "embedding_dim": self._embedding_dim,
+                "ids": [],
+                "meta": [],
+            }
+            self._embedding_dim_check(json_meta["embedding_dim"])
+            self._write_generation(
+                0,
+                (
+                    (row, self._encode_record({"k": k, "r": row, "m": meta}))
+                    for row, (k, meta) in enumerate(
+                        zip(json_meta["ids"], json_meta["meta"])
+                    )
+                    if k is not None
+                ),
+                len(json_meta["ids"]),
+            )
+            if os.path.exists(json_meta_file_name):
+                os.remove(json_meta_file_name)
+            head = load_json(self._head_file_name)
+        self._embedding_dim_check(head["embedding_dim"])
+        self._generation = head["generation"]
+        self._n_rows = head["n_rows"]
+        self._log_bytes = head["log_bytes"]
+        if self._log_file is not None:
+            self._log_file.close()
+        self._log_file = open(self._log_file_name(self._generation), "rb")
+        # (offset, length) of the current log record of every row, length 0
+        # for free rows
+        self._offsets = self._open_matrix(
+            self._offsets_file_name(self._generation), np.int64, (2,), self._n_rows
+        )
+        self._live = np.zeros(self._offsets.shape[0], dtype=bool)
+        self._live[: self._n_rows] = self._offsets[: self._n_rows, 1] > 0
+        self._n_live = int(self._live.sum())
+        # built by _ensure_index once something is written or deleted
+        self._id_to_row: Union[dict[str, int], None] = None
+        self._relation_index: Union[_RelationIndex, None] = None
+
+    def _embedding_dim_check(self, embedding_dim: int):
+        assert (
+            embedding_dim == self._embedding_dim
+        ), f"Embedding dim mismatch, expected: {self._embedding_dim}, but loaded: {embedding_dim}"
+
+    def _read_log(self, start: int, stop: int) -> list[dict]:
+        if stop <= start:
+            return []
+        self._log_file.seek(start)
+        return [
+            json.loads(line)
+            for line in self._log_file.read(stop - start).splitlines()
+            if line
+        ]
+
+    def _read_records(self, rows: np.ndarray) -> list[Union[dict, None]]:
+        records = []
+        for offset, length in self._offsets[rows].tolist():
+            if length <= 0:
+                # deleted by another instance since the last refresh
+                records.append(None)
+                continue
+            self._log_file.seek(offset)
+            records.append(json.loads(self._log_file.read(length)))
+        return records
+
+    def _append(self, records: list[dict]):
+        lines = [self._encode_record(record) for record in records]
+        with open(self._log_file_name(self._generation), "r+b") as f:
+            # drop whatever a writer that died before updating the header left
+            f.truncate(self._log_bytes)
+            f.seek(self._log_bytes)
+            f.write(b"".join(lines))
+        for record, line in zip(records, lines):
+            self._offsets[record["r"]] = (
+                (-1, 0) if "d" in record else (self._log_bytes, len(line))
+            )
+            self._log_bytes += len(line)
+        self._save_head()
+
+    def _index_record(self, record: dict):
+        if "d" in record:
+            self._id_to_row.pop(record["k"], None)
+            self._relation_index.discard([record["k"]])
+            return
+        self._id_to_row[record["k"]] = record["r"]
+        meta = record["m"]
+        if "src_id" in meta and "tgt_id" in meta:
+            self._relation_index.add(record["k"], meta["src_id"], meta["tgt_id"])
+
+    def _ensure_index(self):
+        if self._id_to_row is not None:
+            return
+        self._id_to_row = {}
+        self._relation_index = _RelationIndex()
+        for record in self._read_log(0, self._log_bytes):
+            self._index_record(record)
+
+    def _refresh(self):
+        """Catch up with what other instances wrote since this one last
+        looked; the caller holds the lock
+        """
+        head = load_json(self._head_file_name)
+        if (head["generation"], head["log_bytes"]) == (
+            self._generation,
+            self._log_bytes,
+        ):
+            return
+        if head["generation"] != self._generation:
+            # compacted elsewhere: rows kept their place, but the records in
+            # between are gone, so rebuild everything derived from the rows
+            self._open_log()
+            self._ensure_capacity(self._n_rows)
+            if self._first_pass is not None:
+                self._encode_first_pass(np.flatnonzero(self._live))
+            if self._ann is not None:
+                self._retrain_ann()
+            return
+        records = self._read_log(self._log_bytes, head["log_bytes"])
+        self._n_rows, self._log_bytes = head["n_rows"], head["log_bytes"]
+        self._ensure_capacity(self._n_rows)
+        if not records:
+            return
+        if self._id_to_row is not None:
+            for record in records:
+                self._index_record(record)
+        rows = np.unique([record["r"] for record in records])
+        self._live[rows] = self._offsets[rows, 1] > 0
+        self._n_live = int(self._live.sum())
+        live_rows = rows[self._live[rows]]
+        if self._first_pass is not None:
+            self._encode_first_pass(live_rows)
+        if self._ann is not None:
+            self._ann.remove(rows)
+            self._update_ann(live_rows)
+
+    def _refresh_if_changed(self):
+        # the header is replaced on every write, so an unchanged stat means
+        # nothing was written and spares reading it on every query
+        stat = os.stat(self._head_file_name)
+        head_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if head_stat == self._head_stat:
+            return
+        # the log only grows within a generation, so this pair tells whether
+        # anything was written since
+        head = load_json(self._head_file_name)
+        if (head["generation"], head["log_bytes"]) != (
+            self._generation,
+            self._log_bytes,
+        ):
+            with self._lock:
+                self._refresh()
+        # taken before reading, so a write in between is seen next time
+        self._head_stat = head_stat
+
+    @contextmanager
+    def _writing(self):
+        """Hold the lock on an up-to-date view with the id index loaded"""
+        with self._lock:
+            self._refresh()
+            self._ensure_index()
+            yield
+
+    def _open_matrix(
+        self, file_name: str, dtype: type, row_shape: tuple, min_rows: int
+    ) -> np.memmap:
+        row_bytes = int(np.prod(row_shape)) * np.dtype(dtype).itemsize
+        size = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+        capacity = size // row_bytes
+        if capacity < max(min_rows, 1):
+            capacity = max(min_rows, capacity * 2, self.grow_rows)
+            with open(file_name, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        return np.memmap(
+            file_name, dtype=dtype, mode="r+", shape=(capacity, *row_shape)
+        )
+
+    def _open_first_pass(self, min_rows: int) -> Union[np.memmap, QuantizedMatrix]:
+        if self.quantization is None:
+            return self._open_matrix(
+                self._first_pass_file_name,
+                np.float32,
+                (self._first_pass_dim,),
+                min_rows,
+            )
+        return QuantizedMatrix(
+            self._open_matrix(
+                self._first_pass_file_name,
+                QUANTIZED_DTYPES[self.quantization],
+                (self._first_pass_dim,),
+                min_rows,
+            ),
+            self._open_matrix(self._scales_file_name, np.float32, (), min_rows),
+        )
+
+    def _ensure_capacity(self, rows: int):
+        if rows > self._matrix.shape[0]:
+            self._matrix.flush()
+            del self._matrix
+            self._matrix = self._open_matrix(
+                self._matrix_file_name, np.float32, (self._embedding_dim,), rows
+            )
+        if self._first_pass is not None and rows > self._first_pass.shape[0]:
+            self._first_pass.flush()
+            self._first_pass = self._open_first_pass(rows)
+        if rows > self._offsets.shape[0]:
+            self._offsets.flush()
+            self._offsets = self._open_matrix(
+                self._offsets_file_name(self._generation), np.int64, (2,), rows
+            )
+            live = np.zeros(self._offsets.shape[0], dtype=bool)
+            live[: len(self._live)] = self._live
+            self._live = live
+
+    def _rows_changed_since(
+        self, position: Union[tuple[int, int], None]
+    ) -> Union[np.ndarray, None]:
+        """Rows with a log record past ``position``, a ``(generation,
+        log_bytes)`` the caller was in sync with; None when that can't be told
+        """
+        if position is None:
+            return None
+        generation, log_bytes = position
+        if generation != self._generation or log_bytes > self._log_bytes:
+            return None
+        return np.unique(
+            np.array(
+                [record["r"] for record in self._read_log(log_bytes, self._log_bytes)],
+                dtype=int,
+            )
+        )
+
+    @property
+    def _first_pass_settings(self) -> dict:
+        return {
+            "embedding_dim": self._embedding_dim,
+            "quantization": self.quantization,
+            "truncate_dim": self._truncate_dim,
+        }
+
+    def _sync_first_pass(self):
+        """Re-encode the first-pass rows written while it was not maintained,
+        e.g. by an instance without quantization, or all of them when its
+        state file is missing or was written with other settings
+        """
+        state = load_json(self._first_pass_state_file_name) or {}
+        rows = None
+        if (
+            all(state.get(k) == v for k, v in self._first_pass_settings.items())
+            and state.get("n_rows", 0) <= self._n_rows
+        ):
+            rows = self._rows_changed_since((state["generation"], state["log_bytes"]))
+        rows = np.flatnonzero(self._live) if rows is None else rows[self._live[rows]]
+        if len(rows):
+            logger.info(
+                f"Encoding {len(rows)} first-pass rows of {self.namespace} into {self._first_pass_file_name}"
+            )
+        self._encode_first_pass(rows)
+
+    def _encode_first_pass(self, rows: np.ndarray):
+        for start in range(0, len(rows), self.grow_rows):
+            block = rows[start : start + self.grow_rows]
+            self._first_pass[block] = self._truncate(self._matrix[block])
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        """First-pass form of normalized vectors: the renormalized
+        ``truncate_dim`` prefix, or the vectors themselves
+        """
+        if self._truncate_dim is None:
+            return np.asarray(vectors, dtype=np.float32)
+        return self._normalize(vectors[:, : self._truncate_dim])
+
+    @property
+    def _ann_matrix(self) -> Union[np.memmap, QuantizedMatrix]:
+        return self._first_pass if self._first_pass is not None else self._matrix
+
+    def __len__(self):
+        return self._n_live
+
+    async def upsert(self, data: dict[str, dict]):
+        logger.info(f"Inserting {len(data)} vectors to {self.namespace}")
+        if not len(data):
+            logger.warning("You insert an empty data to vector DB")
+            return []
+        contents = [v["content"] for v in data.values()]
+        batches = [
+            contents[i : i + self._max_batch_size]
+            for i in range(0, len(contents), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = self._normalize(np.concatenate(embeddings_list))
+
+        report_return = {"update": [], "insert": []}
+        with self._writing():
+            # reuse tombstoned rows, lowest first, before growing the matrix
+            free_rows = np.flatnonzero(~self._live[: self._n_rows])[::-1].tolist()
+            rows, records = [], []
+            for k, v in data.items():
+                row = self._id_to_row.get(k)
+                if row is None:
+                    if free_rows:
+                        row = free_rows.pop()
+                    else:
+                        row = self._n_rows
+                        self._n_rows += 1
+                    report_return["insert"].append(k)
+                else:
+                    report_return["update"].append(k)
+                record = {
+                    "k": k,
+                    "r": row,
+                    "m": {k1: v1 for k1, v1 in v.items() if k1 in self.meta_fields},
+                }
+                self._index_record(record)
+                records.append(record)
+                rows.append(row)
+
+            self._ensure_capacity(self._n_rows)
+            rows = np.array(rows)
+            self._matrix[rows] = embeddings
+            if self._first_pass is not None:
+                self._first_pass[rows] = self._truncate(embeddings)
+            self._live[rows] = True
+            self._n_live += len(report_return["insert"])
+            # vectors first, so the records never point at rows not written yet
+            self._append(records)
+            self._update_ann(rows)
+        return report_return
+
+    def _ann_trainable(self) -> bool:
+        return len(self) >= max(self.ann_min_rows, 1)
+
+    def _retrain_ann(self):
+        self._ann = IVFFlatIndex(n_probe=self.ann_n_probe, n_lists=self.ann_n_lists)
+        if self._ann_trainable():
+            self._ann.train(self._ann_matrix, np.flatnonzero(self._live))
+
+    def _update_ann(self, rows: np.ndarray):
+        if self._ann is None:
+            return
+        if self._ann.is_trained and not self._ann.needs_retrain():
+            self._ann.add(self._ann_matrix, rows)
+        elif self._ann_trainable():
+            self._ann.train(self._ann_matrix, np.flatnonzero(self._live))
+
+    def _use_ann(self) -> bool:
+        return (
+            self._ann is not None
+            and self._ann.is_trained
+            and len(self) >= self.ann_min_rows
+        )
+
+    def _exact_search(
+        self, queries: np.ndarray, top_k: int, first_pass: bool = False
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        n_rows = self._n_rows
+        if not first_pass:
+            scores = queries @ self._matrix[:n_rows].T
+        elif isinstance(self._first_pass, QuantizedMatrix):
+            scores = self._first_pass.scores(queries, n_rows)
+        else:
+            scores = queries @ self._first_pass[:n_rows].T
+        scores[:, ~self._live[:n_rows]] = -np.inf
+        top_k = min(top_k, n_rows)
+        if top_k <= 0:
+            return [(np.zeros(0, dtype=int), np.zeros(0)) for _ in queries]
+        results = []
+        for query_scores in scores:
+            best = np.argpartition(-query_scores, top_k - 1)[:top_k]
+            best = best[np.argsort(-query_scores[best])]
+            results.append((best, query_scores[best]))
+        return results
+
+    def _rerank(
+        self,
+        queries: np.ndarray,
+        hits: list[tuple[np.ndarray, np.ndarray]],
+        top_k: int,
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        results = []
+        for query, (rows, _) in zip(queries, hits):
+            rows = np.sort(rows[self._live[rows]])
+            scores = np.asarray(self._matrix[rows], dtype=np.float32) @ query
+            best = np.argsort(-scores)[:top_k]
+            results.append((rows[best], scores[best]))
+        return results
+
+    def _approximate_search(
+        self, queries: np.ndarray, top_k: int
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Top-k ``(rows, scores)`` through the configured ANN index and
+        first-pass copy, falling back to the exact scan
+        """
+        if self._first_pass is None:
+            if self._use_ann():
+                return self._ann.search(self._matrix, queries, top_k)
+            return self._exact_search(queries, top_k)
+        first_pass_queries = self._truncate(queries)
+        n_candidates = top_k * self.rerank_factor
+        if self._use_ann():
+            hits = self._ann.search(self._first_pass, first_pass_queries, n_candidates)
+        else:
+            hits = self._exact_search(first_pass_queries, n_candidates, first_pass=True)
+        return self._rerank(queries, hits, top_k)
+
+    async def measure_recall(self, queries: list[str], top_k: int = 10) -> float:
+        """Mean fraction of the exact top-k that the configured search finds"""
+        embeddings = self._normalize(await self.embedding_func(queries))
+        self._refresh_if_changed()
+        exact = self._exact_search(embeddings, top_k)
+        approximate = self._approximate_search(embeddings, top_k)
+        recall = float(
+            np.mean(
+                [
+                    len(np.intersect1d(a, e)) / max(len(e), 1)
+                    for (a, _), (e, _) in zip(approximate, exact)
+                ]
+            )
+        )
+        logger.info(
+            f"Recall@{top_k} of {self.namespace} over {len(queries)} queries: {recall:.4f}"
+        )
+        return recall
+
+    def _search(self, queries: np.ndarray, top_k: int) -> list[list[dict]]:
+        """Top-k rows above the cosine threshold for each normalized query"""
+        self._refresh_if_changed()
+        hits = self._approximate_search(queries, top_k)
+        results = []
+        for rows, scores in hits:
+            keep = scores >= self.cosine_better_than_threshold
+            results.append(
+                [
+                    {
+                        **record["m"],
+                        "__id__": record["k"],
+                        "id": record["k"],
+                        "distance": float(score),
+                    }
+                    for record, score in zip(
+                        self._read_records(rows[keep]), scores[keep]
+                    )
+                    if record is not None
+                ]
+            )
+        return results
+
+    async def query(self, query: str, top_k=5):
+        embedding = await self.embedding_func([query])
+        embedding = self._normalize(embedding)
+        return self._search(embedding, top_k)[0]
+
+    async def query_many(self, queries: list[str], top_k=5):
+        if not len(queries):
+            return []
+        batches = [
+            queries[i : i + self._max_batch_size]
+            for i in range(0, len(queries), self._max_batch_size)
+        ]
+        embeddings_list = await asyncio.gather(
+            *[self.embedding_func(batch) for batch in batches]
+        )
+        embeddings = self._normalize(np.concatenate(embeddings_list))
+        return self._search(embeddings, top_k)
+
+    def _delete_ids(self, ids: list[str]) -> int:
+        """Tombstone the rows of ``ids``; the caller is inside ``_writing``"""
+        records = [
+            {"k": k, "r": self._id_to_row[k], "d": 1}
+            for k in dict.fromkeys(ids)
+            if k in self._id_to_row
+        ]
+        if not records:
+            return 0
+        for record in records:
+            self._index_record(record)
+        rows = np.array([record["r"] for record in records])
+        self._live[rows] = False
+        self._n_live -= len(rows)
+        self._append(records)
+        if self._ann is not None:
+            self._ann.remove(rows)
+        return len(rows)
+
+    async def delete_entity(self, entity_name: str):
+        try:
+            entity_id = compute_mdhash_id(entity_name, prefix="ent-")
+
+            with self._writing():
+                deleted = self._delete_ids([entity_id])
+            if deleted:
+                logger.info(f"Entity {entity_name} have been deleted.")
+            else:
+                logger.info(f"No entity found with name {entity_name}.")
+        except Exception as e:
+            logger.error(f"Error while deleting entity {entity_name}: {e}")
+
+    async def delete_relation(self, entity_name: str):
+        try:
+            with self._writing():
+                ids_to_delete = list(self._relation_index.pop([entity_name]))
+                self._delete_ids(ids_to_delete)
+
+            if ids_to_delete:
+                logger.info(
+                    f"All relations related to entity {entity_name} have been deleted."
+                )
+            else:
+                logger.info(f"No relations found for entity {entity_name}.")
+        except Exception as e:
+            logger.error(
+                f"Error while deleting relations for entity {entity_name}: {e}"
+            )
+
+    async def delete_entities(self, entity_names: list[str]):
+        with self._writing():
+            deleted = self._delete_ids(
+                [
+                    compute_mdhash_id(entity_name, prefix="ent-")
+                    for entity_name in entity_names
+                ]
+                + list(self._relation_index.pop(entity_names))
+            )
+        logger.info(
+            f"Deleted {deleted} rows of {len(entity_names)} entities from {self.namespace}"
+        )
+
+    async def delete(self, ids: list[str]):
+        with self._writing():
+            self._delete_ids(ids)
+
+    def _compact(self):
+        """Rewrite the meta log with the live records only, as the next
+        generation; rows keep their place, trailing free rows are dropped
+        """
+        rows = np.flatnonzero(self._live)
+        old_log_bytes = self._log_bytes
+        old_files = [
+            self._log_file_name(self._generation),
+            self._offsets_file_name(self._generation),
+        ]
+        lines = []
+        for row, (offset, length) in zip(rows.tolist(), self._offsets[rows].tolist()):
+            self._log_file.seek(offset)
+            lines.append((row, self._log_file.read(length)))
+        self._write_generation(
+            self._generation + 1, lines, int(rows[-1]) + 1 if len(rows) else 0
+        )
+        id_to_row, relation_index = self._id_to_row, self._relation_index
+        self._open_log()
+        self._id_to_row, self._relation_index = id_to_row, relation_index
+        for file_name in old_files:
+            try:
+                os.remove(file_name)
+            except OSError:
+                # still open in another process on Windows; unused from now on
+                pass
+        logger.info(
+            f"Compacted meta log of {self.namespace} from {old_log_bytes} to {self._log_bytes} bytes"
+        )
+
+    async def index_done_callback(self):
+        with self._lock:
+            self._refresh()
+            self._matrix.flush()
+            if self._first_pass is not None:
+                self._first_pass.flush()
+            self._offsets.flush()
+            live_bytes = int(self._offsets[: self._n_rows, 1].sum())
+            if (
+                self._log_bytes >= self.compaction_min_bytes
+                and live_bytes < (1 - self.compaction_threshold) * self._log_bytes
+            ):
+                self._compact()
+            # both are in sync with everything up to here
+            if self._first_pass is not None:
+                write_json(
+                    {
+                        **self._first_pass_settings,
+                        "generation": self._generation,
+                        "log_bytes": self._log_bytes,
+                        "n_rows": self._n_rows,
+                    },
+                    self._first_pass_state_file_name,
+                )
+            if self._ann is not None:
+                self._ann.position = (self._generation, self._log_bytes)
+                self._ann.save(self._ann_file_name)
+
+
+@dataclass
+class SemanticQueryCache(StorageNameSpace):
+    """Embedding-similarity cache of final answers, checked before retrieval.
+
+    A query whose embedding is at least ``similarity_threshold`` cosine-similar
+    to a cached query with the same scope (every ``QueryParam`` field but
+    ``stream``) reuses its answer. Entries are tied to an index version that
+    ``invalidate`` bumps after the knowledge base changes, dropping every
+    entry unless ``clear_on_change`` is off; other instances sharing the
+    working dir pick the new version up from ``semantic_cache_{namespace}.json``.
+    """
+
+    embedding_func: EmbeddingFunc = None
+    similarity_threshold: float = 0.95
+    max_entries: int = 1000
+    clear_on_change: bool = True
+
+    def __post_init__(self):
+        working_dir = self.global_config["working_dir"]
+        self._file_name = os.path.join(
+            working_dir, f"semantic_cache_{self.namespace}.json"
+        )
+        self._matrix_file_name = os.path.join(
+            working_dir, f"semantic_cache_{self.namespace}.npy"
+        )
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        data = load_json(self._file_name) or {"index_version": 0, "entries": []}
+        self.index_version: int = data["index_version"]
+        # {"scope", "query", "response", "last_access"} per matrix row
+        self._entries: list[dict] = data["entries"]
+        self._matrix = np.zeros((0, self.embedding_func.embedding_dim), np.float32)
+        if self._entries and os.path.exists(self._matrix_file_name):
+            self._matrix = np.load(self._matrix_file_name)
+        if len(self._matrix) != len(self._entries):
+            self._entries, self._matrix = [], self._matrix[:0]
+        self._mtime = (
+            os.stat(self._file_name).st_mtime_ns
+            if os.path.exists(self._file_name)
+            else None
+        )
+
+    def _maybe_reload(self):
+        mtime = (
+            os.stat(self._file_name).st_mtime_ns
+            if os.path.exists(self._file_name)
+            else None
+        )
+        if mtime != self._mtime:
+            self._load()
+
+    @staticmethod
+    def scope_of(param: QueryParam) -> str:
+        # streaming changes how the answer is delivered, not the answer
+        return json.dumps(
+            {k: v for k, v in asdict(param).items() if k != "stream"}, sort_keys=True
+        )
+
+    async def lookup(
+        self, query: str, param: QueryParam
+    ) -> tuple[Union[str, None], np.ndarray]:
+        """Return the cached answer (or None) and the normalized query embedding"""
+        self._maybe_reload()
+        embedding = (await self.embedding_func([query]))[0].astype(np.float32)
+        embedding /= max(np.linalg.norm(embedding), 1e-12)
+        if not len(self._entries):
+            return None, embedding
+        scope = self.scope_of(param)
+        scores = self._matrix @ embedding
+        in_scope = np.array([e["scope"] == scope for e in self._entries])
+        scores[~in_scope] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None, embedding
+        self._entries[best]["last_access"] = time.time()
+        logger.info(
+            f"Semantic cache hit ({scores[best]:.3f}) for query: {self._entries[best]['query']}"
+        )
+        return self._entries[best]["response"], embedding
+
+    async def upsert(
+        self, query: str, embedding: np.ndarray, param: QueryParam, response: str
+    ):
+        self._entries.append(
+            {
+                "scope": self.scope_of(param),
+                "query": query,
+                "response": response,
+                "last_access": time.time(),
+            }
+        )
+        self._matrix = np.vstack([self._matrix, embedding[None, :]])
+        if len(self._entries) > self.max_entries:
+            keep = np.argsort([-e["last_access"] for e in self._entries])
+            keep = np.sort(keep[: self.max_entries])
+            self._entries = [self._entries[i] for i in keep]
+            self._matrix = self._matrix[keep]
+
+    async def invalidate(self):
+        """Forget every answer because the indexed knowledge changed"""
+        if not self.clear_on_change:
+            return
+        self._maybe_reload()
+        self.index_version += 1
+        self._entries, self._matrix = [], self._matrix[:0]
+        await self.index_done_callback()
+
+    async def index_done_callback(self):
+        with open(self._matrix_file_name, "wb") as f:
+            np.save(f, self._matrix)
+        write_json(
+            {"index_version": self.index_version, "entries": self._entries},
+            self._file_name,
+        )
+        self._mtime = os.stat(self._file_name).st_mtime_ns
+
+
+@dataclass
+class EmbeddingCache(StorageNameSpace):
+    """Content-addressed, least recently used cache of embeddings in front of
+    ``embedding_func``.
+
+    Vectors are keyed by the md5 of (model name, text), so every namespace and
+    every insert asking for the same text under the same model shares one
+    embedding. Query embeddings are served from the cache but never added to
+    it. Keys and vectors live in ``embedding_cache_{embedding_dim}d.{gen}.keys``
+    and ``.f32`` in the working dir; the vectors are memory-mapped and new
+    ones are appended on ``index_done_callback``. Past ``max_entries`` or
+    ``max_bytes`` the least recently used vectors are dropped, and once half
+    the saved rows are dropped the live ones are written to a new generation.
+    """
+
+    embedding_func: EmbeddingFunc = None
+    model_name: str = ""
+    max_entries: Union[int, None] = None
+    max_bytes: Union[int, None] = None
+
+    def __post_init__(self):
+        self._dim = self.embedding_func.embedding_dim
+        self._file_prefix = os.path.join(
+            self.global_config["working_dir"], f"embedding_cache_{self._dim}d"
+        )
+        self._head_file_name = self._file_prefix + ".json"
+        self._row_bytes = 16 + 4 * self._dim
+        self._generation = (load_json(self._head_file_name) or {}).get("generation", 0)
+        keys_file_name, vectors_file_name = self._file_names(self._generation)
+        n_saved = 0
+        if os.path.exists(keys_file_name) and os.path.exists(vectors_file_name):
+            # ignore a torn row at the end of either file
+            n_saved = min(
+                os.path.getsize(keys_file_name) // 16,
+                os.path.getsize(vectors_file_name) // (4 * self._dim),
+            )
+        keys = (
+            np.fromfile(keys_file_name, dtype="S16", count=n_saved).tolist()
+            if n_saved
+            else []
+        )
+        # key -> row, least recently used first; rows past the saved ones
+        # index _pending
+        self._rows: OrderedDict[bytes, int] = OrderedDict(
+            (k, i) for i, k in enumerate(keys)
+        )
+        self._open_saved(n_saved)
+        self._pending: list[np.ndarray] = []
+        self._n_dropped = n_saved - len(self._rows)
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"Load embedding cache with {len(self._rows)} vectors")
+        self._evict()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _file_names(self, generation: int) -> tuple[str, str]:
+        return (
+            f"{self._file_prefix}.{generation}.keys",
+            f"{self._file_prefix}.{generation}.f32",
+        )
+
+    def _open_saved(self, n_saved: int):
+        self._n_saved = n_saved
+        self._saved = (
+            np.memmap(
+                self._file_names(self._generation)[1],
+                dtype=np.float32,
+                mode="r",
+                shape=(n_saved, self._dim),
+            )
+            if n_saved
+            else np.zeros((0, self._dim), dtype=np.float32)
+        )
+
+    def _key(self, text: str) -> bytes:
+        return md5(f"{self.model_name}\n{text}".encode()).digest()
+
+    def _gather(self, rows: list[int]) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.empty((len(rows), self._dim), dtype=np.float32)
+        saved = rows < self._n_saved
+        vectors[saved] = self._saved[rows[saved]]
+        for i in np.flatnonzero(~saved):
+            vectors[i] = self._pending[rows[i] - self._n_saved]
+        return vectors
+
+    def _evict(self):
+        n_entries = len(self._rows)
+        if self.max_entries is not None:
+            n_entries = min(n_entries, self.max_entries)
+        if self.max_bytes is not None:
+            n_entries = min(n_entries, self.max_bytes // self._row_bytes)
+        while len(self._rows) > n_entries:
+            _, row = self._rows.popitem(last=False)
+            if row < self._n_saved:
+                self._n_dropped += 1
+
+    async def embed(self, texts: list[str], **kwargs) -> np.ndarray:
+        keys = [self._key(t) for t in texts]
+        vectors = np.empty((len(texts), self._dim), dtype=np.float32)
+        cached = [i for i, k in enumerate(keys) if k in self._rows]
+        if cached:
+            vectors[cached] = self._gather([self._rows[keys[i]] for i in cached])
+            for i in cached:
+                self._rows.move_to_end(keys[i])
+        missing = {k: t for k, t in zip(keys, texts) if k not in self._rows}
+        self.hits += len(cached)
+        self.misses += len(texts) - len(cached)
+        if not missing:
+            return vectors
+        embeddings = dict(
+            zip(
+                missing,
+                np.asarray(
+                    await self.embedding_func(list(missing.values()), **kwargs),
+                    dtype=np.float32,
+                ),
+            )
+        )
+        for i, k in enumerate(keys):
+            if k in embeddings:
+                vectors[i] = embeddings[k]
+        # one-off query texts would only push out document embeddings
+        if current_priority() != "query":
+            for k, v in embeddings.items():
+                if k not in self._rows:
+                    self._rows[k] = self._n_saved + len(self._pending)
+                    self._pending.append(v)
+            self._evict()
+        return vectors
+
+    def _write_generation(self):
+        keys = list(self._rows)
+        vectors = self._gather(list(self._rows.values()))
+        old_file_names = self._file_names(self._generation)
+        self._generation += 1
+        keys_file_name, vectors_file_name = self._file_names(self._generation)
+        np.array(keys, dtype="S16").tofile(keys_file_name)
+        vectors.astype("<f4").tofile(vectors_file_name)
+        tmp_file_name = self._head_file_name + ".tmp"
+        write_json({"generation": self._generation}, tmp_file_name)
+        os.replace(tmp_file_name, self._head_file_name)
+        for file_name in old_file_names:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        self._rows = OrderedDict((k, i) for i, k in enumerate(keys))
+        self._open_saved(len(keys))
+        self._n_dropped = 0
+
+    def _append_pending(self):
+        new = [(k, row) for k, row in self._rows.items() if row >= self._n_saved]
+        if new:
+            keys_file_name, vectors_file_name = self._file_names(self._generation)
+            for file_name, row_size in [
+                (keys_file_name, 16),
+                (vectors_file_name, 4 * self._dim),
+            ]:
+                # drop a torn row left by an interrupted append
+                if os.path.exists(file_name):
+                    os.truncate(file_name, self._n_saved * row_size)
+            with open(keys_file_name, "ab") as f:
+                f.write(np.array([k for k, _ in new], dtype="S16").tobytes())
+            with open(vectors_file_name, "ab") as f:
+                f.write(self._gather([row for _, row in new]).astype("<f4").tobytes())
+            for i, (k, _) in enumerate(new):
+                self._rows[k] = self._n_saved + i
+            self._open_saved(self._n_saved + len(new))
+
+    async def index_done_callback(self):
+        if self._n_dropped and self._n_dropped * 2 >= self._n_saved:
+            self._write_generation()
+        else:
+            self._append_pending()
+        self._pending = []
+        if self.hits or self.misses:
+            logger.info(
+                f"Embedding cache: {self.hits} hits, {self.misses} misses, "
+                f"{len(self._rows)} vectors"
+            )
+
+
 @dataclass
 class NetworkXStorage(BaseGraphStorage):
     @staticmethod
     def load_nx_graph(file_name) -> nx.Graph:
         if os.path.exists(file_name):
+            if file_name.endswith(".npz"):
+                return NetworkXStorage._read_snapshot(file_name)
             return nx.read_graphml(file_name)
         return None
 
@@ -171,7 +1925,145 @@ class NetworkXStorage(BaseGraphStorage):
         logger.info(
             f"Writing graph with {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges"
         )
-        nx.write_graphml(graph, file_name)
+        if file_name.endswith(".npz"):
+            NetworkXStorage._write_snapshot(graph, file_name)
+        else:
+            nx.write_graphml(graph, file_name)
+
+    @staticmethod
+    def export_graphml(
+        working_dir: str, namespace: str = "chunk_entity_relation"
+    ) -> Union[str, None]:
+        """Return the GraphML file of a graph, regenerating it from the binary
+        snapshot when it is missing or older than the snapshot
+        """
+        graphml_file = os.path.join(working_dir, f"graph_{namespace}.graphml")
+        snapshot_file = os.path.join(working_dir, f"graph_{namespace}.npz")
+        if not os.path.exists(snapshot_file):
+            return graphml_file if os.path.exists(graphml_file) else None
+        if not os.path.exists(graphml_file) or os.path.getmtime(
+            graphml_file
+        ) < os.path.getmtime(snapshot_file):
+            graph = NetworkXStorage._read_snapshot(snapshot_file)
+            tmp_file_name = graphml_file + ".tmp"
+            nx.write_graphml(graph, tmp_file_name)
+            os.replace(tmp_file_name, graphml_file)
+        return graphml_file
+
+    @staticmethod
+    def _pack_strings(values: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(v) for v in encoded], out=offsets[1:])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @staticmethod
+    def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> list[str]:
+        data = blob.tobytes()
+        offsets = offsets.tolist()
+        return [
+            data[start:end].decode("utf-8")
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+
+    @staticmethod
+    def _pack_columns(prefix: str, records: list[dict]) -> dict[str, np.ndarray]:
+        """Store the attributes of ``records`` column by column. Every column
+        has a presence mask; values are kept as strings, int64, float64 or
+        bool, and a column mixing those types is stored as JSON strings.
+        """
+        names = list(dict.fromkeys(key for record in records for key in record))
+        kinds = []
+        arrays = {}
+        for i, name in enumerate(names):
+            mask = np.array([name in record for record in records], dtype=bool)
+            values = [record[name] for record in records if name in record]
+            types = {type(v) for v in values}
+            if types == {bool}:
+                kind, column = "b", np.array(values, dtype=bool)
+            elif types == {int}:
+                kind, column = "i", np.array(values, dtype=np.int64)
+            elif types <= {int, float}:
+                kind, column = "f", np.array(values, dtype=np.float64)
+            else:
+                kind = "s" if types == {str} else "j"
+                if kind == "j":
+                    values = [json.dumps(v, ensure_ascii=False) for v in values]
+                column, arrays[f"{prefix}_col{i}_offsets"] = (
+                    NetworkXStorage._pack_strings(values)
+                )
+            kinds.append(kind)
+            arrays[f"{prefix}_col{i}"] = column
+            arrays[f"{prefix}_col{i}_mask"] = mask
+        (
+            arrays[f"{prefix}_names"],
+            arrays[f"{prefix}_names_offsets"],
+        ) = NetworkXStorage._pack_strings(names)
+        arrays[f"{prefix}_kinds"] = np.array("".join(kinds))
+        return arrays
+
+    @staticmethod
+    def _unpack_columns(prefix: str, data, n_records: int) -> list[dict]:
+        records = [{} for _ in range(n_records)]
+        names = NetworkXStorage._unpack_strings(
+            data[f"{prefix}_names"], data[f"{prefix}_names_offsets"]
+        )
+        for i, (name, kind) in enumerate(zip(names, str(data[f"{prefix}_kinds"]))):
+            if kind in "sj":
+                values = NetworkXStorage._unpack_strings(
+                    data[f"{prefix}_col{i}"], data[f"{prefix}_col{i}_offsets"]
+                )
+                if kind == "j":
+                    values = [json.loads(v) for v in values]
+            else:
+                values = data[f"{prefix}_col{i}"].tolist()
+            rows = np.flatnonzero(data[f"{prefix}_col{i}_mask"]).tolist()
+            for row, value in zip(rows, values):
+                records[row][name] = value
+        return records
+
+    @staticmethod
+    def _write_snapshot(graph: nx.Graph, file_name: str):
+        """Write ``graph`` as a node table, an edge table of node indices and
+        one array per attribute column, which loads far faster than GraphML
+        """
+        nodes = list(graph.nodes(data=True))
+        node_index = {node: i for i, (node, _) in enumerate(nodes)}
+        edges = list(graph.edges(data=True))
+        node_ids, node_offsets = NetworkXStorage._pack_strings(
+            [str(node) for node, _ in nodes]
+        )
+        arrays = {
+            "version": np.array(1),
+            "directed": np.array(graph.is_directed()),
+            "node_ids": node_ids,
+            "node_ids_offsets": node_offsets,
+            "edge_src": np.array([node_index[s] for s, _, _ in edges], dtype=np.int32),
+            "edge_tgt": np.array([node_index[t] for _, t, _ in edges], dtype=np.int32),
+            **NetworkXStorage._pack_columns("node", [d for _, d in nodes]),
+            **NetworkXStorage._pack_columns("edge", [d for _, _, d in edges]),
+        }
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file_name, file_name)
+
+    @staticmethod
+    def _read_snapshot(file_name: str) -> nx.Graph:
+        with np.load(file_name) as data:
+            graph = nx.DiGraph() if bool(data["directed"]) else nx.Graph()
+            node_ids = NetworkXStorage._unpack_strings(
+                data["node_ids"], data["node_ids_offsets"]
+            )
+            node_attrs = NetworkXStorage._unpack_columns("node", data, len(node_ids))
+            graph.add_nodes_from(zip(node_ids, node_attrs))
+            src = data["edge_src"].tolist()
+            tgt = data["edge_tgt"].tolist()
+            edge_attrs = NetworkXStorage._unpack_columns("edge", data, len(src))
+            graph.add_edges_from(
+                (node_ids[s], node_ids[t], d) for s, t, d in zip(src, tgt, edge_attrs)
+            )
+        return graph
 
     @staticmethod
     def stable_largest_connected_component(graph: nx.Graph) -> nx.Graph:
@@ -225,18 +2117,42 @@ class NetworkXStorage(BaseGraphStorage):
         self._graphml_xml_file = os.path.join(
             self.global_config["working_dir"], f"graph_{self.namespace}.graphml"
         )
-        preloaded_graph = NetworkXStorage.load_nx_graph(self._graphml_xml_file)
+        self._snapshot_file = os.path.join(
+            self.global_config["working_dir"], f"graph_{self.namespace}.npz"
+        )
+        # graphs written before the binary snapshot existed are still read
+        # from GraphML and migrate on the next flush
+        preloaded_file = (
+            self._snapshot_file
+            if os.path.exists(self._snapshot_file)
+            else self._graphml_xml_file
+        )
+        preloaded_graph = NetworkXStorage.load_nx_graph(preloaded_file)
         if preloaded_graph is not None:
             logger.info(
-                f"Loaded graph from {self._graphml_xml_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
+                f"Loaded graph from {preloaded_file} with {preloaded_graph.number_of_nodes()} nodes, {preloaded_graph.number_of_edges()} edges"
             )
         self._graph = preloaded_graph or nx.Graph()
+        # built on first use, then patched with the nodes touched since
+        self._csr: Union[CSRGraph, None] = None
+        self._csr_dirty = set()
         self._node_embed_algorithms = {
             "node2vec": self._node2vec_embed,
         }
 
+    def _csr_snapshot(self) -> CSRGraph:
+        if self._csr is None:
+            self._csr = CSRGraph.from_graph(self._graph)
+        elif self._csr_dirty:
+            self._csr.update(self._graph, self._csr_dirty)
+        self._csr_dirty = set()
+        return self._csr
+
+    async def get_csr_snapshot(self) -> CSRGraph:
+        return self._csr_snapshot()
+
     async def index_done_callback(self):
-        NetworkXStorage.write_nx_graph(self._graph, self._graphml_xml_file)
+        NetworkXStorage.write_nx_graph(self._graph, self._snapshot_file)
 
     async def has_node(self, node_id: str) -> bool:
         return self._graph.has_node(node_id)
@@ -263,13 +2179,62 @@ class NetworkXStorage(BaseGraphStorage):
             return list(self._graph.edges(source_node_id))
         return None
 
+    async def get_nodes(self, node_ids: list[str]) -> list[Union[dict, None]]:
+        return [self._graph.nodes.get(node_id) for node_id in node_ids]
+
+    async def node_degrees(self, node_ids: list[str]) -> list[int]:
+        return self._csr_snapshot().node_degrees(node_ids).tolist()
+
+    async def get_edges(
+        self, edge_pairs: list[tuple[str, str]]
+    ) -> list[Union[dict, None]]:
+        return [self._graph.edges.get(pair) for pair in edge_pairs]
+
+    async def edge_degrees(self, edge_pairs: list[tuple[str, str]]) -> list[int]:
+        return self._csr_snapshot().edge_degrees(edge_pairs).tolist()
+
+    async def get_nodes_edges(
+        self, node_ids: list[str]
+    ) -> list[Union[list[tuple[str, str]], None]]:
+        return self._csr_snapshot().node_edges(node_ids)
+
     async def upsert_node(self, node_id: str, node_data: dict[str, str]):
         self._graph.add_node(node_id, **node_data)
+        self._csr_dirty.add(node_id)
 
     async def upsert_edge(
         self, source_node_id: str, target_node_id: str, edge_data: dict[str, str]
     ):
         self._graph.add_edge(source_node_id, target_node_id, **edge_data)
+        self._csr_dirty.update((source_node_id, target_node_id))
+
+    async def upsert_nodes(self, nodes: dict[str, dict[str, str]]):
+        self._graph.add_nodes_from(nodes.items())
+        self._csr_dirty.update(nodes)
+
+    async def upsert_edges(self, edges: dict[tuple[str, str], dict[str, str]]):
+        self._graph.add_edges_from((src, tgt, v) for (src, tgt), v in edges.items())
+        self._csr_dirty.update(n for pair in edges for n in pair)
+
+    async def get_by_source_ids(
+        self, chunk_ids: list[str]
+    ) -> tuple[list[str], list[tuple[str, str]]]:
+        chunk_ids = set(chunk_ids)
+
+        def _matches(data: dict) -> bool:
+            return not chunk_ids.isdisjoint(
+                data.get("source_id", "").split(GRAPH_FIELD_SEP)
+            )
+
+        return (
+            [n for n, data in self._graph.nodes(data=True) if _matches(data)],
+            [(s, t) for s, t, data in self._graph.edges(data=True) if _matches(data)],
+        )
+
+    async def delete_edge(self, source_node_id: str, target_node_id: str):
+        if self._graph.has_edge(source_node_id, target_node_id):
+            self._graph.remove_edge(source_node_id, target_node_id)
+            self._csr_dirty.update((source_node_id, target_node_id))
 
     async def delete_node(self, node_id: str):
         """
@@ -278,6 +2243,8 @@ class NetworkXStorage(BaseGraphStorage):
         :param node_id: The node_id to delete
         """
         if self._graph.has_node(node_id):
+            self._csr_dirty.update(self._graph.neighbors(node_id))
+            self._csr_dirty.add(node_id)
             self._graph.remove_node(node_id)
             logger.info(f"Node {node_id} deleted from the graph.")
         else:
@@ -6,10 +6,16 @@ import json
 import logging
 import os
 import re
+import time
+from collections import deque
+from contextvars import ContextVar
 from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from functools import wraps
 from hashlib import md5
-from typing import Any, Union, List
+from typing import Any, AsyncIterator, Callable, Union, List
+from weakref import WeakKeyDictionary
 import xml.etree.ElementTree as ET
 
 import numpy as np
@@ -40,6 +46,10 @@ class EmbeddingFunc:
     embedding_dim: int
     max_token_size: int
     func: callable
+    # leading dimensions that still make a usable embedding on their own
+    # (Matryoshka models such as text-embedding-3), searched before re-ranking
+    # on the full vector
+    truncate_dim: Union[int, None] = None
 
     async def __call__(self, *args, **kwargs) -> np.ndarray:
         return await self.func(*args, **kwargs)
@@ -73,28 +83,504 @@ def compute_mdhash_id(content, prefix: str = ""):
     return prefix + md5(content.encode()).hexdigest()
 
 
-def limit_async_func_call(max_size: int, waitting_time: float = 0.0001):
-    """Add restriction of maximum async calling times for a async func"""
+# spoken fillers that do not change what a query asks for
+FILLER_WORDS = frozenset(
+    ["um", "umm", "uh", "uhm", "uhh", "er", "erm", "ah", "hmm", "mm", "please", "hey"]
+)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase ``query`` and drop punctuation, extra whitespace and filler
+    words, so rephrasings of the same question share a cache key"""
+    words = re.sub(r"[^\w\s]", " ", query.lower()).split()
+    return " ".join(w for w in words if w not in FILLER_WORDS)
+
+
+# most urgent first: a live query, then description summaries, then ingestion
+PRIORITY_CLASSES = ("query", "summary", "extraction")
+_call_priority: ContextVar[str] = ContextVar("lightrag_call_priority", default="query")
+
+
+def current_priority() -> str:
+    return _call_priority.get()
+
+
+def priority_scope(priority: str):
+    """Run an async func, and every call it makes through a ``PriorityLimiter``,
+    under the given priority class"""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class {priority}")
 
     def final_decro(func):
-        """Not using async.Semaphore to aovid use nest-asyncio"""
-        __current_size = 0
+        @wraps(func)
+        async def wait_func(*args, **kwargs):
+            token = _call_priority.set(priority)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _call_priority.reset(token)
+
+        return wait_func
+
+    return final_decro
+
+
+class _LoopSlots:
+    """Slots in use and waiters of a ``PriorityLimiter`` on one event loop"""
+
+    def __init__(self):
+        self.running = 0
+        self.running_by_class = {c: 0 for c in PRIORITY_CLASSES}
+        self.waiters: dict[str, deque[asyncio.Future]] = {
+            c: deque() for c in PRIORITY_CLASSES
+        }
+
+
+class PriorityLimiter:
+    """Concurrency limiter that hands each free slot to the most urgent waiter.
+
+    Waiters of a priority class are served first-come first-served, and a class
+    is only served once every more urgent class is empty or at its cap in
+    ``class_limits``. Waiting is on futures resolved by ``release``, not
+    polling. Slots and waiters are kept per running event loop, so a release
+    only ever wakes futures of its own loop and ``max_size`` caps each loop.
+    """
+
+    def __init__(self, max_size: int, class_limits: Union[dict, None] = None):
+        self.max_size = max_size
+        self.class_limits = class_limits or {}
+        self._loops: WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopSlots] = (
+            WeakKeyDictionary()
+        )
+        self._stats = {
+            c: {"calls": 0, "max_waiting": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for c in PRIORITY_CLASSES
+        }
+
+    def _slots(self) -> _LoopSlots:
+        loop = asyncio.get_running_loop()
+        slots = self._loops.get(loop)
+        if slots is None:
+            slots = self._loops[loop] = _LoopSlots()
+        return slots
+
+    def _can_start(self, slots: _LoopSlots, priority: str) -> bool:
+        return slots.running < self.max_size and slots.running_by_class[
+            priority
+        ] < self.class_limits.get(priority, self.max_size)
+
+    def _dispatch(self, slots: _LoopSlots):
+        for priority in PRIORITY_CLASSES:
+            waiters = slots.waiters[priority]
+            while waiters and self._can_start(slots, priority):
+                future = waiters.popleft()
+                if future.done():  # cancelled while waiting
+                    continue
+                slots.running += 1
+                slots.running_by_class[priority] += 1
+                future.set_result(None)
+
+    async def acquire(self, priority: str):
+        stats = self._stats[priority]
+        stats["calls"] += 1
+        slots = self._slots()
+        future = asyncio.get_running_loop().create_future()
+        waiters = slots.waiters[priority]
+        waiters.append(future)
+        self._dispatch(slots)
+        if not future.done():
+            stats["max_waiting"] = max(stats["max_waiting"], len(waiters))
+        start = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was handed over right before the cancellation
+                self.release(priority)
+            raise
+        wait = time.perf_counter() - start
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+
+    def release(self, priority: str):
+        slots = self._slots()
+        slots.running -= 1
+        slots.running_by_class[priority] -= 1
+        self._dispatch(slots)
+
+    def stats(self) -> dict[str, dict]:
+        """Queue depth and wait times (seconds) per priority class, summed
+        over event loops"""
+        loops = list(self._loops.values())
+        return {
+            c: {
+                "running": sum(slots.running_by_class[c] for slots in loops),
+                "waiting": sum(
+                    not f.done() for slots in loops for f in slots.waiters[c]
+                ),
+                "calls": s["calls"],
+                "max_waiting": s["max_waiting"],
+                "avg_wait": s["total_wait"] / s["calls"] if s["calls"] else 0.0,
+                "max_wait": s["max_wait"],
+            }
+            for c, s in self._stats.items()
+        }
+
+
+class _Slot:
+    """The ``PriorityLimiter`` slot of one limited call"""
+
+    def __init__(self, limiter: PriorityLimiter, priority: str):
+        self.limiter = limiter
+        self.priority = priority
+        self.held = False
+
+    async def acquire(self):
+        await self.limiter.acquire(self.priority)
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.limiter.release(self.priority)
+
+
+# slot of the limited call running in this context, which a RateLimiter hands
+# back while the call waits for quota
+_running_slot: ContextVar[Union[_Slot, None]] = ContextVar(
+    "lightrag_running_slot", default=None
+)
+
+
+class _SlotHoldingStream:
+    """Async iterator over a streamed result that keeps the limiter slot of
+    the call that opened it until the stream is exhausted, fails or is
+    closed"""
+
+    def __init__(self, stream: AsyncIterator, slot: _Slot):
+        self._stream = stream
+        self._slot = slot
+        self._loop = asyncio.get_running_loop()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._slot.held:
+            raise StopAsyncIteration
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            self._slot.release()
+            raise
+
+    async def aclose(self):
+        self._slot.release()
+        aclose = getattr(self._stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    def __del__(self):
+        # dropped without being consumed or closed
+        if self._slot.held and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._slot.release)
+
+
+def limit_async_func_call(max_size: int, class_limits: Union[dict, None] = None):
+    """Add restriction of maximum async calling times for a async func,
+    scheduling waiting calls by the priority class they run under. A call
+    returning an async iterator, such as a streamed completion, holds its
+    slot until the iterator is exhausted or closed."""
+
+    def final_decro(func):
+        limiter = PriorityLimiter(max_size, class_limits)
 
         @wraps(func)
         async def wait_func(*args, **kwargs):
-            nonlocal __current_size
-            while __current_size >= max_size:
-                await asyncio.sleep(waitting_time)
-            __current_size += 1
-            result = await func(*args, **kwargs)
-            __current_size -= 1
+            slot = _Slot(limiter, current_priority())
+            await slot.acquire()
+            token = _running_slot.set(slot)
+            try:
+                result = await func(*args, **kwargs)
+            except BaseException:
+                slot.release()
+                raise
+            finally:
+                _running_slot.reset(token)
+            if isinstance(result, AsyncIterator):
+                return _SlotHoldingStream(result, slot)
+            slot.release()
             return result
 
+        wait_func.limiter = limiter
         return wait_func
 
     return final_decro
 
 
+class _BatchQueue:
+    """Calls waiting to be merged into one batch on an event loop"""
+
+    def __init__(self):
+        self.pending: list[tuple[list, asyncio.Future, str]] = []
+        self.size = 0
+        self.flush_handle: Union[asyncio.TimerHandle, None] = None
+        # running batches, referenced until they finish
+        self.tasks: set[asyncio.Task] = set()
+
+
+def _resolve_with_error(future: asyncio.Future, error: BaseException):
+    if future.done():
+        return
+    if isinstance(error, asyncio.CancelledError):
+        future.cancel()
+    else:
+        future.set_exception(error)
+
+
+def batch_async_func_calls(max_batch_size: int, max_wait_time: float = 0.005):
+    """Merge concurrent calls of an async ``func(items: list)``, such as an
+    embedding function, into batched calls.
+
+    Calls arriving within ``max_wait_time`` seconds of the first pending one
+    are sent together as soon as the window closes or ``max_batch_size`` items
+    are waiting, and each caller gets back its own slice of the result (an
+    array or a list). When a merged call fails, each caller's items are sent
+    again on their own, so one bad input only fails its own caller.
+    Calls that are already full batches or pass keyword arguments go straight
+    through.
+    """
+
+    def final_decro(func):
+        queues: WeakKeyDictionary[asyncio.AbstractEventLoop, _BatchQueue] = (
+            WeakKeyDictionary()
+        )
+
+        async def _run_batch(batch: list[tuple[list, asyncio.Future, str]]):
+            try:
+                # the batch is as urgent as its most urgent caller
+                _call_priority.set(
+                    min((p for _, _, p in batch), key=PRIORITY_CLASSES.index)
+                )
+                unique_items = list(
+                    dict.fromkeys(i for items, _, _ in batch for i in items)
+                )
+                try:
+                    results = await func(unique_items)
+                except Exception as e:
+                    if len(batch) == 1:
+                        _resolve_with_error(batch[0][1], e)
+                        return
+                    logger.warning(
+                        f"Batch of {len(batch)} calls failed ({e!r}), "
+                        "retrying each call on its own"
+                    )
+                    await asyncio.gather(*[_run_batch([call]) for call in batch])
+                    return
+                positions = {item: n for n, item in enumerate(unique_items)}
+                for items, future, _ in batch:
+                    if future.done():
+                        continue
+                    rows = [positions[i] for i in items]
+                    future.set_result(
+                        results[rows]
+                        if isinstance(results, np.ndarray)
+                        else [results[n] for n in rows]
+                    )
+                logger.debug(
+                    f"Merged {len(batch)} calls into one batch of {len(unique_items)}"
+                )
+            except BaseException as e:
+                for _, future, _ in batch:
+                    _resolve_with_error(future, e)
+                if not isinstance(e, Exception):
+                    raise
+
+        def _flush(queue: _BatchQueue):
+            if queue.flush_handle is not None:
+                queue.flush_handle.cancel()
+                queue.flush_handle = None
+            batch, queue.pending, queue.size = queue.pending, [], 0
+            if batch:
+                task = asyncio.ensure_future(_run_batch(batch))
+                queue.tasks.add(task)
+                task.add_done_callback(queue.tasks.discard)
+
+        @wraps(func)
+        async def wait_func(items: list, **kwargs):
+            if kwargs or len(items) >= max_batch_size:
+                return await func(items, **kwargs)
+            loop = asyncio.get_running_loop()
+            queue = queues.get(loop)
+            if queue is None:
+                queue = queues[loop] = _BatchQueue()
+            if queue.size + len(items) > max_batch_size:
+                _flush(queue)
+            future = loop.create_future()
+            queue.pending.append((items, future, current_priority()))
+            queue.size += len(items)
+            if queue.size >= max_batch_size:
+                _flush(queue)
+            elif queue.flush_handle is None:
+                queue.flush_handle = loop.call_later(max_wait_time, _flush, queue)
+            return await future
+
+        return wait_func
+
+    return final_decro
+
+
+class RateLimitExceeded(Exception):
+    """Raised by model functions when a provider answers 429, carrying its
+    ``retry-after`` in seconds when it sent one"""
+
+    def __init__(self, message: str, retry_after: Union[float, str, None] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(error: Exception) -> Union[float, None]:
+    """Seconds a rate-limit error asks to wait, from ``retry_after`` or the
+    ``retry-after-ms``/``retry-after`` headers of its response"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        headers = headers or getattr(error, "headers", None) or {}
+        if headers.get("retry-after-ms") is not None:
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except (TypeError, ValueError):
+                pass
+        retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(
+            (
+                parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)
+            ).total_seconds(),
+            0.0,
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token buckets pacing calls to a provider's requests and tokens per minute.
+
+    A call reserves one request and its estimated tokens up front and sleeps
+    off whatever the buckets are short, so calls go out at the quota in arrival
+    order instead of bursting into 429s. Each bucket holds ``window_seconds``
+    of quota, the window providers such as Azure OpenAI enforce limits over.
+    ``pause`` holds every caller back, e.g. for a provider's ``retry-after``.
+    A call made under ``limit_async_func_call`` gives its concurrency slot
+    back while it waits, so a throttled call doesn't hold up the queue.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Union[int, None] = None,
+        tokens_per_minute: Union[int, None] = None,
+        window_seconds: float = 10.0,
+        max_retries: int = 3,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        # [refill per second, capacity, level] for requests and tokens
+        self._buckets = [
+            [limit / 60, limit * window_seconds / 60, limit * window_seconds / 60]
+            if limit
+            else None
+            for limit in (requests_per_minute, tokens_per_minute)
+        ]
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        delay = max(self._paused_until - now, 0.0)
+        for bucket, cost in zip(self._buckets, (1, tokens)):
+            if bucket is None:
+                continue
+            bucket[2] = min(bucket[1], bucket[2] + elapsed * bucket[0])
+            # a call larger than the bucket only has to wait for a full one
+            bucket[2] -= min(cost, bucket[1])
+            if bucket[2] < 0:
+                delay = max(delay, -bucket[2] / bucket[0])
+        return delay
+
+    async def acquire(self, tokens: int = 0):
+        delay = self._reserve(tokens)
+        if delay <= 0:
+            return
+        slot = _running_slot.get()
+        if slot is None or not slot.held:
+            await asyncio.sleep(delay)
+            return
+        slot.release()
+        await asyncio.sleep(delay)
+        await slot.acquire()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # whatever was left in the buckets was not really available
+        for bucket in self._buckets:
+            if bucket is not None:
+                bucket[2] = min(bucket[2], 0.0)
+
+    async def call(self, tokens: int, func: Callable, *args, **kwargs):
+        """Await ``func(*args, **kwargs)`` within the quota, pausing and retrying
+        when it fails with a ``retry-after``"""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Rate limited, pausing for {retry_after:.1f}s: {e}")
+                self.pause(retry_after)
+
+
+def count_message_tokens(
+    messages: list[dict], max_tokens: Union[int, None] = None
+) -> int:
+    """Estimated quota cost of a chat request: its prompt plus the completion
+    budget, which providers reserve up front"""
+    return sum(len(encode_string_by_tiktoken(m["content"])) for m in messages) + (
+        max_tokens or 0
+    )
+
+
+def rate_limit_async_func_call(limiter: RateLimiter, count_tokens: Callable):
+    """Pace an async func with ``limiter``, costing each call
+    ``count_tokens(*args, **kwargs)`` tokens"""
+
+    def final_decro(func):
+        @wraps(func)
+        async def wait_func(*args, **kwargs):
+            tokens = count_tokens(*args, **kwargs) if limiter.tokens_per_minute else 0
+            return await limiter.call(tokens, func, *args, **kwargs)
+
+        return wait_func
+
+    return final_decro
+
+
+def streaming_model_func(func):
+    """Mark an LLM function as answering ``stream=True`` with an async
+    iterator of text chunks"""
+    func.supports_stream = True
+    return func
+
+
 def wrap_embedding_func_with_attrs(**kwargs):
     """Wrap a function with attributes"""
 
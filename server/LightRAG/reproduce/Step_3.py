@@ -2,7 +2,7 @@ import re
 import json
 import asyncio
 from lightrag import LightRAG, QueryParam
-from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
 
 
 def extract_queries(file_path):
@@ -44,11 +44,19 @@ def run_queries_and_save_to_json(
         result_file.write("[\n")
         first_entry = True
 
-        for query_text in tqdm(queries, desc="Processing queries", unit="query"):
-            result, error = loop.run_until_complete(
-                process_query(query_text, rag_instance, query_param)
+        # issued together, so their vector lookups share query_many calls
+        outcomes = loop.run_until_complete(
+            tqdm_asyncio.gather(
+                *[
+                    process_query(query_text, rag_instance, query_param)
+                    for query_text in queries
+                ],
+                desc="Processing queries",
+                unit="query",
             )
+        )
 
+        for result, error in outcomes:
             if result:
                 if not first_entry:
                     result_file.write(",\n")
@@ -0,0 +1,58 @@
+import asyncio
+
+from lightrag.clients import HTTPClientPool
+
+
+def test_clients_are_reused_within_a_loop():
+    pool = HTTPClientPool()
+
+    async def run():
+        session = pool.aiohttp_session("azure_openai", "https://a.example", "key")
+        client = pool.openai_client("https://b.example", "key")
+        assert pool.aiohttp_session("azure_openai", "https://a.example", "key") is (
+            session
+        )
+        assert pool.openai_client("https://b.example", "key") is client
+        # another key or endpoint gets its own client
+        other = pool.aiohttp_session("azure_openai", "https://a.example", "other")
+        assert other is not session
+        assert pool.openai_client("https://c.example", "key") is not client
+        await pool.aclose()
+
+    asyncio.run(run())
+
+
+def test_each_loop_gets_its_own_clients():
+    pool = HTTPClientPool()
+
+    async def get():
+        return pool.aiohttp_session("azure_openai", "https://a.example", "key")
+
+    loops = [asyncio.new_event_loop() for _ in range(2)]
+    try:
+        first, second = [loop.run_until_complete(get()) for loop in loops]
+        assert first is not second
+        assert loops[0].run_until_complete(get()) is first
+        loops[0].run_until_complete(pool.aclose())
+        assert first.closed and not second.closed
+        loops[1].run_until_complete(pool.aclose())
+    finally:
+        for loop in loops:
+            loop.close()
+
+
+def test_aclose_closes_the_clients_of_the_current_loop():
+    pool = HTTPClientPool()
+
+    async def run():
+        session = pool.aiohttp_session("azure_openai", "https://a.example", "key")
+        client = pool.openai_client("https://b.example", "key")
+        await pool.aclose()
+        assert session.closed
+        assert client.is_closed()
+        # the next call starts a fresh client
+        fresh = pool.aiohttp_session("azure_openai", "https://a.example", "key")
+        assert fresh is not session and not fresh.closed
+        await pool.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+import asyncio
+import random
+from collections import Counter
+
+import networkx as nx
+import numpy as np
+
+from lightrag.csr import CSRGraph
+from lightrag.prompt import GRAPH_FIELD_SEP
+from lightrag.storage import NetworkXStorage
+
+
+def _assert_matches(csr: CSRGraph, graph: nx.Graph, known_nodes):
+    assert len(csr) == graph.number_of_nodes()
+    nodes = sorted(known_nodes)
+    rows = csr.rows(nodes)
+    assert [row >= 0 for row in rows] == [n in graph for n in nodes]
+    assert csr.node_degrees(nodes).tolist() == [
+        graph.degree(n) if n in graph else 0 for n in nodes
+    ]
+    for node_id, edges in zip(nodes, csr.node_edges(nodes)):
+        if node_id not in graph:
+            assert edges is None
+            continue
+        assert sorted(t for _, t in edges) == sorted(graph.adj[node_id])
+        row = csr.node_index[node_id]
+        weights = dict(
+            zip(
+                [csr.node_ids[j] for j in csr.neighbors(row)],
+                csr.weights[csr.indptr[row] : csr.indptr[row + 1]].tolist(),
+            )
+        )
+        assert weights == {m: d["weight"] for m, d in graph.adj[node_id].items()}
+        expected_chunks = Counter(
+            c
+            for m in graph.adj[node_id]
+            for c in graph.nodes[m]["source_id"].split(GRAPH_FIELD_SEP)
+        )
+        assert csr.neighbor_chunk_counts(node_id) == dict(expected_chunks)
+
+
+def _random_node(rng: random.Random) -> tuple[str, dict]:
+    chunks = rng.sample([f"chunk-{i}" for i in range(8)], rng.randint(1, 3))
+    return f"N{rng.randrange(40)}", {"source_id": GRAPH_FIELD_SEP.join(chunks)}
+
+
+def test_incremental_updates_match_a_full_build():
+    rng = random.Random(0)
+    graph = nx.Graph()
+    for _ in range(30):
+        node_id, data = _random_node(rng)
+        graph.add_node(node_id, **data)
+    csr = CSRGraph.from_graph(graph)
+    known_nodes = set(graph.nodes)
+    for _ in range(200):
+        dirty = set()
+        action = rng.random()
+        if action < 0.4:
+            src, tgt = rng.sample(list(graph.nodes), 2)
+            graph.add_edge(src, tgt, weight=float(rng.randint(1, 5)))
+            dirty.update((src, tgt))
+        elif action < 0.6:
+            node_id, data = _random_node(rng)
+            graph.add_node(node_id, **data)
+            dirty.add(node_id)
+        elif action < 0.8 and graph.number_of_edges():
+            src, tgt = rng.choice(list(graph.edges))
+            graph.remove_edge(src, tgt)
+            dirty.update((src, tgt))
+        elif graph.number_of_nodes() > 2:
+            node_id = rng.choice(list(graph.nodes))
+            dirty.update(graph.adj[node_id])
+            dirty.add(node_id)
+            graph.remove_node(node_id)
+        known_nodes.update(dirty)
+        csr.update(graph, dirty)
+        _assert_matches(csr, graph, known_nodes)
+
+    rebuilt = CSRGraph.from_graph(graph)
+    _assert_matches(rebuilt, graph, known_nodes)
+
+
+def test_edge_degrees_sum_both_endpoints():
+    graph = nx.Graph()
+    graph.add_node("A", source_id="c1")
+    graph.add_node("B", source_id="c2")
+    graph.add_node("C", source_id="c1")
+    graph.add_edge("A", "B", weight=1.0)
+    graph.add_edge("A", "C", weight=1.0)
+    csr = CSRGraph.from_graph(graph)
+    assert csr.edge_degrees([("A", "B"), ("B", "X")]).tolist() == [3, 1]
+    assert csr.edge_degrees([]).tolist() == []
+    assert np.array_equal(csr.rows(["X"]), [-1])
+
+
+def test_networkx_storage_snapshot_follows_writes(tmp_path):
+    async def run():
+        storage = NetworkXStorage(
+            namespace="chunk_entity_relation",
+            global_config={"working_dir": str(tmp_path)},
+        )
+        await storage.upsert_nodes({n: {"source_id": "c1"} for n in ["A", "B", "C"]})
+        await storage.upsert_edges({("A", "B"): {"weight": 1.0}})
+        csr = await storage.get_csr_snapshot()
+        assert csr.node_degrees(["A", "C"]).tolist() == [1, 0]
+
+        await storage.upsert_edge("A", "C", {"weight": 2.0})
+        await storage.delete_node("B")
+        csr = await storage.get_csr_snapshot()
+        assert csr.node_degrees(["A", "B", "C"]).tolist() == [1, 0, 1]
+        assert csr.node_edges(["B"]) == [None]
+
+    asyncio.run(run())
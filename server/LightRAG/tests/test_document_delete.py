@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import re
+
+import numpy as np
+import pytest
+
+import lightrag.lightrag as lightrag_module
+from lightrag.lightrag import DOC_INDEX_MARKER, LightRAG
+from lightrag.utils import EmbeddingFunc, compute_mdhash_id
+
+# every paragraph is a chunk holding "REL <source> <target> <tag>" lines
+DOC_1 = "REL ALICE BOB shared\n\nREL BOB CAROL one\n\nREL DAN ERIN one"
+DOC_2 = "REL ALICE BOB shared\n\nREL FRANK GINA two"
+
+
+def _chunking(content, **kwargs):
+    return [
+        {"tokens": 1, "content": part.strip(), "chunk_order_index": i}
+        for i, part in enumerate(content.split("\n\n"))
+    ]
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(
+        [
+            np.frombuffer(hashlib.md5(t.encode()).digest()[:8], dtype=np.uint8)
+            for t in texts
+        ]
+    ).astype(np.float32)
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Chunk texts the fake LLM has been asked to extract"""
+    monkeypatch.setattr(lightrag_module, "chunking_by_token_size", _chunking)
+    return []
+
+
+def _rag(working_dir, extracted: list) -> LightRAG:
+    async def llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+        text = prompt.rsplit("Text:", 1)[-1].split("######################")[0]
+        records = []
+        for source, target, tag in re.findall(r"REL (\w+) (\w+) (\w+)", text):
+            records += [
+                f'("entity"<|>"{source}"<|>"PERSON"<|>"{source} {tag}")',
+                f'("entity"<|>"{target}"<|>"PERSON"<|>"{target} {tag}")',
+                f'("relationship"<|>"{source}"<|>"{target}"<|>"{tag}"<|>"kw"<|>1)',
+            ]
+        extracted.append(text.strip())
+        return "##".join(records) + "<|COMPLETE|>"
+
+    return LightRAG(
+        working_dir=str(working_dir),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(embedding_dim=8, max_token_size=100, func=_embed),
+        entity_extract_max_gleaning=0,
+        enable_llm_cache=False,
+    )
+
+
+def _graph(rag: LightRAG):
+    graph = rag.chunk_entity_relation_graph._graph
+    return sorted(n.strip('"') for n in graph.nodes), sorted(
+        tuple(sorted(n.strip('"') for n in edge)) for edge in graph.edges
+    )
+
+
+def _chunk_id(content: str) -> str:
+    return compute_mdhash_id(content, prefix="chunk-")
+
+
+def test_deleting_a_doc_keeps_what_another_doc_shares(tmp_path, extracted):
+    rag = _rag(tmp_path, extracted)
+    shared = _chunk_id("REL ALICE BOB shared")
+
+    async def run():
+        await rag.ainsert([DOC_1, DOC_2])
+        await rag.adelete_by_doc(compute_mdhash_id(DOC_1, prefix="doc-"))
+        after_first = (
+            _graph(rag),
+            sorted(await rag.text_chunks.all_keys()),
+            await rag.chunk_docs.get_by_id(shared),
+        )
+        await rag.adelete_by_doc(compute_mdhash_id(DOC_2, prefix="doc-"))
+        return after_first
+
+    (nodes, edges), chunk_ids, owners = asyncio.run(run())
+    assert nodes == ["ALICE", "BOB", "FRANK", "GINA"]
+    assert edges == [("ALICE", "BOB"), ("FRANK", "GINA")]
+    assert chunk_ids == sorted([shared, _chunk_id("REL FRANK GINA two")])
+    assert owners == {"doc_ids": [compute_mdhash_id(DOC_2, prefix="doc-")]}
+
+    assert _graph(rag) == ([], [])
+    assert asyncio.run(rag.text_chunks.all_keys()) == []
+    assert asyncio.run(rag.full_docs.all_keys()) == []
+    assert asyncio.run(rag.chunk_docs.all_keys()) == []
+    assert len(rag.entities_vdb._client) == 0
+    assert len(rag.relationships_vdb._client) == 0
+    assert len(rag.chunks_vdb._client) == 0
+
+
+def test_update_only_extracts_the_changed_chunks(tmp_path, extracted):
+    rag = _rag(tmp_path, extracted)
+    updated = "REL ALICE BOB shared\n\nREL BOB CAROL one\n\nREL HANK IVY new"
+
+    async def run():
+        await rag.ainsert([DOC_1, DOC_2])
+        extracted.clear()
+        return await rag.aupdate_doc(compute_mdhash_id(DOC_1, prefix="doc-"), updated)
+
+    new_doc_id = asyncio.run(run())
+    assert new_doc_id == compute_mdhash_id(updated, prefix="doc-")
+    assert extracted == ["REL HANK IVY new"]
+    nodes, edges = _graph(rag)
+    assert "DAN" not in nodes and "ERIN" not in nodes
+    assert ("HANK", "IVY") in edges and ("BOB", "CAROL") in edges
+    assert sorted(asyncio.run(rag.full_docs.all_keys())) == sorted(
+        [compute_mdhash_id(DOC_2, prefix="doc-"), new_doc_id]
+    )
+
+
+def test_documents_stored_before_the_index_are_indexed_once(tmp_path, extracted):
+    rag = _rag(tmp_path, extracted)
+    shared = _chunk_id("REL ALICE BOB shared")
+
+    async def store_without_index():
+        await rag.ainsert([DOC_1, DOC_2])
+        await rag.doc_chunks.drop()
+        await rag.chunk_docs.drop()
+        await rag._insert_done()
+
+    asyncio.run(store_without_index())
+
+    rag = _rag(tmp_path, extracted)
+    asyncio.run(rag.adelete_by_doc(compute_mdhash_id(DOC_1, prefix="doc-")))
+    assert asyncio.run(rag.full_docs.all_keys()) == [
+        compute_mdhash_id(DOC_2, prefix="doc-")
+    ]
+    assert asyncio.run(rag.text_chunks.get_by_id(shared)) is not None
+    assert _graph(rag)[1] == [("ALICE", "BOB"), ("FRANK", "GINA")]
+    assert asyncio.run(rag.doc_chunks.get_by_id(DOC_INDEX_MARKER)) is not None
+
+    # a later process trusts the marker instead of scanning the chunks again
+    rag = _rag(tmp_path, extracted)
+
+    async def no_scan():
+        raise AssertionError("the document index was rebuilt")
+
+    rag.text_chunks.all_keys = no_scan
+    asyncio.run(rag.adelete_by_doc(compute_mdhash_id(DOC_2, prefix="doc-")))
+    assert _graph(rag) == ([], [])
@@ -0,0 +1,127 @@
+import asyncio
+
+import numpy as np
+
+from lightrag.storage import EmbeddingCache
+from lightrag.utils import EmbeddingFunc, priority_scope
+
+DIM = 4
+
+
+def _cache(working_dir, calls: list, **limits) -> EmbeddingCache:
+    async def embed(texts: list[str]) -> np.ndarray:
+        calls.extend(texts)
+        return np.array([_vector(t) for t in texts], dtype=np.float32)
+
+    return EmbeddingCache(
+        namespace="embedding_cache",
+        global_config={"working_dir": str(working_dir)},
+        embedding_func=EmbeddingFunc(
+            embedding_dim=DIM, max_token_size=8192, func=embed
+        ),
+        model_name="test-model",
+        **limits,
+    )
+
+
+def _vector(text: str) -> list[float]:
+    return [len(text), ord(text[0]), ord(text[-1]), 1.0]
+
+
+@priority_scope("extraction")
+async def _insert_embed(cache: EmbeddingCache, texts: list[str]) -> np.ndarray:
+    return await cache.embed(texts)
+
+
+def test_embedding_cache_serves_repeated_texts(tmp_path):
+    calls = []
+    cache = _cache(tmp_path, calls)
+
+    async def run():
+        first = await _insert_embed(cache, ["alpha", "beta"])
+        second = await _insert_embed(cache, ["beta", "gamma", "alpha"])
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert calls == ["alpha", "beta", "gamma"]
+    assert first.tolist() == [_vector("alpha"), _vector("beta")]
+    assert second.tolist() == [_vector("beta"), _vector("gamma"), _vector("alpha")]
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_embedding_cache_does_not_store_query_embeddings(tmp_path):
+    calls = []
+    cache = _cache(tmp_path, calls)
+
+    async def run():
+        await _insert_embed(cache, ["document"])
+        # a query is served from the cache but not added to it
+        await cache.embed(["document", "question"])
+        await cache.embed(["question"])
+
+    asyncio.run(run())
+    assert calls == ["document", "question", "question"]
+    assert len(cache) == 1
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    calls = []
+    cache = _cache(tmp_path, calls, max_entries=2)
+
+    async def run():
+        await _insert_embed(cache, ["a", "b"])
+        await _insert_embed(cache, ["a"])
+        await _insert_embed(cache, ["c"])
+        calls.clear()
+        await _insert_embed(cache, ["a", "c", "b"])
+
+    asyncio.run(run())
+    assert calls == ["b"]
+    assert len(cache) == 2
+
+
+def test_embedding_cache_max_bytes_counts_rows(tmp_path):
+    cache = _cache(tmp_path, [], max_bytes=3 * (16 + 4 * DIM))
+    asyncio.run(_insert_embed(cache, [f"text {i}" for i in range(5)]))
+    assert len(cache) == 3
+
+
+def test_embedding_cache_reloads_saved_vectors(tmp_path):
+    cache = _cache(tmp_path, [])
+
+    async def run():
+        await _insert_embed(cache, ["alpha", "beta"])
+        await cache.index_done_callback()
+        await _insert_embed(cache, ["gamma"])
+        await cache.index_done_callback()
+
+    asyncio.run(run())
+    calls = []
+    reopened = _cache(tmp_path, calls)
+    vectors = asyncio.run(reopened.embed(["gamma", "alpha", "beta"]))
+    assert calls == []
+    assert vectors.tolist() == [_vector("gamma"), _vector("alpha"), _vector("beta")]
+
+
+def test_embedding_cache_rewrites_a_generation_once_half_is_dropped(tmp_path):
+    cache = _cache(tmp_path, [], max_entries=4)
+    texts = [f"text {i}" for i in range(6)]
+
+    async def run():
+        await _insert_embed(cache, texts[:4])
+        await cache.index_done_callback()
+        await _insert_embed(cache, texts[4:])
+        await cache.index_done_callback()
+
+    asyncio.run(run())
+    files = sorted(p.name for p in tmp_path.iterdir())
+    assert files == [
+        "embedding_cache_4d.1.f32",
+        "embedding_cache_4d.1.keys",
+        "embedding_cache_4d.json",
+    ]
+    calls = []
+    reopened = _cache(tmp_path, calls, max_entries=4)
+    vectors = asyncio.run(reopened.embed(texts[2:]))
+    assert calls == []
+    assert vectors.tolist() == [_vector(t) for t in texts[2:]]
@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import networkx as nx
+
+from lightrag.prompt import GRAPH_FIELD_SEP
+from lightrag.storage import NetworkXStorage
+
+
+def _storage(working_dir) -> NetworkXStorage:
+    return NetworkXStorage(
+        namespace="chunk_entity_relation",
+        global_config={"working_dir": str(working_dir)},
+    )
+
+
+def _sample_graph() -> nx.Graph:
+    graph = nx.Graph()
+    graph.add_node(
+        '"ALICE"', entity_type='"PERSON"', description="Ålice <SEP> ✓", source_id="c1"
+    )
+    graph.add_node('"BOB"', entity_type='"PERSON"', rank=3, score=0.5, seen=True)
+    # a column mixing types is stored as JSON
+    graph.add_node('"CAROL"', rank="high")
+    graph.add_edge('"ALICE"', '"BOB"', weight=2.0, keywords="kw", source_id="c1")
+    graph.add_edge('"BOB"', '"CAROL"', weight=1, order=[1, 2])
+    return graph
+
+
+def _assert_same_graph(loaded: nx.Graph, graph: nx.Graph):
+    assert dict(loaded.nodes(data=True)) == dict(graph.nodes(data=True))
+    assert {frozenset((s, t)): d for s, t, d in loaded.edges(data=True)} == {
+        frozenset((s, t)): d for s, t, d in graph.edges(data=True)
+    }
+
+
+def test_snapshot_round_trip(tmp_path):
+    graph = _sample_graph()
+    file_name = str(tmp_path / "graph.npz")
+    NetworkXStorage.write_nx_graph(graph, file_name)
+    loaded = NetworkXStorage.load_nx_graph(file_name)
+    assert not loaded.is_directed()
+    _assert_same_graph(loaded, graph)
+
+
+def test_graphml_migrates_to_the_snapshot(tmp_path):
+    async def run():
+        graph = nx.Graph()
+        graph.add_edge('"ALICE"', '"BOB"', weight=2.0, keywords="kw")
+        nx.write_graphml(graph, tmp_path / "graph_chunk_entity_relation.graphml")
+        storage = _storage(tmp_path)
+        assert await storage.has_edge('"ALICE"', '"BOB"')
+        await storage.upsert_node('"DAN"', {"description": "new"})
+        await storage.index_done_callback()
+        assert os.path.exists(tmp_path / "graph_chunk_entity_relation.npz")
+
+        reopened = _storage(tmp_path)
+        assert await reopened.get_node('"DAN"') == {"description": "new"}
+        assert (await reopened.get_edge('"ALICE"', '"BOB"'))["keywords"] == "kw"
+
+    asyncio.run(run())
+
+
+def test_export_graphml_follows_the_snapshot(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert_node('"ALICE"', {"description": "a"})
+        await storage.index_done_callback()
+        graphml_file = NetworkXStorage.export_graphml(str(tmp_path))
+        assert list(nx.read_graphml(graphml_file).nodes) == ['"ALICE"']
+
+        await storage.upsert_node('"BOB"', {"description": "b"})
+        await storage.index_done_callback()
+        # make sure the snapshot is the newer file even on coarse mtimes
+        stat = os.stat(graphml_file)
+        os.utime(graphml_file, (stat.st_atime, stat.st_mtime - 10))
+        graphml_file = NetworkXStorage.export_graphml(str(tmp_path))
+        assert sorted(nx.read_graphml(graphml_file).nodes) == ['"ALICE"', '"BOB"']
+
+    asyncio.run(run())
+
+
+def test_get_by_source_ids_matches_whole_chunk_ids(tmp_path):
+    storage = _storage(tmp_path)
+    sep = GRAPH_FIELD_SEP
+
+    async def run():
+        await storage.upsert_nodes(
+            {
+                '"A"': {"source_id": f"c1{sep}c2"},
+                '"B"': {"source_id": "c2"},
+                '"C"': {"source_id": "c11"},
+                '"D"': {},
+            }
+        )
+        await storage.upsert_edges(
+            {
+                ('"A"', '"B"'): {"source_id": "c2"},
+                ('"B"', '"C"'): {"source_id": f"c11{sep}c3"},
+                ('"C"', '"D"'): {"source_id": "c1"},
+            }
+        )
+        found = await storage.get_by_source_ids(["c1", "c3"])
+        await storage.delete_node('"C"')
+        return found, await storage.get_by_source_ids(["c1", "c3"])
+
+    (nodes, edges), (nodes_after, edges_after) = asyncio.run(run())
+    assert sorted(nodes) == ['"A"']
+    assert sorted(tuple(sorted(e)) for e in edges) == [('"B"', '"C"'), ('"C"', '"D"')]
+    assert nodes_after == ['"A"'] and edges_after == []
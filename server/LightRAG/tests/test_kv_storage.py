@@ -0,0 +1,291 @@
+import asyncio
+import json
+
+from lightrag import storage as storage_module
+from lightrag.storage import (
+    BoundedKVStorage,
+    JsonKVStorage,
+    JsonLogKVStorage,
+    SQLiteKVStorage,
+)
+
+
+def _storage(working_dir, **storage_kwargs) -> JsonLogKVStorage:
+    return JsonLogKVStorage(
+        namespace="text_chunks",
+        global_config={
+            "working_dir": str(working_dir),
+            "key_string_value_json_storage_cls_kwargs": storage_kwargs,
+        },
+        embedding_func=None,
+    )
+
+
+def _bounded(working_dir, **limits) -> BoundedKVStorage:
+    global_config = {"working_dir": str(working_dir)}
+    return BoundedKVStorage(
+        namespace="llm_response_cache",
+        global_config=global_config,
+        embedding_func=None,
+        inner=JsonKVStorage(
+            namespace="llm_response_cache",
+            global_config=global_config,
+            embedding_func=None,
+        ),
+        **limits,
+    )
+
+
+def _log_lines(working_dir) -> list[dict]:
+    with open(working_dir / "kv_store_text_chunks.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_json_log_replays_upserts_and_deletes(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert({"a": {"v": 1}, "b": {"v": 2}})
+        await storage.index_done_callback()
+        await storage.delete(["a"])
+        await storage.upsert({"c": {"v": 3}})
+        await storage.index_done_callback()
+        # only what changed since the last flush is appended
+        assert len(_log_lines(tmp_path)) == 4
+
+        reopened = _storage(tmp_path)
+        assert sorted(await reopened.all_keys()) == ["b", "c"]
+        assert await reopened.get_by_id("c") == {"v": 3}
+
+    asyncio.run(run())
+
+
+def test_json_log_skips_a_torn_last_line(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert({"a": {"v": 1}})
+        await storage.index_done_callback()
+        with open(tmp_path / "kv_store_text_chunks.jsonl", "a") as f:
+            f.write('{"k": "b", "v": {"v"')
+
+        reopened = _storage(tmp_path)
+        assert await reopened.all_keys() == ["a"]
+
+    asyncio.run(run())
+
+
+def test_json_log_compacts_superseded_records(tmp_path):
+    async def run():
+        # five keys written four times over, the last value winning
+        with open(tmp_path / "kv_store_text_chunks.jsonl", "w") as f:
+            for n in range(4):
+                for i in range(5):
+                    f.write(json.dumps({"k": f"k{i}", "v": {"v": n}}) + "\n")
+        storage = _storage(tmp_path, compaction_min_records=10)
+        await storage.index_done_callback()
+        await storage._compaction_task
+        assert _log_lines(tmp_path) == [{"k": f"k{i}", "v": {"v": 3}} for i in range(5)]
+
+        # writes after the compaction are appended to the new log
+        await storage.upsert({"new": {"v": 0}})
+        await storage.index_done_callback()
+        reopened = _storage(tmp_path)
+        assert sorted(await reopened.all_keys()) == [f"k{i}" for i in range(5)] + [
+            "new"
+        ]
+        assert await reopened.get_by_id("k0") == {"v": 3}
+
+    asyncio.run(run())
+
+
+def test_json_log_imports_the_legacy_json_file(tmp_path):
+    async def run():
+        with open(tmp_path / "kv_store_text_chunks.json", "w") as f:
+            json.dump({"a": {"v": 1}}, f)
+        storage = _storage(tmp_path)
+        assert await storage.get_by_id("a") == {"v": 1}
+        await storage.index_done_callback()
+
+        reopened = _storage(tmp_path)
+        assert await reopened.get_by_id("a") == {"v": 1}
+
+    asyncio.run(run())
+
+
+def _sqlite(working_dir, **storage_kwargs) -> SQLiteKVStorage:
+    return SQLiteKVStorage(
+        namespace="text_chunks",
+        global_config={
+            "working_dir": str(working_dir),
+            "key_string_value_json_storage_cls_kwargs": storage_kwargs,
+        },
+        embedding_func=None,
+    )
+
+
+def test_sqlite_kv_round_trip(tmp_path):
+    async def run():
+        storage = _sqlite(tmp_path, max_batch_size=2)
+        data = {f"k{i}": {"content": f"text {i}", "n": i} for i in range(5)}
+        assert await storage.upsert(data) == data
+        # existing keys are never overwritten
+        assert await storage.upsert({"k0": {"content": "new"}, "k5": {"n": 5}}) == {
+            "k5": {"n": 5}
+        }
+        await storage.index_done_callback()
+
+        reopened = _sqlite(tmp_path, max_batch_size=2)
+        assert await reopened.get_by_id("k0") == {"content": "text 0", "n": 0}
+        assert await reopened.get_by_id("missing") is None
+        assert await reopened.get_by_ids(["k4", "missing", "k1"], fields={"n"}) == [
+            {"n": 4},
+            None,
+            {"n": 1},
+        ]
+        assert sorted(await reopened.all_keys()) == [f"k{i}" for i in range(6)]
+
+    asyncio.run(run())
+
+
+def test_sqlite_kv_filter_keys_delete_and_drop(tmp_path):
+    async def run():
+        storage = _sqlite(tmp_path, max_batch_size=2)
+        # concurrent calls share the connection one at a time
+        await asyncio.gather(*[storage.upsert({f"k{i}": {"n": i}}) for i in range(6)])
+        keys = [f"k{i}" for i in range(8)]
+        assert await storage.filter_keys(keys) == {"k6", "k7"}
+
+        await storage.delete(["k1", "k3", "k9"])
+        assert await storage.filter_keys(keys) == {"k1", "k3", "k6", "k7"}
+
+        await storage.drop()
+        assert await storage.all_keys() == []
+        assert await storage.filter_keys(keys) == set(keys)
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_evicts_least_recently_used(tmp_path):
+    async def run():
+        cache = _bounded(tmp_path, max_entries=3)
+        await cache.upsert({k: {"return": k} for k in "abc"})
+        assert await cache.get_by_id("a") == {"return": "a"}
+        await cache.upsert({"d": {"return": "d"}})
+        # b was the least recently used once a was read
+        assert sorted(await cache.all_keys()) == ["a", "c", "d"]
+        assert await cache.inner.get_by_id("b") is None
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_batch_reads_count_as_use(tmp_path):
+    async def run():
+        cache = _bounded(tmp_path, max_entries=3)
+        await cache.upsert({k: {"return": k} for k in "abc"})
+        assert await cache.get_by_ids(["a", "x"]) == [{"return": "a"}, None]
+        await cache.upsert({"d": {"return": "d"}})
+        assert sorted(await cache.all_keys()) == ["a", "c", "d"]
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_saves_access_on_index_done_or_after_the_interval(
+    tmp_path, monkeypatch
+):
+    now = [1000.0]
+    monkeypatch.setattr(storage_module.time, "monotonic", lambda: now[0])
+    access_file = tmp_path / "kv_store_llm_response_cache_access.json"
+
+    async def run():
+        cache = _bounded(tmp_path, access_flush_interval=60)
+        await cache.upsert({"a": {"return": "a"}})
+        await cache.query_done_callback()
+        # the entry itself is saved right away, its access record is not
+        assert (tmp_path / "kv_store_llm_response_cache.json").exists()
+        assert not access_file.exists()
+        now[0] += 60
+        await cache.query_done_callback()
+        assert list(json.loads(access_file.read_text())) == ["a"]
+
+        await cache.upsert({"b": {"return": "b"}})
+        await cache.index_done_callback()
+        assert list(json.loads(access_file.read_text())) == ["a", "b"]
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_evicts_past_max_bytes(tmp_path):
+    async def run():
+        cache = _bounded(tmp_path, max_bytes=100)
+        await cache.upsert({"a": {"return": "x" * 60}})
+        await cache.upsert({"b": {"return": "y" * 60}})
+        assert await cache.all_keys() == ["b"]
+        assert cache.stats()["bytes"] <= 100
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_expires_entries_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(storage_module.time, "time", lambda: now[0])
+
+    async def run():
+        cache = _bounded(tmp_path, ttl=60)
+        await cache.upsert({"a": {"return": "a"}})
+        now[0] += 30
+        assert await cache.get_by_id("a") == {"return": "a"}
+        now[0] += 31
+        assert await cache.get_by_id("a") is None
+        # an expired entry can be written again
+        await cache.upsert({"a": {"return": "new"}})
+        assert await cache.get_by_id("a") == {"return": "new"}
+
+    asyncio.run(run())
+
+
+def test_bounded_kv_keeps_access_order_across_restarts(tmp_path):
+    async def run():
+        cache = _bounded(tmp_path, max_entries=3)
+        await cache.upsert({k: {"return": k} for k in "abc"})
+        await cache.get_by_id("a")
+        await cache.index_done_callback()
+
+        reopened = _bounded(tmp_path, max_entries=3)
+        await reopened.upsert({"d": {"return": "d"}})
+        assert sorted(await reopened.all_keys()) == ["a", "c", "d"]
+
+    asyncio.run(run())
+
+
+class _UnlistedKVStorage(JsonKVStorage):
+    async def all_keys(self) -> list[str]:
+        raise NotImplementedError
+
+
+def test_bounded_kv_tracks_entries_of_an_unlisted_storage_on_read(tmp_path):
+    async def run():
+        global_config = {"working_dir": str(tmp_path)}
+        inner = _UnlistedKVStorage(
+            namespace="llm_response_cache",
+            global_config=global_config,
+            embedding_func=None,
+        )
+        await inner.upsert({k: {"return": k} for k in "ab"})
+        cache = BoundedKVStorage(
+            namespace="llm_response_cache",
+            global_config=global_config,
+            embedding_func=None,
+            inner=inner,
+            max_entries=2,
+        )
+        # entries held before the cache started are adopted once read
+        assert await cache.get_by_id("a") == {"return": "a"}
+        assert await cache.filter_keys(["b", "x"]) == {"x"}
+        await cache.upsert({"c": {"return": "c"}})
+        assert await inner.get_by_id("a") is None
+        assert await inner.get_by_id("b") == {"return": "b"}
+        assert await inner.get_by_id("c") == {"return": "c"}
+
+    asyncio.run(run())
@@ -0,0 +1,275 @@
+import asyncio
+import multiprocessing
+import os
+import sys
+from hashlib import md5
+
+import numpy as np
+import pytest
+
+from lightrag.storage import MmapVectorDBStorage, _FileLock
+from lightrag.utils import EmbeddingFunc
+
+DIM = 32
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(
+        [
+            np.random.default_rng(
+                int.from_bytes(md5(t.encode()).digest()[:8], "little")
+            ).normal(size=DIM)
+            for t in texts
+        ]
+    )
+
+
+def _storage(working_dir, **storage_kwargs) -> MmapVectorDBStorage:
+    return MmapVectorDBStorage(
+        namespace="chunks",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 16,
+            "vector_db_storage_cls_kwargs": storage_kwargs,
+        },
+        embedding_func=EmbeddingFunc(
+            embedding_dim=DIM, max_token_size=100, func=_embed
+        ),
+        meta_fields={"source"},
+    )
+
+
+def _docs(ids) -> dict[str, dict]:
+    return {f"id{i}": {"content": f"text {i}", "source": f"s{i}"} for i in ids}
+
+
+async def _top_id(storage: MmapVectorDBStorage, i: int):
+    results = await storage.query(f"text {i}", top_k=1)
+    return results[0]["id"] if results else None
+
+
+def test_upsert_query_delete_and_reopen(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert(_docs(range(10)))
+        assert len(storage) == 10
+        results = await storage.query("text 3", top_k=1)
+        assert results[0]["id"] == "id3"
+        assert results[0]["source"] == "s3"
+
+        await storage.delete(["id3", "id4"])
+        assert len(storage) == 8
+        assert await _top_id(storage, 3) != "id3"
+        await storage.index_done_callback()
+
+        reopened = _storage(tmp_path)
+        assert len(reopened) == 8
+        assert await _top_id(reopened, 5) == "id5"
+        assert await _top_id(reopened, 4) != "id4"
+
+    asyncio.run(run())
+
+
+def test_deleted_rows_are_reused(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert(_docs(range(6)))
+        await storage.delete(["id1", "id2"])
+        await storage.upsert(_docs(range(6, 8)))
+        assert storage._n_rows == 6
+        assert len(storage) == 6
+        assert await _top_id(storage, 7) == "id7"
+
+    asyncio.run(run())
+
+
+def test_instances_see_each_others_writes(tmp_path):
+    async def run():
+        first = _storage(tmp_path)
+        second = _storage(tmp_path)
+        await first.upsert(_docs(range(5)))
+        await first.index_done_callback()
+        assert await _top_id(second, 2) == "id2"
+
+        # the second writer replays the first one's log before appending
+        await second.upsert(_docs(range(5, 10)))
+        await first.delete(["id0"])
+        await second.index_done_callback()
+        await first.index_done_callback()
+
+        reopened = _storage(tmp_path)
+        assert len(reopened) == 9
+        assert await _top_id(reopened, 7) == "id7"
+        assert await _top_id(reopened, 0) != "id0"
+
+    asyncio.run(run())
+
+
+def test_queries_read_the_header_only_after_a_write(tmp_path, monkeypatch):
+    from lightrag import storage as storage_module
+
+    reads = []
+    load_json = storage_module.load_json
+    monkeypatch.setattr(
+        storage_module,
+        "load_json",
+        lambda file_name: reads.append(file_name) or load_json(file_name),
+    )
+
+    async def run():
+        first = _storage(tmp_path)
+        second = _storage(tmp_path)
+        await first.upsert(_docs(range(5)))
+        await second.query("text 1", top_k=1)
+        reads.clear()
+        for i in range(3):
+            assert await _top_id(second, i) == f"id{i}"
+        assert reads == []
+
+        await first.delete(["id1"])
+        assert await _top_id(second, 1) != "id1"
+        assert set(reads) == {second._head_file_name}
+
+    asyncio.run(run())
+
+
+def test_compaction_rewrites_the_meta_log(tmp_path):
+    async def run():
+        storage = _storage(tmp_path, compaction_min_bytes=0)
+        await storage.upsert(_docs(range(20)))
+        await storage.index_done_callback()
+        assert storage._generation == 0
+
+        await storage.delete([f"id{i}" for i in range(15)])
+        await storage.index_done_callback()
+        assert storage._generation == 1
+        assert not os.path.exists(storage._log_file_name(0))
+
+        reopened = _storage(tmp_path)
+        assert len(reopened) == 5
+        assert await _top_id(reopened, 17) == "id17"
+
+    asyncio.run(run())
+
+
+def test_compaction_under_a_live_reader(tmp_path):
+    async def run():
+        writer = _storage(tmp_path, compaction_min_bytes=0)
+        reader = _storage(tmp_path)
+        await writer.upsert(_docs(range(20)))
+        await writer.index_done_callback()
+        assert await _top_id(reader, 3) == "id3"
+
+        await writer.delete([f"id{i}" for i in range(15)])
+        await writer.index_done_callback()
+        assert writer._generation == 1
+        # the reader still maps generation 0 and moves over on its next search
+        assert reader._generation == 0
+        assert await _top_id(reader, 17) == "id17"
+        assert reader._generation == 1
+        assert len(reader) == 5
+        assert await _top_id(reader, 3) != "id3"
+
+        await reader.upsert(_docs(range(20, 22)))
+        await reader.index_done_callback()
+        assert await _top_id(writer, 21) == "id21"
+
+    asyncio.run(run())
+
+
+def test_crash_during_compaction_keeps_the_old_generation(tmp_path, monkeypatch):
+    async def run():
+        storage = _storage(tmp_path, compaction_min_bytes=0)
+        await storage.upsert(_docs(range(20)))
+        await storage.delete([f"id{i}" for i in range(15)])
+
+        def killed(self):
+            raise OSError("killed before the header was written")
+
+        # the next generation is written, but the header never points at it
+        with monkeypatch.context() as patch:
+            patch.setattr(MmapVectorDBStorage, "_save_head", killed)
+            with pytest.raises(OSError):
+                await storage.index_done_callback()
+        assert os.path.exists(tmp_path / "vdb_chunks.meta.1.jsonl")
+
+        reopened = _storage(tmp_path, compaction_min_bytes=0)
+        assert reopened._generation == 0
+        assert len(reopened) == 5
+        assert await _top_id(reopened, 17) == "id17"
+
+        # the leftovers are overwritten by the next compaction
+        await reopened.index_done_callback()
+        assert reopened._generation == 1
+        assert not os.path.exists(tmp_path / "vdb_chunks.meta.0.jsonl")
+        again = _storage(tmp_path)
+        assert len(again) == 5
+        assert await _top_id(again, 19) == "id19"
+        assert await _top_id(again, 2) != "id2"
+
+    asyncio.run(run())
+
+
+def test_legacy_meta_json_is_imported(tmp_path):
+    async def run():
+        storage = _storage(tmp_path)
+        await storage.upsert(_docs(range(3)))
+        await storage.index_done_callback()
+        # an older layout: the whole meta table in one JSON sidecar
+        with open(tmp_path / "vdb_chunks.meta.json", "w") as f:
+            f.write(
+                '{"embedding_dim": %d, "ids": ["id0", null, "id2"], '
+                '"meta": [{"source": "s0"}, null, {"source": "s2"}]}' % DIM
+            )
+        for name in os.listdir(tmp_path):
+            if name.endswith(".jsonl") or ".rows." in name:
+                os.remove(tmp_path / name)
+        os.remove(tmp_path / "vdb_chunks.head.json")
+
+        reopened = _storage(tmp_path)
+        assert len(reopened) == 2
+        assert await _top_id(reopened, 2) == "id2"
+        assert not os.path.exists(tmp_path / "vdb_chunks.meta.json")
+
+    asyncio.run(run())
+
+
+def test_file_lock_is_shared_and_reentrant(tmp_path):
+    lock = _FileLock.get(str(tmp_path / "x.lock"))
+    assert _FileLock.get(os.path.join(str(tmp_path), ".", "x.lock")) is lock
+    with lock:
+        with lock:
+            assert lock._depth == 2
+    assert lock._depth == 0
+
+
+def _write_in_process(working_dir: str, start: int):
+    async def run():
+        storage = _storage(working_dir)
+        for i in range(start, start + 40, 4):
+            await storage.upsert(_docs(range(i, i + 4)))
+            await storage.index_done_callback()
+
+    asyncio.run(run())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs fork and flock")
+def test_concurrent_processes_keep_every_row(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_write_in_process, args=(str(tmp_path), start))
+        for start in (0, 100)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    async def run():
+        storage = _storage(tmp_path)
+        assert len(storage) == 80
+        for i in [0, 39, 100, 139]:
+            assert await _top_id(storage, i) == f"id{i}"
+
+    asyncio.run(run())
@@ -0,0 +1,67 @@
+import asyncio
+from hashlib import md5
+
+import numpy as np
+import pytest
+
+from lightrag.storage import NanoVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+DIM = 16
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(
+        [
+            np.random.default_rng(
+                int.from_bytes(md5(t.encode()).digest()[:8], "little")
+            ).normal(size=DIM)
+            for t in texts
+        ]
+    )
+
+
+def _storage(working_dir) -> NanoVectorDBStorage:
+    return NanoVectorDBStorage(
+        namespace="chunks",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 4,
+            "cosine_better_than_threshold": 0.0,
+        },
+        embedding_func=EmbeddingFunc(
+            embedding_dim=DIM, max_token_size=100, func=_embed
+        ),
+    )
+
+
+class _OtherClient:
+    """Client of a nano-vectordb version without the private storage dict"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def query(self, **kwargs):
+        return self._client.query(**kwargs)
+
+
+def _ranked(results: list[dict]) -> list[tuple[str, float]]:
+    return [(r["id"], round(float(r["distance"]), 5)) for r in results]
+
+
+@pytest.mark.parametrize("other_client", [False, True])
+def test_query_many_matches_query(tmp_path, other_client):
+    storage = _storage(tmp_path)
+    queries = [f"text {i}" for i in range(0, 20, 3)] + ["unrelated"]
+
+    async def run():
+        await storage.upsert({f"id{i}": {"content": f"text {i}"} for i in range(20)})
+        if other_client:
+            storage._client = _OtherClient(storage._client)
+        many = await storage.query_many(queries, top_k=5)
+        single = [await storage.query(q, top_k=5) for q in queries]
+        return many, single
+
+    many, single = asyncio.run(run())
+    assert [_ranked(r) for r in many] == [_ranked(r) for r in single]
+    assert many[0][0]["id"] == "id0"
@@ -0,0 +1,92 @@
+import asyncio
+import re
+
+from lightrag.kg.oracle_impl import (
+    MAX_IN_LIST_SIZE,
+    OracleDB,
+    OracleGraphStorage,
+    _batches,
+    _bind_in_list,
+)
+
+
+def test_batches_stay_within_the_in_list_limit():
+    values = list(range(2 * MAX_IN_LIST_SIZE + 1))
+    batches = _batches(values)
+    assert [len(b) for b in batches] == [MAX_IN_LIST_SIZE, MAX_IN_LIST_SIZE, 1]
+    assert [v for b in batches for v in b] == values
+    assert _batches([]) == []
+    assert _batches([1, 2, 3], size=2) == [[1, 2], [3]]
+
+
+def test_bind_in_list_names_one_variable_per_value():
+    assert _bind_in_list("n", ["a'b", "c"]) == (":n0,:n1", {"n0": "a'b", "n1": "c"})
+    assert _bind_in_list("s", []) == ("", {})
+
+
+class _FakeDB:
+    workspace = "test"
+
+    def __init__(self):
+        self.queries = []
+
+    async def query(self, sql, multirows=False, params=None):
+        self.queries.append((sql, params))
+        return [{"name": name, "entity_type": "PERSON"} for name in params.values()]
+
+
+def test_get_nodes_binds_every_batch():
+    storage = OracleGraphStorage(
+        namespace="chunk_entity_relation",
+        global_config={"embedding_batch_num": 16},
+    )
+    storage.db = _FakeDB()
+    node_ids = [f"N{i}" for i in range(MAX_IN_LIST_SIZE + 5)] + ["N0"]
+
+    nodes = asyncio.run(storage.get_nodes(node_ids))
+    assert [n["name"] for n in nodes] == node_ids
+    assert [len(params) for _, params in storage.db.queries] == [MAX_IN_LIST_SIZE, 5]
+    for sql, params in storage.db.queries:
+        # the names are bound, never inlined into the SQL text
+        assert "N1" not in sql
+        assert re.findall(r":(n\d+)", sql) == list(params)
+
+
+class _FakeConnection:
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    async def executemany(self, sql, rows):
+        self.calls.append(("executemany", len(rows)))
+
+    async def commit(self):
+        self.calls.append(("commit",))
+
+
+def test_executemany_commits_once_after_every_batch():
+    calls = []
+    db = OracleDB.__new__(OracleDB)
+    db.pool = type("Pool", (), {"acquire": lambda self: _FakeConnection(calls)})()
+
+    asyncio.run(db.executemany("INSERT", [{"id": i} for i in range(5)], batch_size=2))
+    assert calls == [
+        ("executemany", 2),
+        ("executemany", 2),
+        ("executemany", 1),
+        ("commit",),
+    ]
@@ -0,0 +1,98 @@
+import asyncio
+from hashlib import md5
+
+import numpy as np
+import pytest
+
+from lightrag.storage import MmapVectorDBStorage
+from lightrag.utils import EmbeddingFunc
+
+DIM = 64
+CENTERS = np.random.default_rng(0).normal(size=(40, DIM))
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    vectors = []
+    for t in texts:
+        seed = int.from_bytes(md5(t.encode()).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+        vectors.append(CENTERS[seed % len(CENTERS)] + rng.normal(size=DIM))
+    return np.stack(vectors)
+
+
+def _storage(working_dir, truncate_dim=None, **storage_kwargs) -> MmapVectorDBStorage:
+    return MmapVectorDBStorage(
+        namespace="chunks",
+        global_config={
+            "working_dir": str(working_dir),
+            "embedding_batch_num": 256,
+            "vector_db_storage_cls_kwargs": storage_kwargs,
+        },
+        embedding_func=EmbeddingFunc(
+            embedding_dim=DIM,
+            max_token_size=100,
+            func=_embed,
+            truncate_dim=truncate_dim,
+        ),
+    )
+
+
+DOCS = {f"id{i}": {"content": f"doc {i}"} for i in range(3000)}
+QUERIES = [f"query {i}" for i in range(100)]
+
+
+@pytest.mark.parametrize(
+    "settings, min_recall",
+    [
+        ({"quantization": "float16"}, 0.99),
+        ({"quantization": "int8"}, 0.95),
+        ({"quantization": "int8", "truncate_dim": 48}, 0.9),
+        ({"quantization": "int8", "ann_index": "ivf_flat", "ann_min_rows": 0}, 0.8),
+    ],
+)
+def test_first_pass_recall(tmp_path, settings, min_recall):
+    async def run():
+        storage = _storage(tmp_path, **settings)
+        await storage.upsert(DOCS)
+        await storage.delete([f"id{i}" for i in range(0, 3000, 10)])
+        assert await storage.measure_recall(QUERIES, top_k=10) >= min_recall
+        await storage.index_done_callback()
+
+        reopened = _storage(tmp_path, **settings)
+        assert await reopened.measure_recall(QUERIES, top_k=10) >= min_recall
+        results = await reopened.query("doc 7", top_k=1)
+        assert results[0]["id"] == "id7"
+
+    asyncio.run(run())
+
+
+def test_first_pass_catches_up_with_rows_written_without_it(tmp_path):
+    async def run():
+        quantized = _storage(tmp_path, quantization="int8")
+        await quantized.upsert(dict(list(DOCS.items())[:1000]))
+        await quantized.index_done_callback()
+
+        plain = _storage(tmp_path)
+        await plain.upsert(dict(list(DOCS.items())[1000:]))
+        await plain.delete(["id1"])
+        await plain.index_done_callback()
+
+        reopened = _storage(tmp_path, quantization="int8")
+        assert len(reopened) == 2999
+        assert await reopened.measure_recall(QUERIES, top_k=10) >= 0.95
+        assert (await reopened.query("doc 2500", top_k=1))[0]["id"] == "id2500"
+
+    asyncio.run(run())
+
+
+def test_first_pass_is_rebuilt_when_settings_change(tmp_path):
+    async def run():
+        storage = _storage(tmp_path, truncate_dim=32)
+        await storage.upsert(DOCS)
+        await storage.index_done_callback()
+
+        reopened = _storage(tmp_path, truncate_dim=32, quantization="int8")
+        assert await reopened.measure_recall(QUERIES, top_k=10) >= 0.85
+        assert (await reopened.query("doc 42", top_k=1))[0]["id"] == "id42"
+
+    asyncio.run(run())
@@ -0,0 +1,134 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from lightrag import utils as utils_module
+from lightrag.utils import (
+    RateLimiter,
+    RateLimitExceeded,
+    limit_async_func_call,
+    retry_after_seconds,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_request_bucket_paces_past_its_window(clock):
+    # 60 requests a minute in a 10s window: a burst of 10, then one a second
+    limiter = RateLimiter(requests_per_minute=60, window_seconds=10)
+    assert [limiter._reserve(0) for _ in range(10)] == [0.0] * 10
+    assert limiter._reserve(0) == pytest.approx(1.0)
+    assert limiter._reserve(0) == pytest.approx(2.0)
+    clock[0] += 2
+    assert limiter._reserve(0) == pytest.approx(1.0)
+
+
+def test_token_bucket_charges_estimated_tokens(clock):
+    limiter = RateLimiter(tokens_per_minute=600, window_seconds=10)
+    assert limiter._reserve(60) == 0.0
+    assert limiter._reserve(60) == pytest.approx(2.0)
+    clock[0] += 12
+    # a call larger than the bucket only waits for a full one
+    assert limiter._reserve(1000) == 0.0
+    assert limiter._reserve(10) == pytest.approx(1.0)
+
+
+def test_pause_holds_every_caller_back(clock):
+    limiter = RateLimiter(requests_per_minute=60, window_seconds=10)
+    limiter.pause(5)
+    assert limiter._reserve(0) == pytest.approx(5.0)
+    clock[0] += 5
+    # what was left in the bucket is forfeited, so only the 5s refill remains
+    assert [limiter._reserve(0) for _ in range(4)] == [0.0] * 4
+    assert limiter._reserve(0) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize(
+    "error, seconds",
+    [
+        (RateLimitExceeded("429", retry_after="2"), 2.0),
+        (RateLimitExceeded("429", retry_after=-3), 0.0),
+        (
+            SimpleNamespace(
+                response=SimpleNamespace(headers={"retry-after-ms": "1500"})
+            ),
+            1.5,
+        ),
+        (SimpleNamespace(headers={"retry-after": "7"}), 7.0),
+        (RateLimitExceeded("429", retry_after="soon"), None),
+        (RateLimitExceeded("429"), None),
+        (ValueError("not a rate limit"), None),
+    ],
+)
+def test_retry_after_seconds(error, seconds):
+    assert retry_after_seconds(error) == seconds
+
+
+def test_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    error = RateLimitExceeded("429", retry_after=format_datetime(when, usegmt=True))
+    assert 28 <= retry_after_seconds(error) <= 30
+
+
+def _flaky(failures: int, error: Exception):
+    calls = []
+
+    async def call(value):
+        calls.append(value)
+        if len(calls) <= failures:
+            raise error
+        return value
+
+    return call, calls
+
+
+def test_call_retries_after_retry_after():
+    limiter = RateLimiter(requests_per_minute=6000, max_retries=3)
+    func, calls = _flaky(2, RateLimitExceeded("429", retry_after=0))
+    assert asyncio.run(limiter.call(1, func, "ok")) == "ok"
+    assert len(calls) == 3
+
+
+def test_call_gives_up_after_max_retries():
+    limiter = RateLimiter(requests_per_minute=6000, max_retries=2)
+    func, calls = _flaky(10, RateLimitExceeded("429", retry_after=0))
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(limiter.call(1, func, "ok"))
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_other_errors():
+    limiter = RateLimiter(requests_per_minute=6000)
+    func, calls = _flaky(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.call(1, func, "ok"))
+    assert len(calls) == 1
+
+
+def test_waiting_call_gives_its_slot_back():
+    # one request per 0.1s, spent before the calls start
+    rate_limiter = RateLimiter(requests_per_minute=600, window_seconds=0.1)
+    finished = []
+
+    @limit_async_func_call(1)
+    async def call(name: str, throttled: bool):
+        if throttled:
+            await rate_limiter.acquire()
+        finished.append(name)
+
+    async def run():
+        await rate_limiter.acquire()
+        await asyncio.gather(call("throttled", True), call("free", False))
+
+    asyncio.run(run())
+    assert finished == ["free", "throttled"]
+    stats = call.limiter.stats()["query"]
+    assert (stats["running"], stats["waiting"]) == (0, 0)
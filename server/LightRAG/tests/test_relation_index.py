@@ -0,0 +1,110 @@
+import asyncio
+from hashlib import md5
+
+import numpy as np
+import pytest
+
+from lightrag.storage import (
+    MmapVectorDBStorage,
+    NanoVectorDBStorage,
+    _RelationIndex,
+)
+from lightrag.utils import EmbeddingFunc, compute_mdhash_id
+
+DIM = 8
+
+# (src, tgt) of every relation, "A" touches most of them
+RELATIONS = [("A", "B"), ("A", "C"), ("B", "C"), ("C", "D"), ("D", "A"), ("E", "F")]
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(
+        [np.frombuffer(md5(t.encode()).digest()[:DIM], dtype=np.uint8) for t in texts]
+    ).astype(np.float32)
+
+
+def _storage(storage_cls, working_dir):
+    return storage_cls(
+        namespace="relationships",
+        global_config={"working_dir": str(working_dir), "embedding_batch_num": 4},
+        embedding_func=EmbeddingFunc(
+            embedding_dim=DIM, max_token_size=100, func=_embed
+        ),
+        meta_fields={"src_id", "tgt_id"},
+    )
+
+
+def _relation_id(src: str, tgt: str) -> str:
+    return compute_mdhash_id(src + tgt, prefix="rel-")
+
+
+def _relations(pairs) -> dict[str, dict]:
+    return {
+        _relation_id(src, tgt): {
+            "content": f"{src} {tgt}",
+            "src_id": src,
+            "tgt_id": tgt,
+        }
+        for src, tgt in pairs
+    }
+
+
+def _scanned(storage) -> dict[str, list[str]]:
+    """The index a scan over every stored row builds"""
+    if isinstance(storage, NanoVectorDBStorage):
+        rows = storage.client_storage["data"]
+    else:
+        rows = [
+            {"__id__": record["k"], **record["m"]}
+            for record in storage._read_records(np.flatnonzero(storage._live))
+        ]
+    return _RelationIndex.from_rows(rows).to_dict()
+
+
+def test_relation_index_add_discard_and_pop():
+    index = _RelationIndex()
+    for src, tgt in RELATIONS:
+        index.add(_relation_id(src, tgt), src, tgt)
+    assert len(index) == len(RELATIONS)
+
+    index.discard([_relation_id("E", "F")])
+    assert "E" not in index.to_dict() and "F" not in index.to_dict()
+
+    assert index.pop(["A"]) == {
+        _relation_id(*pair) for pair in RELATIONS if "A" in pair
+    }
+    assert index.to_dict() == {
+        "B": [_relation_id("B", "C")],
+        "C": sorted([_relation_id("B", "C"), _relation_id("C", "D")]),
+        "D": [_relation_id("C", "D")],
+    }
+    assert _RelationIndex(index.to_dict()).to_dict() == index.to_dict()
+
+
+@pytest.mark.parametrize("storage_cls", [NanoVectorDBStorage, MmapVectorDBStorage])
+def test_relation_index_matches_a_scan(tmp_path, storage_cls):
+    storage = _storage(storage_cls, tmp_path)
+
+    async def run():
+        await storage.upsert(_relations(RELATIONS))
+        assert storage._relation_index.to_dict() == _scanned(storage)
+
+        await storage.delete([_relation_id("E", "F")])
+        assert storage._relation_index.to_dict() == _scanned(storage)
+
+        await storage.delete_entities(["A"])
+        assert storage._relation_index.to_dict() == _scanned(storage)
+        assert set(_scanned(storage)) == {"B", "C", "D"}
+
+        await storage.upsert(_relations([("A", "B"), ("F", "G")]))
+        await storage.delete_relation("C")
+        assert storage._relation_index.to_dict() == _scanned(storage)
+        await storage.index_done_callback()
+
+    asyncio.run(run())
+    reopened = _storage(storage_cls, tmp_path)
+    if storage_cls is MmapVectorDBStorage:
+        # built on the first write
+        reopened._ensure_index()
+    assert reopened._relation_index.to_dict() == _scanned(reopened)
+    assert set(_scanned(reopened)) == {"A", "B", "F", "G"}
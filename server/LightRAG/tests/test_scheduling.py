@@ -0,0 +1,358 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from lightrag.utils import (
+    PriorityLimiter,
+    batch_async_func_calls,
+    limit_async_func_call,
+    priority_scope,
+)
+
+
+def _recording_embed(calls: list, fail_on=None):
+    async def embed(texts: list[str]) -> np.ndarray:
+        calls.append(list(texts))
+        await asyncio.sleep(0.01)
+        if fail_on in texts:
+            raise ValueError(f"can't embed {fail_on}")
+        return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+    return embed
+
+
+def test_batch_merges_concurrent_calls():
+    calls = []
+    embed = batch_async_func_calls(8, max_wait_time=0.01)(_recording_embed(calls))
+
+    async def run():
+        return await asyncio.gather(
+            embed(["a", "bb"]), embed(["bb", "ccc"]), embed(["d"])
+        )
+
+    results = asyncio.run(run())
+    # duplicates across callers are embedded once
+    assert calls == [["a", "bb", "ccc", "d"]]
+    assert [r.tolist() for r in results] == [
+        [[1, 97], [2, 98]],
+        [[2, 98], [3, 99]],
+        [[1, 100]],
+    ]
+
+
+def test_batch_flushes_at_max_batch_size():
+    calls = []
+    embed = batch_async_func_calls(4, max_wait_time=10)(_recording_embed(calls))
+
+    async def run():
+        return await asyncio.gather(*[embed([f"t{i}"]) for i in range(8)])
+
+    results = asyncio.run(run())
+    assert sorted(len(c) for c in calls) == [4, 4]
+    assert [r[0, 1] for r in results] == [ord("t")] * 8
+
+
+def test_full_batches_and_keyword_calls_go_straight_through():
+    calls = []
+    embed = batch_async_func_calls(2)(_recording_embed(calls))
+
+    async def run():
+        await embed(["a", "b", "c"])
+
+    asyncio.run(run())
+    assert calls == [["a", "b", "c"]]
+
+
+def test_failed_batch_is_retried_per_caller():
+    calls = []
+    embed = batch_async_func_calls(8)(_recording_embed(calls, fail_on="bad"))
+
+    async def run():
+        return await asyncio.gather(
+            embed(["a"]), embed(["bad"]), embed(["b", "c"]), return_exceptions=True
+        )
+
+    ok, failed, ok_pair = asyncio.run(run())
+    assert isinstance(failed, ValueError)
+    assert ok.tolist() == [[1, 97]]
+    assert ok_pair.tolist() == [[1, 98], [1, 99]]
+    assert calls[0] == ["a", "bad", "b", "c"]
+    assert sorted(calls[1:]) == [["a"], ["b", "c"], ["bad"]]
+
+
+def test_list_results_are_sliced_per_caller():
+    async def upper(texts: list[str]) -> list[str]:
+        return [t.upper() for t in texts]
+
+    batched = batch_async_func_calls(8)(upper)
+
+    async def run():
+        return await asyncio.gather(batched(["a", "b"]), batched(["c"]))
+
+    assert asyncio.run(run()) == [["A", "B"], ["C"]]
+
+
+def test_cancelled_batch_resolves_its_callers():
+    async def slow(texts: list[str]):
+        await asyncio.sleep(10)
+
+    batched = batch_async_func_calls(8, max_wait_time=0.001)(slow)
+
+    async def run():
+        waiting = [asyncio.ensure_future(batched([str(i)])) for i in range(3)]
+        await asyncio.sleep(0.05)
+        for task in asyncio.all_tasks():
+            if task.get_coro().__name__ == "_run_batch":
+                task.cancel()
+        return await asyncio.wait_for(
+            asyncio.gather(*waiting, return_exceptions=True), 1
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_batch_runs_under_its_most_urgent_caller():
+    seen = []
+
+    async def embed(texts: list[str]) -> list[str]:
+        from lightrag.utils import current_priority
+
+        seen.append(current_priority())
+        return texts
+
+    batched = batch_async_func_calls(8)(embed)
+
+    @priority_scope("extraction")
+    async def extract():
+        return await batched(["x"])
+
+    @priority_scope("summary")
+    async def summarize():
+        return await batched(["y"])
+
+    async def run():
+        await asyncio.gather(extract(), summarize())
+
+    asyncio.run(run())
+    assert seen == ["summary"]
+
+
+def test_batch_state_is_kept_per_event_loop():
+    calls = []
+    embed = batch_async_func_calls(8)(_recording_embed(calls))
+    results = []
+
+    def in_thread(texts):
+        async def run():
+            return await asyncio.gather(*[embed([t]) for t in texts])
+
+        results.append(asyncio.run(run()))
+
+    threads = [
+        threading.Thread(target=in_thread, args=(texts,))
+        for texts in (["a", "b"], ["c", "d"])
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(sorted(c) for c in calls) == [["a", "b"], ["c", "d"]]
+    assert len(results) == 2
+
+
+@pytest.mark.parametrize("max_wait_time", [0, 0.001])
+def test_single_call_is_not_delayed_past_the_window(max_wait_time):
+    calls = []
+    embed = batch_async_func_calls(8, max_wait_time)(_recording_embed(calls))
+    assert asyncio.run(embed(["a"])).tolist() == [[1, 97]]
+
+
+async def _hold(limiter: PriorityLimiter, priority: str, order: list, tag: str):
+    await limiter.acquire(priority)
+    order.append(tag)
+    await asyncio.sleep(0.01)
+    limiter.release(priority)
+
+
+def test_limiter_serves_the_most_urgent_class_first():
+    limiter = PriorityLimiter(1)
+    order = []
+
+    async def run():
+        await limiter.acquire("extraction")
+        waiting = [
+            asyncio.ensure_future(_hold(limiter, p, order, f"{p}{i}"))
+            for i, p in enumerate(["extraction", "summary", "query", "extraction"])
+        ]
+        await asyncio.sleep(0)
+        limiter.release("extraction")
+        await asyncio.gather(*waiting)
+
+    asyncio.run(run())
+    assert order == ["query2", "summary1", "extraction0", "extraction3"]
+
+
+def test_limiter_class_cap_leaves_slots_for_other_classes():
+    limiter = PriorityLimiter(3, class_limits={"extraction": 1})
+    order = []
+
+    async def run():
+        await limiter.acquire("extraction")
+        extraction = asyncio.ensure_future(
+            _hold(limiter, "extraction", order, "extraction")
+        )
+        queries = [
+            asyncio.ensure_future(_hold(limiter, "query", order, f"query{i}"))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0)
+        # the capped class waits while the queries take the free slots
+        assert order == ["query0", "query1"]
+        assert limiter.stats()["extraction"]["waiting"] == 1
+        limiter.release("extraction")
+        await asyncio.gather(extraction, *queries)
+
+    asyncio.run(run())
+    assert order == ["query0", "query1", "extraction"]
+
+
+def test_limiter_skips_cancelled_waiters():
+    limiter = PriorityLimiter(1)
+    order = []
+
+    async def run():
+        await limiter.acquire("query")
+        cancelled = asyncio.ensure_future(_hold(limiter, "query", order, "cancelled"))
+        waiting = asyncio.ensure_future(_hold(limiter, "summary", order, "summary"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        limiter.release("query")
+        await waiting
+        assert limiter.stats()["query"]["running"] == 0
+        assert limiter.stats()["summary"]["running"] == 0
+
+    asyncio.run(run())
+    assert order == ["summary"]
+
+
+def test_limiter_keeps_slots_per_event_loop():
+    running = {}
+    peaks = {}
+
+    @limit_async_func_call(2)
+    async def work():
+        thread = threading.get_ident()
+        running[thread] = running.get(thread, 0) + 1
+        peaks[thread] = max(peaks.get(thread, 0), running[thread])
+        await asyncio.sleep(0.02)
+        running[thread] -= 1
+
+    def in_thread():
+        async def run():
+            await asyncio.gather(*[work() for _ in range(4)])
+
+        asyncio.run(run())
+
+    threads = [threading.Thread(target=in_thread) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    # max_size caps each loop, and every release wakes a waiter of its own loop
+    assert list(peaks.values()) == [2, 2]
+    assert work.limiter.stats()["query"]["calls"] == 8
+    assert work.limiter.stats()["query"]["running"] == 0
+
+
+def test_limited_call_runs_under_the_callers_priority():
+    @limit_async_func_call(1)
+    async def work():
+        await asyncio.sleep(0.01)
+
+    @priority_scope("extraction")
+    async def extract():
+        await work()
+
+    async def run():
+        await asyncio.gather(extract(), work(), extract())
+
+    asyncio.run(run())
+    stats = work.limiter.stats()
+    assert stats["extraction"]["calls"] == 2
+    assert stats["query"]["calls"] == 1
+    assert stats["extraction"]["max_wait"] > 0
+    assert all(s["running"] == 0 and s["waiting"] == 0 for s in stats.values())
+
+
+def test_unknown_priority_class_is_rejected():
+    with pytest.raises(ValueError):
+        priority_scope("background")
+
+
+def _streaming_func():
+    @limit_async_func_call(1)
+    async def stream_words(words: list[str]):
+        async def gen():
+            for word in words:
+                await asyncio.sleep(0)
+                yield word
+
+        return gen()
+
+    return stream_words
+
+
+def test_stream_holds_its_slot_until_exhausted():
+    stream_words = _streaming_func()
+
+    async def run():
+        stream = await stream_words(["a", "b"])
+        assert stream_words.limiter.stats()["query"]["running"] == 1
+        second = asyncio.ensure_future(stream_words(["c"]))
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        assert [w async for w in stream] == ["a", "b"]
+        return [w async for w in await second]
+
+    assert asyncio.run(run()) == ["c"]
+    assert stream_words.limiter.stats()["query"]["running"] == 0
+
+
+def test_closed_or_dropped_stream_releases_its_slot():
+    stream_words = _streaming_func()
+
+    async def run():
+        stream = await stream_words(["a", "b"])
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        assert stream_words.limiter.stats()["query"]["running"] == 0
+
+        stream = await stream_words(["a"])
+        del stream
+        await asyncio.sleep(0)
+        assert stream_words.limiter.stats()["query"]["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_failing_stream_releases_its_slot():
+    @limit_async_func_call(1)
+    async def broken():
+        async def gen():
+            yield "a"
+            raise RuntimeError("connection dropped")
+
+        return gen()
+
+    async def run():
+        stream = await broken()
+        with pytest.raises(RuntimeError):
+            async for _ in stream:
+                pass
+        assert broken.limiter.stats()["query"]["running"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,110 @@
+import asyncio
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from lightrag.base import QueryParam
+from lightrag.storage import SemanticQueryCache
+from lightrag.utils import EmbeddingFunc
+
+VECTORS = {
+    "who founded acme": [1.0, 0.0, 0.0],
+    "who was acme founded by": [0.99, 0.1, 0.0],
+    "what does acme sell": [0.0, 1.0, 0.0],
+}
+
+
+def _cache(working_dir, **kwargs) -> SemanticQueryCache:
+    async def embed(texts: list[str]) -> np.ndarray:
+        return np.array([VECTORS[t] for t in texts], dtype=np.float32)
+
+    return SemanticQueryCache(
+        namespace="query_answers",
+        global_config={"working_dir": str(working_dir)},
+        embedding_func=EmbeddingFunc(embedding_dim=3, max_token_size=8192, func=embed),
+        **kwargs,
+    )
+
+
+async def _answer(cache: SemanticQueryCache, query: str, param: QueryParam, answer):
+    response, embedding = await cache.lookup(query, param)
+    if response is None:
+        await cache.upsert(query, embedding, param, answer)
+    return response
+
+
+def test_similar_query_hits_and_different_query_misses(tmp_path):
+    cache = _cache(tmp_path)
+    param = QueryParam()
+
+    async def run():
+        await _answer(cache, "who founded acme", param, "Ada")
+        return (
+            await _answer(cache, "who was acme founded by", param, "other"),
+            await _answer(cache, "what does acme sell", param, "Anvils"),
+        )
+
+    assert asyncio.run(run()) == ("Ada", None)
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [
+        {"mode": "local"},
+        {"response_type": "Single Paragraph"},
+        {"top_k": 10},
+        {"only_need_context": True},
+        {"max_token_for_text_unit": 1000},
+        {"max_token_for_global_context": 1000},
+        {"max_token_for_local_context": 1000},
+    ],
+)
+def test_answers_are_scoped_by_query_param(tmp_path, changes):
+    cache = _cache(tmp_path)
+
+    async def run():
+        await _answer(cache, "who founded acme", QueryParam(), "Ada")
+        return await _answer(
+            cache, "who founded acme", replace(QueryParam(), **changes), "other"
+        )
+
+    assert asyncio.run(run()) is None
+
+
+def test_streaming_shares_the_cached_answer(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def run():
+        await _answer(cache, "who founded acme", QueryParam(), "Ada")
+        return await _answer(
+            cache, "who founded acme", QueryParam(stream=True), "other"
+        )
+
+    assert asyncio.run(run()) == "Ada"
+
+
+def test_invalidate_clears_every_instance(tmp_path):
+    cache = _cache(tmp_path)
+    other = _cache(tmp_path)
+
+    async def run():
+        await _answer(cache, "who founded acme", QueryParam(), "Ada")
+        await cache.index_done_callback()
+        hit = await _answer(other, "who founded acme", QueryParam(), "other")
+        await cache.invalidate()
+        return hit, (await other.lookup("who founded acme", QueryParam()))[0]
+
+    assert asyncio.run(run()) == ("Ada", None)
+    assert cache.index_version == 1
+
+
+def test_invalidate_keeps_answers_without_clear_on_change(tmp_path):
+    cache = _cache(tmp_path, clear_on_change=False)
+
+    async def run():
+        await _answer(cache, "who founded acme", QueryParam(), "Ada")
+        await cache.invalidate()
+        return (await cache.lookup("who founded acme", QueryParam()))[0]
+
+    assert asyncio.run(run()) == "Ada"
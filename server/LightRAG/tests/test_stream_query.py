@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import json
+import re
+
+import numpy as np
+import pytest
+
+import lightrag.lightrag as lightrag_module
+from lightrag.base import QueryParam
+from lightrag.lightrag import LightRAG
+from lightrag.utils import EmbeddingFunc, streaming_model_func
+
+ANSWER = ["Alice ", "knows ", "Bob."]
+
+
+async def _embed(texts: list[str]) -> np.ndarray:
+    return np.stack(
+        [
+            np.frombuffer(hashlib.md5(t.encode()).digest()[:8], dtype=np.uint8)
+            for t in texts
+        ]
+    ).astype(np.float32)
+
+
+async def _stream(chunks: list[str]):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+
+
+@pytest.fixture
+def rag(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        lightrag_module,
+        "chunking_by_token_size",
+        lambda content, **kwargs: [
+            {"tokens": 1, "content": content, "chunk_order_index": 0}
+        ],
+    )
+    calls = []
+
+    @streaming_model_func
+    async def llm(prompt, system_prompt=None, history_messages=[], **kwargs):
+        if kwargs.get("stream"):
+            calls.append("answer")
+            return _stream(ANSWER)
+        if "high-level and low-level keywords" in prompt:
+            calls.append("keywords")
+            return json.dumps(
+                {"high_level_keywords": ["friendship"], "low_level_keywords": ["ALICE"]}
+            )
+        calls.append("extract")
+        source, target = re.findall(r"REL (\w+) (\w+)", prompt)[-1]
+        return (
+            f'("entity"<|>"{source}"<|>"PERSON"<|>"{source} is a person")##'
+            f'("entity"<|>"{target}"<|>"PERSON"<|>"{target} is a person")##'
+            f'("relationship"<|>"{source}"<|>"{target}"<|>"{source} knows '
+            f'{target}"<|>"friendship"<|>1)<|COMPLETE|>'
+        )
+
+    rag = LightRAG(
+        working_dir=str(tmp_path),
+        llm_model_func=llm,
+        embedding_func=EmbeddingFunc(embedding_dim=8, max_token_size=100, func=_embed),
+        entity_extract_max_gleaning=0,
+        enable_llm_cache=False,
+        enable_semantic_cache=True,
+    )
+    asyncio.run(rag.ainsert("REL ALICE BOB"))
+    rag.calls = calls
+    return rag
+
+
+@pytest.mark.parametrize("mode", ["local", "global", "hybrid", "naive"])
+def test_stream_yields_chunks_and_caches_the_answer(rag, mode):
+    param = QueryParam(mode=mode, stream=True)
+
+    async def read(query: str) -> list[str]:
+        response = await rag.aquery(query, param)
+        assert hasattr(response, "__aiter__")
+        return [chunk async for chunk in response]
+
+    rag.calls.clear()
+    assert asyncio.run(read("Who does Alice know?")) == ANSWER
+    assert rag.calls[-1] == "answer"
+
+    # the complete answer is cached once the stream is read to the end
+    rag.calls.clear()
+    assert asyncio.run(read("Who does Alice know?")) == ["".join(ANSWER)]
+    assert rag.calls == []
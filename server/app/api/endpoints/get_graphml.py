@@ -7,6 +7,8 @@ from app.models.text_input import TextInput
 from fastapi.responses import FileResponse, StreamingResponse
 from app.models.text_analysis_output import TextAnalysisOutput
 from app.services.llm_response import openai_response
+from app.utils.light_rag import WORKING_DIR
+from lightrag.storage import NetworkXStorage
 
 router = APIRouter()
 
@@ -14,9 +16,12 @@ router = APIRouter()
 @router.get("/get_graphml")
 async def get_graphml():
     try:
-        file_path = f"/Users/joeyxiong/Desktop/parakeet/code/llama-clinic/server/files/graph_chunk_entity_relation.graphml"
+        # the graph is persisted as a binary snapshot, GraphML is generated on demand
+        file_path = await asyncio.to_thread(
+            NetworkXStorage.export_graphml, WORKING_DIR
+        )
 
-        if not os.path.exists(file_path):
+        if file_path is None or not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="File not found")
 
         return FileResponse(path=file_path, media_type="application/graphml+xml")
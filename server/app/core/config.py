@@ -58,6 +58,13 @@ class Settings(BaseSettings):
     )
     GROQ_API_KEY: str = Field(default_factory=lambda: os.getenv("GROQ_API_KEY", ""))
     REALTIME_API_KEY: str = Field(default_factory=lambda: os.getenv("REALTIME_API_KEY", ""))
+    # pooled HTTP clients shared by LLM and embedding calls
+    HTTP_MAX_CONNECTIONS: int = Field(
+        default_factory=lambda: int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    )
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(
+        default_factory=lambda: int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    )
     # STT
     DEEPGRAM_API_KEY: str = Field(default_factory=lambda: os.getenv("DG_API_KEY", ""))
 
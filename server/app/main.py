@@ -22,6 +22,7 @@ from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
+from lightrag.clients import http_clients
 import nltk
 
 try:
@@ -31,7 +32,18 @@ except LookupError:
 
 load_dotenv()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    http_clients.configure(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    yield
+    await http_clients.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 origins = [
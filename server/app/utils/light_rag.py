@@ -1,23 +1,82 @@
 import asyncio
 import json
 import os
+from typing import AsyncIterator, Union
 
 import aiohttp
 import numpy as np
 import textract
 from groq import Groq
 from lightrag import LightRAG, QueryParam
+from lightrag.clients import http_clients
 from lightrag.llm import (
     gpt_4o_complete,
     gpt_4o_mini_complete,
     openai_complete_if_cache,
     openai_embedding,
 )
-from lightrag.utils import EmbeddingFunc
+from lightrag.utils import (
+    EmbeddingFunc,
+    RateLimitExceeded,
+    compute_args_hash,
+    count_message_tokens,
+    streaming_model_func,
+)
 from app.core.config import settings
 
 
 WORKING_DIR = "/Users/joeyxiong/Desktop/parakeet/code/llama-clinic/server/files"
+AZURE_OPENAI_BASE_URL = "https://starmoonai.openai.azure.com"
+LLM_MODEL_NAME = "gpt-4o-mini"
+
+
+async def _post(endpoint: str, headers: dict, payload: dict) -> aiohttp.ClientResponse:
+    # one pooled session per key keeps connections to Azure alive across calls
+    session = http_clients.aiohttp_session(
+        "azure_openai", AZURE_OPENAI_BASE_URL, headers["api-key"]
+    )
+    response = await session.post(endpoint, headers=headers, json=payload)
+    try:
+        if response.status == 429:
+            raise RateLimitExceeded(
+                f"Rate limited: {await response.text()}",
+                retry_after=response.headers.get("retry-after"),
+            )
+        if response.status != 200:
+            raise ValueError(
+                f"Request failed with status {response.status}: {await response.text()}"
+            )
+    except BaseException:
+        # hand the connection back to the pool
+        response.release()
+        raise
+    return response
+
+
+async def _post_json(endpoint: str, headers: dict, payload: dict) -> dict:
+    async with await _post(endpoint, headers, payload) as response:
+        return await response.json()
+
+
+async def _stream_chat(
+    response: aiohttp.ClientResponse, hashing_kv, args_hash: str
+) -> AsyncIterator[str]:
+    """Yield the content deltas of a server-sent chat completion stream and
+    cache the full answer once it is complete"""
+    chunks = []
+    async with response:
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            choices = json.loads(line[len("data: ") :])["choices"]
+            if choices and choices[0]["delta"].get("content"):
+                chunks.append(choices[0]["delta"]["content"])
+                yield chunks[-1]
+    if hashing_kv is not None:
+        await hashing_kv.upsert(
+            {args_hash: {"return": "".join(chunks), "model": LLM_MODEL_NAME}}
+        )
 
 
 # async def llm_model_func(
@@ -35,14 +94,15 @@ WORKING_DIR = "/Users/joeyxiong/Desktop/parakeet/code/llama-clinic/server/files"
 #     )
 
 
+@streaming_model_func
 async def llm_model_func(
     prompt, system_prompt=None, history_messages=[], **kwargs
-) -> str:
+) -> Union[str, AsyncIterator[str]]:
     headers = {
         "Content-Type": "application/json",
         "api-key": settings.REALTIME_API_KEY,
     }
-    endpoint = "https://starmoonai.openai.azure.com/openai/deployments/gpt-4o-mini/chat/completions?api-version=2024-08-01-preview"
+    endpoint = f"{AZURE_OPENAI_BASE_URL}/openai/deployments/{LLM_MODEL_NAME}/chat/completions?api-version=2024-08-01-preview"
 
     messages = []
     if system_prompt:
@@ -51,21 +111,43 @@ async def llm_model_func(
         messages.extend(history_messages)
     messages.append({"role": "user", "content": prompt})
 
+    hashing_kv = kwargs.get("hashing_kv")
+    args_hash = compute_args_hash(LLM_MODEL_NAME, messages)
+    if hashing_kv is not None:
+        if_cache_return = await hashing_kv.get_by_id(args_hash)
+        if if_cache_return is not None:
+            return if_cache_return["return"]
+
+    stream = kwargs.get("stream", False)
     payload = {
         "messages": messages,
         "temperature": kwargs.get("temperature", 0),
         "top_p": kwargs.get("top_p", 1),
         "n": kwargs.get("n", 1),
+        "stream": stream,
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(endpoint, headers=headers, json=payload) as response:
-            if response.status != 200:
-                raise ValueError(
-                    f"Request failed with status {response.status}: {await response.text()}"
-                )
-            result = await response.json()
-            return result["choices"][0]["message"]["content"]
+    post = _post if stream else _post_json
+    rate_limiter = kwargs.get("rate_limiter")
+    if rate_limiter is not None:
+        result = await rate_limiter.call(
+            count_message_tokens(messages, kwargs.get("max_tokens")),
+            post,
+            endpoint,
+            headers,
+            payload,
+        )
+    else:
+        result = await post(endpoint, headers, payload)
+    if stream:
+        return _stream_chat(result, hashing_kv, args_hash)
+
+    content = result["choices"][0]["message"]["content"]
+    if hashing_kv is not None:
+        await hashing_kv.upsert(
+            {args_hash: {"return": content, "model": LLM_MODEL_NAME}}
+        )
+    return content
 
 
 async def embedding_func(texts: list[str]) -> np.ndarray:
@@ -73,19 +155,13 @@ async def embedding_func(texts: list[str]) -> np.ndarray:
         "Content-Type": "application/json",
         "api-key": settings.REALTIME_API_KEY,
     }
-    endpoint = "https://starmoonai.openai.azure.com/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15"
+    endpoint = f"{AZURE_OPENAI_BASE_URL}/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15"
 
     payload = {"input": texts}
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(endpoint, headers=headers, json=payload) as response:
-            if response.status != 200:
-                raise ValueError(
-                    f"Request failed with status {response.status}: {await response.text()}"
-                )
-            result = await response.json()
-            embeddings = [item["embedding"] for item in result["data"]]
-            return np.array(embeddings)
+    result = await _post_json(endpoint, headers, payload)
+    embeddings = [item["embedding"] for item in result["data"]]
+    return np.array(embeddings)
 
 
 def light_rag_instance():
@@ -97,5 +173,6 @@ def light_rag_instance():
             max_token_size=8192,
             func=embedding_func,
         ),
+        embedding_model_name="text-embedding-3-large",
     )
     return rag